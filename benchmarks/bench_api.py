@@ -0,0 +1,117 @@
+"""
+Load test for the editing pipeline against the local AI stand-in
+(AI_BACKEND=local, services/ai_local.py): throughput and latency percentiles
+of our own code, independent of Google's latency and quotas.
+
+In-process (calls handle_prompt directly):
+
+    python -m benchmarks.bench_api --requests 40 --concurrency 8
+
+Against a running server (start it with AI_BACKEND=local):
+
+    python -m benchmarks.bench_api --url http://127.0.0.1:8000 --requests 40 --concurrency 8
+
+AI_LOCAL_LATENCY_MS, AI_LOCAL_FAILURE_RATE etc. shape the simulated API.
+"""
+import argparse
+import json
+import os
+import time
+import urllib.request
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+os.environ.setdefault("AI_BACKEND", "local")
+
+from benchmarks.fixtures import make_clip
+
+PROMPTS = [
+    "trim the first 2 seconds",
+    "remove silence",
+    "make it vertical for shorts",
+    "add captions",
+    "make it 1.5x faster",
+    "extract audio as mp3",
+]
+
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def run_local(clip, prompt, out_dir):
+    from services.prompt import handle_prompt
+    output = os.path.join(out_dir, f"load_{uuid.uuid4().hex[:8]}.mp4")
+    result = handle_prompt(prompt, clip, output)
+    if isinstance(result, str) and os.path.exists(result):
+        os.remove(result)
+
+
+def run_http(url, clip, prompt):
+    boundary = uuid.uuid4().hex
+    with open(clip, "rb") as f:
+        video = f.read()
+    body = (
+        f"--{boundary}\r\nContent-Disposition: form-data; name=\"prompt\"\r\n\r\n{prompt}\r\n"
+        f"--{boundary}\r\nContent-Disposition: form-data; name=\"video\"; filename=\"{os.path.basename(clip)}\"\r\n"
+        f"Content-Type: video/mp4\r\n\r\n"
+    ).encode("utf-8") + video + f"\r\n--{boundary}--\r\n".encode("utf-8")
+    request = urllib.request.Request(
+        f"{url.rstrip('/')}/process-video/",
+        data=body,
+        headers={"Content-Type": f"multipart/form-data; boundary={boundary}"},
+    )
+    with urllib.request.urlopen(request, timeout=600) as response:
+        data = json.loads(response.read())
+    if "error" in data:
+        raise Exception(data["error"])
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--url", default=None, help="Base URL of a running server; in-process if omitted.")
+    parser.add_argument("--requests", type=int, default=24)
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--duration", type=int, default=10)
+    args = parser.parse_args()
+
+    clip = make_clip(f"load_{args.duration}s", 1280, 720, args.duration, silence_every=4)
+    out_dir = os.path.join(os.path.dirname(clip), "out")
+    os.makedirs(out_dir, exist_ok=True)
+
+    def one(i):
+        prompt = PROMPTS[i % len(PROMPTS)]
+        start = time.perf_counter()
+        try:
+            if args.url:
+                run_http(args.url, clip, prompt)
+            else:
+                run_local(clip, prompt, out_dir)
+            error = None
+        except Exception as e:
+            error = str(e)
+        return prompt, time.perf_counter() - start, error
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        results = list(pool.map(one, range(args.requests)))
+    wall = time.perf_counter() - start
+
+    latencies = [elapsed for _, elapsed, error in results if error is None]
+    errors = [(prompt, error) for prompt, _, error in results if error is not None]
+
+    print(f"requests    {args.requests} ({args.concurrency} concurrent)")
+    print(f"throughput  {len(latencies) / wall:.2f} req/s")
+    for pct in (50, 95, 99):
+        print(f"p{pct:<10} {percentile(latencies, pct):.2f}s")
+    print(f"errors      {len(errors)}")
+    for prompt, error in errors[:5]:
+        print(f"  {prompt!r}: {error}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,48 @@
+"""
+Compares encode tiers (services/encoding.py) on fixture clips: wall time and
+output size per tier for a representative re-encoding operation.
+
+    python -m benchmarks.bench_encode_tiers
+"""
+import argparse
+import os
+import time
+
+from benchmarks.fixtures import make_clip
+from services.encoding import PROFILE_ORDER
+from services.video import resize_to_vertical, adjust_speed
+
+OPERATIONS = {
+    "resize_vertical": resize_to_vertical,
+    "speed_1.5x": lambda i, o, profile=None: adjust_speed(i, o, speed=1.5, profile=profile),
+}
+
+FIXTURES = [
+    ("tiers_720p_15s", 1280, 720, 15),
+    ("tiers_1080p_15s", 1920, 1080, 15),
+]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--op", choices=sorted(OPERATIONS), default="resize_vertical")
+    args = parser.parse_args()
+
+    op = OPERATIONS[args.op]
+    print(f"{'clip':<18} {'tier':<10} {'seconds':>9} {'size MB':>9}")
+    for name, width, height, duration in FIXTURES:
+        clip = make_clip(name, width, height, duration)
+        out_dir = os.path.join(os.path.dirname(clip), "out")
+        os.makedirs(out_dir, exist_ok=True)
+        for tier in PROFILE_ORDER:
+            output = os.path.join(out_dir, f"{name}_{tier}.mp4")
+            start = time.perf_counter()
+            op(clip, output, profile=tier)
+            elapsed = time.perf_counter() - start
+            size_mb = os.path.getsize(output) / (1024 * 1024)
+            print(f"{name:<18} {tier:<10} {elapsed:>9.2f} {size_mb:>9.2f}")
+            os.remove(output)
+
+
+if __name__ == "__main__":
+    main()
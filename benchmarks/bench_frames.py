@@ -0,0 +1,59 @@
+"""
+Scaling benchmark for the parallel frame engine (services/frames.py).
+
+Runs the heal watermark pass (or rembg background removal) on a fixture clip
+with 1, 2, 4 ... N worker threads and reports wall time, frames/sec and
+speedup over a single worker.
+
+    python -m benchmarks.bench_frames --op heal --duration 10
+"""
+import argparse
+import os
+import time
+
+from benchmarks.fixtures import make_clip
+from services.video import remove_watermark, remove_background
+
+
+def worker_counts(max_workers):
+    counts = []
+    n = 1
+    while n < max_workers:
+        counts.append(n)
+        n *= 2
+    counts.append(max_workers)
+    return counts
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--op", choices=["heal", "background"], default="heal")
+    parser.add_argument("--duration", type=int, default=10)
+    parser.add_argument("--width", type=int, default=1280)
+    parser.add_argument("--height", type=int, default=720)
+    parser.add_argument("--max-workers", type=int, default=os.cpu_count() or 1)
+    args = parser.parse_args()
+
+    fps = 30
+    clip = make_clip(f"frames_{args.width}x{args.height}_{args.duration}s", args.width, args.height, args.duration, fps)
+    total_frames = args.duration * fps
+    out_dir = os.path.join(os.path.dirname(clip), "out")
+    os.makedirs(out_dir, exist_ok=True)
+
+    print(f"{'workers':>8} {'seconds':>10} {'fps':>10} {'speedup':>8}")
+    baseline = None
+    for workers in worker_counts(args.max_workers):
+        output = os.path.join(out_dir, f"bench_{args.op}_{workers}.mp4")
+        start = time.perf_counter()
+        if args.op == "heal":
+            remove_watermark(clip, output, location="bottom_right", strategy="heal", workers=workers)
+        else:
+            remove_background(clip, output, workers=workers)
+        elapsed = time.perf_counter() - start
+        baseline = baseline or elapsed
+        print(f"{workers:>8} {elapsed:>10.2f} {total_frames / elapsed:>10.1f} {baseline / elapsed:>7.2f}x")
+        os.remove(output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,50 @@
+"""
+Synthetic fixture clips built from FFmpeg lavfi sources, so benchmarks never
+depend on real user media.
+"""
+import os
+import subprocess
+
+FIXTURE_DIR = os.path.join(os.path.dirname(__file__), "media")
+
+
+def make_clip(name, width=1280, height=720, duration=10, fps=30, logo=True, silence_every=0):
+    """
+    Renders (or reuses) a test clip under benchmarks/media/.
+
+    - logo: burns a static box + label into the bottom-right corner, a stand-in
+      for a watermark.
+    - silence_every: if > 0, the tone is muted for the second half of every
+      `silence_every`-second window, giving silencedetect something to find.
+    """
+    os.makedirs(FIXTURE_DIR, exist_ok=True)
+    path = os.path.join(FIXTURE_DIR, f"{name}.mp4")
+    if os.path.exists(path):
+        return path
+
+    video_filters = []
+    if logo:
+        box_w, box_h = width // 7, height // 12
+        video_filters.append(
+            f"drawbox=x={width - box_w - 10}:y={height - box_h - 10}:w={box_w}:h={box_h}:color=white@0.8:t=fill"
+        )
+    video_src = f"testsrc2=size={width}x{height}:rate={fps}:duration={duration}"
+    if video_filters:
+        video_src += "," + ",".join(video_filters)
+
+    audio_src = f"sine=frequency=440:sample_rate=48000:duration={duration}"
+    if silence_every > 0:
+        half = silence_every / 2
+        audio_src += f",volume='if(gte(mod(t,{silence_every}),{half}),0,1)':eval=frame"
+
+    command = [
+        "ffmpeg", "-y", "-nostdin", "-hide_banner", "-loglevel", "error",
+        "-f", "lavfi", "-i", video_src,
+        "-f", "lavfi", "-i", audio_src,
+        "-c:v", "libx264", "-preset", "veryfast", "-pix_fmt", "yuv420p", "-g", str(fps * 2),
+        "-c:a", "aac", "-b:a", "128k",
+        "-shortest",
+        path
+    ]
+    subprocess.run(command, check=True)
+    return path
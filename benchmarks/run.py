@@ -0,0 +1,222 @@
+"""
+End-to-end benchmark suite: every editing operation and a few common
+multi-op plans, run on synthetic fixture clips. Each case runs in its own
+child process and records wall time, CPU time (including FFmpeg children),
+peak RSS and output size. Runs are appended to benchmarks/results/history.jsonl
+and compared against a saved baseline.
+
+    python -m benchmarks.run                      # quick suite, compare to baseline
+    python -m benchmarks.run --suite full --save-baseline
+    python -m benchmarks.run --only remove_silence --threshold 0.05
+
+AI-backed steps use the local stand-in (AI_BACKEND=local) so results measure
+our own code. The exit status is 1 when any case regresses past --threshold.
+"""
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+from datetime import datetime
+from functools import partial
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+os.environ.setdefault("AI_BACKEND", "local")
+os.environ.setdefault("TRANSCRIBE_BACKEND", "gemini")
+
+from benchmarks.fixtures import make_clip
+
+RESULTS_DIR = os.path.join(os.path.dirname(__file__), "results")
+HISTORY_FILE = os.path.join(RESULTS_DIR, "history.jsonl")
+BASELINE_FILE = os.path.join(RESULTS_DIR, "baseline.json")
+
+# name -> (width, height, duration, logo, silence_every)
+FIXTURES = {
+    "720p_20s_logo": (1280, 720, 20, True, 0),
+    "1080p_30s_dense_silence": (1920, 1080, 30, True, 2),
+    "480p_90s_sparse_silence": (854, 480, 90, False, 12),
+}
+SUITES = {
+    "quick": ["720p_20s_logo"],
+    "full": list(FIXTURES),
+}
+# Metrics compared against the baseline (lower is better).
+COMPARED_METRICS = ("wall_s", "cpu_s")
+
+
+def _operations():
+    from services import video
+    return {
+        "trim_video": (partial(video.trim_video, start_trim=2, end_trim=2), ".mp4"),
+        "remove_silence": (video.remove_silence, ".mp4"),
+        "remove_noise": (video.remove_noise, ".mp4"),
+        "add_captions": (video.add_captions, ".mp4"),
+        "resize_to_vertical": (video.resize_to_vertical, ".mp4"),
+        "resize_to_horizontal": (video.resize_to_horizontal, ".mp4"),
+        "adjust_speed": (partial(video.adjust_speed, speed=1.5), ".mp4"),
+        "extract_audio": (video.extract_audio, ".mp3"),
+        "watermark_fast": (partial(video.remove_watermark, strategy="fast"), ".mp4"),
+        "watermark_heal": (partial(video.remove_watermark, strategy="heal"), ".mp4"),
+        "remove_background": (video.remove_background, ".mp4"),
+    }
+
+
+def _plans():
+    from services import video
+    return {
+        "plan_shorts": [video.remove_silence, video.resize_to_vertical, video.add_captions],
+        "plan_cleanup": [partial(video.trim_video, start_trim=1), video.remove_noise, partial(video.adjust_speed, speed=1.25)],
+    }
+
+
+def case_names():
+    return list(_operations()) + list(_plans())
+
+
+def run_case(fixture, case):
+    """
+    Runs one case in this process and returns its measurements.
+    """
+    from services.render import render
+
+    width, height, duration, logo, silence_every = FIXTURES[fixture]
+    clip = make_clip(f"bench_{fixture}", width, height, duration, logo=logo, silence_every=silence_every)
+    out_dir = os.path.join(os.path.dirname(clip), "out")
+    os.makedirs(out_dir, exist_ok=True)
+
+    operations = _operations()
+    if case in operations:
+        op, ext = operations[case]
+        output = os.path.join(out_dir, f"{fixture}_{case}{ext}")
+        start = time.perf_counter()
+        result = op(clip, output)
+    else:
+        output = os.path.join(out_dir, f"{fixture}_{case}.mp4")
+        start = time.perf_counter()
+        result = render(_plans()[case], clip, output)
+    wall = time.perf_counter() - start
+
+    size = os.path.getsize(result) if result and os.path.exists(result) else 0
+    for name in os.listdir(out_dir):
+        if name.startswith(f"{fixture}_{case}"):
+            os.remove(os.path.join(out_dir, name))
+
+    measurements = {"wall_s": round(wall, 3), "output_bytes": size}
+    if resource:
+        own = resource.getrusage(resource.RUSAGE_SELF)
+        children = resource.getrusage(resource.RUSAGE_CHILDREN)
+        measurements["cpu_s"] = round(own.ru_utime + own.ru_stime + children.ru_utime + children.ru_stime, 3)
+        # ru_maxrss is KiB on Linux, bytes on macOS
+        scale = 1 if sys.platform == "darwin" else 1024
+        measurements["peak_rss_mb"] = round(max(own.ru_maxrss, children.ru_maxrss) * scale / (1024 * 1024), 1)
+    return measurements
+
+
+def run_isolated(fixture, case):
+    """
+    Runs a case in a fresh interpreter so CPU and RSS figures are its own.
+    """
+    command = [sys.executable, "-m", "benchmarks.run", "--child", fixture, case]
+    result = subprocess.run(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+    lines = result.stdout.strip().splitlines()
+    if result.returncode != 0 or not lines:
+        return {"error": (result.stderr.strip().splitlines() or ["failed"])[-1]}
+    return json.loads(lines[-1])
+
+
+def _git_commit():
+    try:
+        result = subprocess.run(["git", "rev-parse", "--short", "HEAD"], stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True)
+        return result.stdout.strip() or None
+    except OSError:
+        return None
+
+
+def compare(results, baseline, threshold):
+    """
+    Relative change per compared metric; flags cases slower than threshold.
+    """
+    regressions = []
+    rows = []
+    for key, current in results.items():
+        previous = baseline.get(key)
+        deltas = {}
+        if previous and "error" not in current and "error" not in previous:
+            for metric in COMPARED_METRICS:
+                if previous.get(metric) and current.get(metric) is not None:
+                    deltas[metric] = (current[metric] - previous[metric]) / previous[metric]
+        if any(d > threshold for d in deltas.values()):
+            regressions.append(key)
+        rows.append((key, current, deltas))
+    return rows, regressions
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--suite", choices=sorted(SUITES), default="quick")
+    parser.add_argument("--only", action="append", help="Run only these cases (repeatable).")
+    parser.add_argument("--skip", action="append", default=["remove_background"], help="Cases to skip (repeatable).")
+    parser.add_argument("--threshold", type=float, default=0.10, help="Relative slowdown counted as a regression.")
+    parser.add_argument("--baseline", default=BASELINE_FILE)
+    parser.add_argument("--save-baseline", action="store_true")
+    parser.add_argument("--child", nargs=2, metavar=("FIXTURE", "CASE"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        print(json.dumps(run_case(*args.child)))
+        return
+
+    cases = [c for c in (args.only or case_names()) if args.only or c not in args.skip]
+    results = {}
+    print(f"{'case':<48} {'wall s':>8} {'cpu s':>8} {'rss MB':>8} {'out MB':>8}")
+    for fixture in SUITES[args.suite]:
+        for case in cases:
+            key = f"{fixture}:{case}"
+            results[key] = m = run_isolated(fixture, case)
+            if "error" in m:
+                print(f"{key:<48} ERROR {m['error']}")
+            else:
+                print(f"{key:<48} {m['wall_s']:>8.2f} {m.get('cpu_s', 0):>8.2f} "
+                      f"{m.get('peak_rss_mb', 0):>8.1f} {m['output_bytes'] / (1024 * 1024):>8.2f}")
+
+    os.makedirs(RESULTS_DIR, exist_ok=True)
+    run = {
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "commit": _git_commit(),
+        "host": platform.node(),
+        "python": platform.python_version(),
+        "suite": args.suite,
+        "results": results,
+    }
+    with open(HISTORY_FILE, "a", encoding="utf-8") as f:
+        f.write(json.dumps(run) + "\n")
+
+    regressions = []
+    if os.path.exists(args.baseline):
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        rows, regressions = compare(results, baseline.get("results", {}), args.threshold)
+        print(f"\nvs baseline {baseline.get('commit')} ({baseline.get('timestamp')}):")
+        for key, current, deltas in rows:
+            if deltas:
+                changes = "  ".join(f"{metric} {delta:+.1%}" for metric, delta in deltas.items())
+                flag = "  REGRESSION" if key in regressions else ""
+                print(f"{key:<48} {changes}{flag}")
+
+    if args.save_baseline:
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump(run, f, indent=2)
+        print(f"\nSaved baseline to {args.baseline}")
+
+    if regressions:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
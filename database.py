@@ -1,9 +1,35 @@
 import os
+import threading
 import urllib.parse
-from pymongo import MongoClient
+from pymongo import MongoClient, monitoring
 from dotenv import load_dotenv
+from services import metrics
+
+# One pooled client per process; MongoClient is thread-safe.
+_client = None
+_client_lock = threading.Lock()
+
+class PoolMetrics(monitoring.ConnectionPoolListener):
+    """
+    Mirrors connection pool activity into the /metrics gauges.
+    """
+    def pool_created(self, event): pass
+    def pool_ready(self, event): pass
+    def pool_cleared(self, event): pass
+    def pool_closed(self, event): pass
+    def connection_created(self, event): metrics.MONGO_CONNECTIONS.inc()
+    def connection_ready(self, event): pass
+    def connection_closed(self, event): metrics.MONGO_CONNECTIONS.dec()
+    def connection_check_out_started(self, event): pass
+    def connection_check_out_failed(self, event): metrics.MONGO_CHECKOUT_FAILURES.inc(reason=event.reason)
+    def connection_checked_out(self, event): metrics.MONGO_CHECKED_OUT.inc()
+    def connection_checked_in(self, event): metrics.MONGO_CHECKED_OUT.dec()
 
 def get_db():
+    global _client
+    if _client is not None:
+        return _client.promtx_studio
+
     env_path = os.path.join(os.path.dirname(__file__), ".env")
     load_dotenv(dotenv_path=env_path, override=True)
     
@@ -31,10 +57,13 @@ def get_db():
             print(f"Warning: Could not auto-escape URI: {parse_error}")
 
     try:
-        client = MongoClient(uri)
-        # Verify connection
-        client.admin.command('ping')
-        return client.promtx_studio
+        with _client_lock:
+            if _client is None:
+                client = MongoClient(uri, event_listeners=[PoolMetrics()])
+                # Verify connection
+                client.admin.command('ping')
+                _client = client
+        return _client.promtx_studio
     except Exception as e:
         print(f"Error connecting to MongoDB: {e}")
         return None
@@ -1,11 +1,15 @@
 import bcrypt
-from fastapi import FastAPI, UploadFile, File, Form, HTTPException
-from fastapi.responses import HTMLResponse
+from fastapi import FastAPI, UploadFile, File, Form, HTTPException, Request
+from fastapi.responses import HTMLResponse, Response, StreamingResponse
 from fastapi.staticfiles import StaticFiles
 from fastapi.middleware.cors import CORSMiddleware
-import shutil, os, uuid
+import asyncio, glob, json, shutil, os, time, uuid
+import anyio.to_thread
 
-from services.prompt import handle_prompt
+from services.prompt import handle_prompt, plan_prompt
+from services.encoding import resolve_profile
+from services.delivery import media_response, resolve_media_path
+from services import accounts, analysis, metrics, retention, scratch, session, tracing, veo_tracker, writebehind
 from database import get_db
 
 app = FastAPI()
@@ -19,13 +23,97 @@ app.add_middleware(
 
 BASE_DIR = os.path.dirname(__file__)
 UPLOAD_DIR = os.path.join(BASE_DIR, "uploads")
+# Prompt that runs a job without an account, and the owner its previews get
+ADMIN_PROMPT = "dhairya_admin_unlimited"
+ADMIN_OWNER = "admin"
 OUTPUT_DIR = os.path.join(BASE_DIR, "outputs")
 
 os.makedirs(UPLOAD_DIR, exist_ok=True)
 os.makedirs(OUTPUT_DIR, exist_ok=True)
 
+# Rendered edits live in outputs/, generated videos in static/outputs/; both are served under /outputs.
+MEDIA_ROOTS = [OUTPUT_DIR, os.path.join(BASE_DIR, "static", "outputs")]
+
 app.mount("/static", StaticFiles(directory=os.path.join(BASE_DIR, "static")), name="static")
-app.mount("/outputs", StaticFiles(directory=os.path.join(BASE_DIR, "outputs")), name="outputs")
+
+retention.configure(
+    uploads=UPLOAD_DIR,
+    outputs=OUTPUT_DIR,
+    generated=MEDIA_ROOTS[1],
+    temp=BASE_DIR,
+    traces=tracing.TRACE_DIR,
+)
+
+@app.on_event("startup")
+async def start_retention():
+    scratch.purge_stale()
+    retention.start_sweeper()
+    # Veo generations (including ones left pending by the last run)
+    veo_tracker.start_poller()
+    # Batched MongoDB writes; retries anything spilled while Mongo was down
+    writebehind.start()
+
+@app.on_event("shutdown")
+async def flush_writes():
+    from starlette.concurrency import run_in_threadpool
+    await run_in_threadpool(writebehind.stop)
+
+metrics.watch_directories({
+    "uploads": UPLOAD_DIR,
+    "outputs": OUTPUT_DIR,
+    "static_outputs": MEDIA_ROOTS[1],
+})
+
+@app.middleware("http")
+async def record_request_metrics(request: Request, call_next):
+    metrics.HTTP_IN_FLIGHT.inc()
+    start = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        metrics.HTTP_IN_FLIGHT.dec()
+        # Label by route template, not raw path, to keep label sets bounded
+        route = request.scope.get("route")
+        route_path = getattr(route, "path", None) or ("/static" if request.url.path.startswith("/static/") else "unmatched")
+        metrics.HTTP_REQUESTS.inc(method=request.method, route=route_path, status=status)
+        metrics.HTTP_LATENCY.observe(time.perf_counter() - start, method=request.method, route=route_path)
+
+@app.get("/metrics")
+async def metrics_endpoint():
+    limiter = anyio.to_thread.current_default_thread_limiter()
+    metrics.THREADPOOL_BUSY.set(limiter.borrowed_tokens)
+    metrics.THREADPOOL_SIZE.set(limiter.total_tokens)
+    from starlette.concurrency import run_in_threadpool
+    body = await run_in_threadpool(metrics.expose)
+    return Response(content=body, media_type=metrics.CONTENT_TYPE)
+
+@app.api_route("/outputs/{file_path:path}", methods=["GET", "HEAD"])
+async def serve_output(file_path: str, request: Request):
+    path = resolve_media_path(MEDIA_ROOTS, file_path)
+    if not path:
+        raise HTTPException(status_code=404, detail="File not found")
+    return media_response(request, path)
+
+def output_url(final_path):
+    abs_path = os.path.abspath(final_path)
+    for root in MEDIA_ROOTS:
+        root = os.path.abspath(root)
+        if abs_path.startswith(root + os.sep):
+            return "/outputs/" + os.path.relpath(abs_path, root).replace(os.sep, "/")
+    return f"/outputs/{os.path.basename(final_path)}"
+
+def playlist_ready(playlist_path):
+    """
+    True once an HLS playlist lists at least one complete segment.
+    """
+    try:
+        with open(playlist_path, "r", encoding="utf-8") as f:
+            return "#EXTINF" in f.read()
+    except OSError:
+        return False
 
 @app.get("/app", response_class=HTMLResponse)
 async def index():
@@ -54,11 +142,12 @@ async def signup(email: str = Form(...), password: str = Form(...)):
     new_user = {
         "email": email,
         "password": hashed_password,
-        "trials_left": 5
+        "trials_left": 5,
+        "plan": "free"
     }
     db.users.insert_one(new_user)
     
-    return {"message": "User created successfully", "email": email, "trials_left": 5}
+    return {"message": "User created successfully", "email": email, "trials_left": 5, "token": session.issue(email)}
 
 @app.post("/api/signin")
 async def signin(email: str = Form(...), password: str = Form(...)):
@@ -73,54 +162,156 @@ async def signin(email: str = Form(...), password: str = Form(...)):
     if not bcrypt.checkpw(password.encode('utf-8'), user["password"].encode('utf-8')):
         raise HTTPException(status_code=400, detail="Invalid email or password")
         
-    return {"message": "Login successful", "email": email, "trials_left": user.get("trials_left", 0)}
+    return {
+        "message": "Login successful",
+        "email": email,
+        "trials_left": user.get("trials_left", 0),
+        # Sent back as "Authorization: Bearer <token>"; checked without a DB hit
+        "token": session.issue(email)
+    }
+
+def request_user(request, user_email, required=True):
+    """
+    The caller's email, from their session token. A posted user_email is
+    trusted only with SESSION_ALLOW_EMAIL on (clients from before sign-in
+    issued tokens); otherwise a missing token is a 401 when required.
+    """
+    token = session.from_header(request.headers.get("authorization"))
+    if token is not None:
+        email = session.verify(token)
+        if email is None:
+            raise HTTPException(status_code=401, detail="Session expired. Please log in again.")
+        return email
+    if session.SESSION_ALLOW_EMAIL:
+        return user_email
+    if required:
+        raise HTTPException(status_code=401, detail="Please log in to continue.")
+    return None
+
+def record_usage(user_email):
+    # Usage statistics only; batched with the feedback writes
+    if user_email:
+        writebehind.increment("users", {"email": user_email}, "jobs_run", 1)
 
 @app.post("/process-video/")
 async def process_video_endpoint(
+    request: Request,
     video: UploadFile = File(None),
     prompt: str = Form(...),
-    user_email: str = Form(None)
+    user_email: str = Form(None),
+    quality: str = Form(None),
+    delivery: str = Form(None),
+    preview: bool = Form(False),
+    preview_seconds: float = Form(None)
 ):
-    is_admin = (prompt == "dhairya_admin_unlimited")
+    from starlette.concurrency import run_in_threadpool
+
+    is_admin = (prompt == ADMIN_PROMPT)
+    user_email = request_user(request, user_email, required=not is_admin)
     db = get_db()
+    user_plan = None
+    reserved = False
     
     if not is_admin and user_email and db is not None:
-        user = db.users.find_one({"email": user_email})
-        if user:
-            if user.get("trials_left", 0) <= 0:
-                return {"error": "Free trial limit reached. Please upgrade to continue."}
+        if preview:
+            # Previews are free: only check there's a trial left
+            error, user_plan = await run_in_threadpool(accounts.check_trials, db, user_email)
         else:
-            return {"error": "User not found. Please log in again."}
+            # Check and take the trial in one atomic update; refunded on failure
+            error, user_plan = await run_in_threadpool(accounts.reserve_trial, db, user_email)
+            reserved = error is None
+        if error:
+            return {"error": error}
+
+    async def refund_trial():
+        if reserved:
+            await run_in_threadpool(accounts.refund_trial, db, user_email)
+
+    profile = resolve_profile(quality, user_plan)
 
     uid = str(uuid.uuid4())
     
     if video:
-        input_path = os.path.join(UPLOAD_DIR, f"{uid}_{video.filename}")
+        input_path = os.path.join(retention.shard_dir(UPLOAD_DIR, uid), f"{uid}_{os.path.basename(video.filename)}")
         with open(input_path, "wb") as buffer:
             shutil.copyfileobj(video.file, buffer)
+        # Probe, keyframes, silences and audio proxy, overlapped with the intent call
+        analysis.start_upload_analysis(input_path)
+        # Only the uploader may finalize a preview of it
+        analysis.put(input_path, "owner", ADMIN_OWNER if is_admin else user_email)
     else:
         # For generation, we don't need an input video
         input_path = None # Correctly pass None for handle_prompt
 
-    output_path = os.path.join(OUTPUT_DIR, f"processed_{uid}.mp4")
+    preview = preview and input_path is not None
+    streaming = delivery == "hls" and input_path is not None and not preview
+    if preview:
+        output_path = os.path.join(retention.shard_dir(OUTPUT_DIR, uid), f"preview_{uid}.mp4")
+    elif streaming:
+        # Progressive delivery: the final step writes fMP4 HLS segments
+        hls_dir = os.path.join(retention.shard_dir(OUTPUT_DIR, uid), f"hls_{uid}")
+        os.makedirs(hls_dir, exist_ok=True)
+        output_path = os.path.join(hls_dir, "index.m3u8")
+    else:
+        output_path = os.path.join(retention.shard_dir(OUTPUT_DIR, uid), f"processed_{uid}.mp4")
 
-    from starlette.concurrency import run_in_threadpool
     try:
-        # Assuming 'handle_prompt' is being renamed to 'process_user_instruction'
-        # and 'video_path' in the instruction refers to 'input_path'
-        # and the trailing arguments were meant to be passed to the function.
-        final_path = await run_in_threadpool(handle_prompt, prompt, input_path, output_path)
+        render_task = asyncio.ensure_future(run_in_threadpool(
+            handle_prompt, prompt, input_path, output_path, profile,
+            preview=preview, preview_seconds=preview_seconds, job_id=uid,
+            user=None if is_admin else user_email
+        ))
+
+        if streaming:
+            # Hand the playlist back as soon as its first segment is playable
+            while not render_task.done() and not playlist_ready(output_path):
+                await asyncio.sleep(0.5)
+
+            if not render_task.done():
+                async def finish_stream():
+                    try:
+                        await render_task
+                        print(f"Streaming render finished: {output_path}")
+                        if not is_admin:
+                            record_usage(user_email)
+                    except Exception as e:
+                        print(f"Processing Error (streaming): {e}")
+                        await refund_trial()
+
+                asyncio.ensure_future(finish_stream())
+                return {"video_url": output_url(output_path), "streaming": True}
+
+        final_path = await render_task
         print(f"DEBUG: handle_prompt returned final_path='{final_path}'")
+        if not is_admin:
+            record_usage(user_email)
+
+        generation_id = await run_in_threadpool(veo_tracker.job_for, final_path)
+        if generation_id:
+            if reserved and await run_in_threadpool(veo_tracker.attach_trial, generation_id, user_email):
+                # The tracker refunds it if the generation fails, waited on or not
+                reserved = False
+            # Veo generation: the shared poller finishes it; no thread waits here
+            try:
+                final_path = await asyncio.wait_for(veo_tracker.wait(generation_id), veo_tracker.VEO_WAIT_TIMEOUT)
+            except asyncio.TimeoutError:
+                # Still running: the client follows it on /generations/{id}
+                record = await run_in_threadpool(veo_tracker.get, generation_id)
+                return {
+                    "generation_id": generation_id,
+                    "status": record["status"] if record else "unknown",
+                    "status_url": f"/generations/{generation_id}"
+                }
         
-        video_url = f"/outputs/{os.path.basename(final_path)}"
+        video_url = output_url(final_path)
         print(f"Result ready: {final_path} -> {video_url}")
 
         response_data = {"video_url": video_url}
+        if preview:
+            # Finalize later with POST /finalize-video/ and this job_id
+            response_data["preview"] = True
+            response_data["job_id"] = uid
         
-        # Decrement trials_left for normal users
-        if not is_admin and user_email and db is not None:
-            db.users.update_one({"email": user_email}, {"$inc": {"trials_left": -1}})
-
         # If the output is a text file (summary), read and return its content
         if final_path.endswith(".txt"):
             try:
@@ -134,13 +325,127 @@ async def process_video_endpoint(
     except Exception as e:
         error_msg = str(e)
         print(f"Processing Error: {error_msg}")
+        await refund_trial()
         return {
             "error": error_msg
         }
 
+def find_uploads(job_id):
+    """
+    Upload(s) stored for a job id, in the sharded or the old flat layout.
+    """
+    pattern = f"{job_id}_*"
+    candidates = glob.glob(os.path.join(UPLOAD_DIR, job_id[:2], pattern)) + glob.glob(os.path.join(UPLOAD_DIR, pattern))
+    return [p for p in candidates if not analysis.is_artifact(p)]
+
+@app.post("/api/plan")
+async def plan_endpoint(
+    prompt: str = Form(...),
+    job_id: str = Form(None),
+    duration: float = Form(None),
+    width: int = Form(None),
+    height: int = Form(None)
+):
+    """
+    Dry run of a prompt: chosen operation order and estimated cost. job_id
+    points at an earlier upload (e.g. a preview); otherwise duration and
+    frame size describe the input.
+    """
+    video_path = None
+    if job_id:
+        try:
+            uploads = find_uploads(str(uuid.UUID(job_id)))
+        except ValueError:
+            return {"error": "Invalid job id."}
+        if not uploads:
+            return {"error": "Upload not found."}
+        video_path = uploads[0]
+
+    from starlette.concurrency import run_in_threadpool
+    stored = analysis.get(video_path, "plan") if video_path else None
+    intent = stored["intent"] if stored and stored.get("prompt") == prompt else None
+    try:
+        return await run_in_threadpool(
+            plan_prompt, prompt, video_path, intent, duration=duration, width=width, height=height
+        )
+    except Exception as e:
+        return {"error": str(e)}
+
+@app.post("/finalize-video/")
+async def finalize_video_endpoint(
+    request: Request,
+    job_id: str = Form(...),
+    user_email: str = Form(None),
+    quality: str = Form(None)
+):
+    """
+    Renders a previewed plan at full quality, reusing the preview's intent and
+    cached analysis.
+    """
+    try:
+        job_id = str(uuid.UUID(job_id))
+    except ValueError:
+        return {"error": "Invalid job id."}
+
+    uploads = find_uploads(job_id)
+    plan = analysis.get(uploads[0], "plan") if uploads else None
+    owner = analysis.get(uploads[0], "owner") if plan else None
+    # Admin previews need no account, like the admin render that made them
+    is_admin = owner == ADMIN_OWNER
+    user_email = request_user(request, user_email, required=not is_admin)
+    # Someone else's preview is reported like a missing one
+    if not plan or (not is_admin and owner != user_email):
+        return {"error": "Preview not found. Please upload the video again."}
+
+    from starlette.concurrency import run_in_threadpool
+
+    db = get_db()
+    user_plan = None
+    charged = not is_admin and user_email and db is not None
+    if charged:
+        error, user_plan = await run_in_threadpool(accounts.reserve_trial, db, user_email)
+        if error:
+            return {"error": error}
+
+    output_path = os.path.join(retention.shard_dir(OUTPUT_DIR, job_id), f"processed_{job_id}.mp4")
+
+    try:
+        final_path = await run_in_threadpool(
+            handle_prompt, plan["prompt"], uploads[0], output_path,
+            resolve_profile(quality, user_plan), intent=plan["intent"], job_id=job_id
+        )
+        if not is_admin:
+            record_usage(user_email)
+        return {"video_url": output_url(final_path)}
+    except Exception as e:
+        print(f"Finalize Error: {e}")
+        if charged:
+            await run_in_threadpool(accounts.refund_trial, db, user_email)
+        return {"error": str(e)}
+
 from pydantic import BaseModel
 from datetime import datetime
 
+@app.get("/generations/{generation_id}")
+async def generation_status(generation_id: str):
+    """
+    Progress of a Veo generation, e.g. to pick one up again after a restart.
+    """
+    from starlette.concurrency import run_in_threadpool
+    record = await run_in_threadpool(veo_tracker.get, generation_id)
+    if record is None:
+        raise HTTPException(status_code=404, detail="Generation not found")
+    response = {
+        "status": record["status"],
+        "duration": record["current_duration"],
+        "target_duration": record["target_duration"],
+    }
+    if record["status"] == "done":
+        response["video_url"] = output_url(record["output_path"])
+    elif record["status"] == "error":
+        response["error"] = record["error"]
+    return response
+
 class Feedback(BaseModel):
     name: str
     email: str
@@ -148,29 +453,52 @@ class Feedback(BaseModel):
 
 @app.post("/api/feedback")
 async def submit_feedback(feedback: Feedback):
-    db = get_db()
-    if db is None:
-        return {"error": "Database connection failed. Please check MONGODB_URI."}
-        
     feedback_data = feedback.dict()
     feedback_data["timestamp"] = datetime.utcnow()
     
     try:
-        # Insert into the 'feedback' collection
-        db.feedback.insert_one(feedback_data)
+        # Queued for the 'feedback' collection; written in batches (or spilled
+        # to disk and retried while MongoDB is unreachable)
+        writebehind.insert("feedback", feedback_data)
         return {"success": True, "message": "Feedback submitted successfully!"}
     except Exception as e:
         print(f"Error saving feedback: {e}")
         return {"error": "Failed to save feedback."}
 
 
-from services.ai_service import handle_chat_query
+from services.ai_service import handle_chat_query, stream_chat_query
 
 class ChatRequest(BaseModel):
     message: str
 
+def chat_events(message):
+    """
+    Server-sent events for one chat reply: a "delta" event per piece of text
+    as the model writes it, then "done" with where the answer came from.
+    """
+    info = {}
+    try:
+        for text in stream_chat_query(message, info):
+            yield f"event: delta\ndata: {json.dumps({'text': text})}\n\n"
+    except Exception as e:
+        print(f"Chatbot Error: {e}")
+        yield f"event: error\ndata: {json.dumps({'error': 'Failed to process chat request.'})}\n\n"
+        return
+    yield f"event: done\ndata: {json.dumps({'source': info.get('source')})}\n\n"
+
 @app.post("/api/chat")
-async def chat_endpoint(request: ChatRequest):
+async def chat_endpoint(request: ChatRequest, http_request: Request):
+    """
+    Streams the reply as server-sent events when the client accepts
+    text/event-stream; otherwise returns {"reply": ...} once it is complete.
+    """
+    if "text/event-stream" in http_request.headers.get("accept", ""):
+        # Sync generator: Starlette iterates it in the threadpool
+        return StreamingResponse(
+            chat_events(request.message),
+            media_type="text/event-stream",
+            headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+        )
     try:
         from starlette.concurrency import run_in_threadpool
         # Run chatbot logic in a threadpool so it doesn't block the async event loop
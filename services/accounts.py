@@ -0,0 +1,101 @@
+"""
+User plan state and trial accounting for jobs.
+
+reserve_trial() takes one trial in a single conditional find_one_and_update
+(only matches while trials_left > 0), so checking and charging cost one
+round trip and concurrent jobs can't spend more trials than the user has.
+A failed job gives its trial back with refund_trial().
+
+user_state() answers "which plan, how many trials" from a short-lived
+in-process cache (USER_CACHE_TTL), refreshed by every reservation.
+"""
+import os
+import threading
+import time
+
+from pymongo import ReturnDocument
+
+from services import metrics
+
+USER_CACHE_TTL = float(os.environ.get("USER_CACHE_TTL", "30"))
+
+CACHE_LOOKUPS = metrics.Counter("user_cache_lookups_total", "User plan lookups by result (hit, miss).", ("result",))
+TRIALS = metrics.Counter("trial_reservations_total", "Trial reservations by outcome.", ("outcome",))
+
+NO_TRIALS = "Free trial limit reached. Please upgrade to continue."
+NO_USER = "User not found. Please log in again."
+
+_lock = threading.Lock()
+_cache = {}
+
+
+def _remember(email, user):
+    state = {"plan": user.get("plan", "free"), "trials_left": user.get("trials_left", 0)}
+    with _lock:
+        _cache[email] = (time.monotonic() + USER_CACHE_TTL, state)
+    return state
+
+
+def forget(email):
+    with _lock:
+        _cache.pop(email, None)
+
+
+def user_state(db, email):
+    """
+    {"plan", "trials_left"} for a user, or None if there is no such user.
+    """
+    with _lock:
+        entry = _cache.get(email)
+    if entry and entry[0] > time.monotonic():
+        CACHE_LOOKUPS.inc(result="hit")
+        return dict(entry[1])
+    CACHE_LOOKUPS.inc(result="miss")
+    user = db.users.find_one({"email": email}, {"plan": 1, "trials_left": 1})
+    if not user:
+        forget(email)
+        return None
+    return _remember(email, user)
+
+
+def check_trials(db, email):
+    """
+    Returns (error, plan) for a job that doesn't use a trial (previews).
+    """
+    state = user_state(db, email)
+    if state is None:
+        return NO_USER, None
+    if state["trials_left"] <= 0:
+        return NO_TRIALS, None
+    return None, state["plan"]
+
+
+def reserve_trial(db, email):
+    """
+    Takes one trial up front. Returns (error, plan); no error means a trial
+    was taken and must be refunded if the job fails.
+    """
+    user = db.users.find_one_and_update(
+        {"email": email, "trials_left": {"$gt": 0}},
+        {"$inc": {"trials_left": -1}},
+        projection={"plan": 1, "trials_left": 1},
+        return_document=ReturnDocument.AFTER,
+    )
+    if user:
+        TRIALS.inc(outcome="reserved")
+        return None, _remember(email, user)["plan"]
+    TRIALS.inc(outcome="denied")
+    # Nothing matched: out of trials, or no such user
+    forget(email)
+    if user_state(db, email) is None:
+        return NO_USER, None
+    return NO_TRIALS, None
+
+
+def refund_trial(db, email):
+    try:
+        db.users.update_one({"email": email}, {"$inc": {"trials_left": 1}})
+        TRIALS.inc(outcome="refunded")
+    except Exception as e:
+        print(f"Trial refund for {email} failed: {e}")
+    forget(email)
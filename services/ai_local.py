@@ -0,0 +1,246 @@
+"""
+In-process stand-in for the subset of `google.genai.Client` that
+services/ai_service.py uses. Selected with AI_BACKEND=local; answers are
+deterministic and latency/failures are simulated, so handle_prompt and the
+API can be benchmarked and load-tested without keys or network.
+"""
+import json
+import os
+import random
+import re
+import subprocess
+import tempfile
+import threading
+import time
+import uuid
+from types import SimpleNamespace
+
+# Mean and +/- jitter (ms) added to every API call.
+AI_LOCAL_LATENCY_MS = float(os.environ.get("AI_LOCAL_LATENCY_MS", "300"))
+AI_LOCAL_JITTER_MS = float(os.environ.get("AI_LOCAL_JITTER_MS", "100"))
+# Fraction of calls that fail, and the status codes they fail with.
+AI_LOCAL_FAILURE_RATE = float(os.environ.get("AI_LOCAL_FAILURE_RATE", "0"))
+AI_LOCAL_FAILURE_CODES = [int(c) for c in os.environ.get("AI_LOCAL_FAILURE_CODES", "429,503").split(",") if c.strip()]
+# How long uploaded files stay in PROCESSING, and how long a Veo job runs.
+AI_LOCAL_PROCESSING_MS = float(os.environ.get("AI_LOCAL_PROCESSING_MS", "0"))
+AI_LOCAL_VIDEO_MS = float(os.environ.get("AI_LOCAL_VIDEO_MS", "2000"))
+AI_LOCAL_SEED = int(os.environ.get("AI_LOCAL_SEED", "0"))
+
+STATUS_NAMES = {
+    429: "RESOURCE_EXHAUSTED",
+    500: "INTERNAL",
+    503: "UNAVAILABLE",
+}
+CUE_SECONDS = 3.0
+
+# One seeded stream per process, so a run's latency/failure sequence repeats.
+_rng = random.Random(AI_LOCAL_SEED)
+_rng_lock = threading.Lock()
+_files = {}
+_files_lock = threading.Lock()
+# Veo operations by name; polling works from the name alone, as with the real API.
+_operations = {}
+_video_bytes = None
+
+# Keyword rules for the stand-in intent extractor, first match wins.
+INTENT_RULES = [
+    (("generate", "create a video", "make a video"), "generate_video"),
+    (("summar",), "summarize"),
+    (("watermark", "logo"), "remove_watermark"),
+    (("background", "green screen"), "remove_background"),
+    (("caption", "subtitle"), "add_captions"),
+    (("silence", "silent"), "remove_silence"),
+    (("noise", "clean audio"), "remove_noise"),
+    (("vertical", "shorts", "reels", "9:16"), "resize_vertical"),
+    (("horizontal", "landscape", "16:9"), "resize_horizontal"),
+    (("speed", "faster", "slower"), "adjust_speed"),
+    (("mp3", "extract audio"), "extract_audio"),
+    (("trim", "cut"), "trim"),
+]
+
+
+class StandInAPIError(Exception):
+    def __init__(self, code):
+        self.code = code
+        super().__init__(f"{code} {STATUS_NAMES.get(code, 'ERROR')}. Simulated failure from the local AI backend.")
+
+
+def _simulate_call():
+    with _rng_lock:
+        delay = max(0.0, AI_LOCAL_LATENCY_MS + _rng.uniform(-AI_LOCAL_JITTER_MS, AI_LOCAL_JITTER_MS))
+        fail = _rng.random() < AI_LOCAL_FAILURE_RATE
+        code = _rng.choice(AI_LOCAL_FAILURE_CODES) if fail and AI_LOCAL_FAILURE_CODES else None
+    time.sleep(delay / 1000.0)
+    if code:
+        raise StandInAPIError(code)
+
+
+def _text_of(contents):
+    if isinstance(contents, str):
+        return contents
+    return "\n".join(c for c in contents if isinstance(c, str))
+
+
+def _file_of(contents):
+    if isinstance(contents, (list, tuple)):
+        return next((c for c in contents if isinstance(c, SimpleNamespace)), None)
+    return None
+
+
+def _instruction(text, marker):
+    return text.split(marker, 1)[1].strip() if marker in text else text
+
+
+def _format_ts(seconds):
+    ms = int(round(seconds * 1000))
+    h, ms = divmod(ms, 3600000)
+    m, ms = divmod(ms, 60000)
+    s, ms = divmod(ms, 1000)
+    return f"{h:02d}:{m:02d}:{s:02d},{ms:03d}"
+
+
+def stand_in_intent(instruction):
+    p = instruction.lower()
+    operation = next((op for keys, op in INTENT_RULES if any(k in p for k in keys)), None)
+    params = {"start_trim": 0, "end_trim": 0, "duration": 8, "target_language": None, "speed": 1.0, "model": "veo"}
+
+    numbers = [float(n) for n in re.findall(r"(\d+(?:\.\d+)?)", p)]
+    if operation == "trim" and numbers:
+        key = "end_trim" if "end" in p or "last" in p else "start_trim"
+        params[key] = int(numbers[0])
+    elif operation == "adjust_speed":
+        params["speed"] = numbers[0] if numbers else (0.5 if "slower" in p else 1.5)
+    elif operation == "generate_video" and numbers:
+        params["duration"] = int(numbers[0])
+    match = re.search(r"\b(?:in|to) (english|hindi|spanish|french|german|japanese)\b", p)
+    if match:
+        params["target_language"] = match.group(1).capitalize()
+    return {"operation": operation, "params": params}
+
+
+def stand_in_srt(duration):
+    blocks = []
+    start = 0.0
+    index = 1
+    while start < duration:
+        end = min(start + CUE_SECONDS - 0.5, duration)
+        blocks.append(f"{index}\n{_format_ts(start)} --> {_format_ts(end)}\nStand-in caption line {index}")
+        start += CUE_SECONDS
+        index += 1
+    return "\n\n".join(blocks) + "\n"
+
+
+def _media_duration(path):
+    from services.probe import get_duration
+    return get_duration(path) if path and os.path.exists(path) else 0.0
+
+
+def _placeholder_video():
+    global _video_bytes
+    if _video_bytes is None:
+        path = os.path.join(tempfile.gettempdir(), f"stand_in_veo_{os.getpid()}.mp4")
+        subprocess.run([
+            "ffmpeg", "-y", "-nostdin", "-loglevel", "error",
+            "-f", "lavfi", "-i", "testsrc2=size=1280x720:rate=24:duration=8",
+            "-c:v", "libx264", "-preset", "ultrafast", "-pix_fmt", "yuv420p",
+            path
+        ], check=True)
+        with open(path, "rb") as f:
+            _video_bytes = f.read()
+        os.remove(path)
+    return _video_bytes
+
+
+class _Files:
+    def upload(self, file=None, **kwargs):
+        _simulate_call()
+        uploaded = SimpleNamespace(
+            name=f"files/{uuid.uuid4().hex[:12]}",
+            path=file,
+            ready_at=time.monotonic() + AI_LOCAL_PROCESSING_MS / 1000.0,
+            state=SimpleNamespace(name="PROCESSING"),
+        )
+        with _files_lock:
+            _files[uploaded.name] = uploaded
+        return self._refresh(uploaded)
+
+    def get(self, name=None, **kwargs):
+        _simulate_call()
+        with _files_lock:
+            uploaded = _files.get(name)
+        if uploaded is None:
+            raise Exception(f"404 NOT_FOUND. File {name} does not exist.")
+        return self._refresh(uploaded)
+
+    def delete(self, name=None, **kwargs):
+        with _files_lock:
+            _files.pop(name, None)
+
+    def download(self, file=None, **kwargs):
+        _simulate_call()
+        return _placeholder_video()
+
+    @staticmethod
+    def _refresh(uploaded):
+        uploaded.state.name = "ACTIVE" if time.monotonic() >= uploaded.ready_at else "PROCESSING"
+        return uploaded
+
+
+class _Models:
+    def generate_content(self, model=None, contents=None, config=None, **kwargs):
+        _simulate_call()
+        text = _text_of(contents)
+        uploaded = _file_of(contents)
+
+        if config and (config.get("response_mime_type") if isinstance(config, dict) else None) == "application/json":
+            intent = stand_in_intent(_instruction(text, "User Instruction:"))
+            return SimpleNamespace(text=json.dumps(intent))
+        if "SRT" in text:
+            return SimpleNamespace(text=stand_in_srt(_media_duration(uploaded.path if uploaded else None)))
+        if "summary" in text.lower():
+            return SimpleNamespace(text="This is a stand-in summary generated by the local AI backend. It describes the uploaded media in a single paragraph.")
+        return SimpleNamespace(text=f"Stand-in reply to: {_instruction(text, 'User:')[:200]}")
+
+    def generate_content_stream(self, model=None, contents=None, config=None, **kwargs):
+        text = self.generate_content(model=model, contents=contents, config=config, **kwargs).text
+        words = text.split(" ")
+        for i in range(0, len(words), 4):
+            yield SimpleNamespace(text=" ".join(words[i:i + 4]) + (" " if i + 4 < len(words) else ""))
+
+    def generate_videos(self, model=None, prompt=None, video=None, **kwargs):
+        _simulate_call()
+        operation = SimpleNamespace(
+            name=f"operations/{uuid.uuid4().hex[:12]}",
+            ready_at=time.time() + AI_LOCAL_VIDEO_MS / 1000.0,
+            done=False,
+            error=None,
+            result=None,
+        )
+        with _files_lock:
+            _operations[operation.name] = operation
+        return operation
+
+
+class _Operations:
+    def get(self, operation, **kwargs):
+        _simulate_call()
+        with _files_lock:
+            # Unknown names (e.g. started before a restart) count as finished
+            tracked = _operations.get(operation.name) or SimpleNamespace(
+                name=operation.name, ready_at=0, done=False, error=None, result=None)
+        if time.time() >= tracked.ready_at:
+            tracked.done = True
+            tracked.result = SimpleNamespace(generated_videos=[SimpleNamespace(video=SimpleNamespace(name=tracked.name, uri=None))])
+            with _files_lock:
+                _operations.pop(tracked.name, None)
+        return tracked
+
+
+class LocalClient:
+    """
+    Drop-in for genai.Client(api_key=...) exposing files, models and operations.
+    """
+    def __init__(self, api_key=None, **kwargs):
+        self.files = _Files()
+        self.models = _Models()
+        self.operations = _Operations()
@@ -1,22 +1,40 @@
-from google import genai
 import os
 import json
+import threading
 import time
-from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
+from services import faq, metrics, ratelimit, tracing
+
+# "gemini" = Google API, "local" = deterministic in-process stand-in
+# (services/ai_local.py) for benchmarks, load tests and CI.
+AI_BACKEND = os.environ.get("AI_BACKEND", "gemini")
 
 def get_api_key():
     env_path = os.path.join(os.path.dirname(os.path.dirname(__file__)), ".env")
     load_dotenv(dotenv_path=env_path, override=True)
+    if AI_BACKEND == "local":
+        return os.environ.get("GEMINI_API_KEY") or "local"
     return os.environ.get("GEMINI_API_KEY")
 
+def get_client(api_key):
+    """
+    Client for the configured AI backend. Both expose the same files / models /
+    operations calls used below.
+    """
+    if AI_BACKEND == "local":
+        from services.ai_local import LocalClient
+        return LocalClient(api_key=api_key)
+    from google import genai
+    return genai.Client(api_key=api_key)
+
 def generate_summary(transcript: str):
     api_key = get_api_key()
     if not api_key:
         return "Error: Gemini API Key is missing. Please set it in services/ai_service.py."
 
     try:
-        client = genai.Client(api_key=api_key)
+        client = get_client(api_key)
         
         prompt = f"""
         Provide a detailed, descriptive paragraph summary of the following video transcript. 
@@ -27,28 +45,123 @@ def generate_summary(transcript: str):
         {transcript}
         """
 
-        response = client.models.generate_content(
-            model="gemini-2.5-flash",
+        response = ratelimit.generate(
+            client, "gemini-2.5-flash",
             contents=prompt
         )
         return response.text.strip()
     except Exception as e:
         return f"Error analyzing video: {str(e)}"
 
-def _upload_and_wait(client, media_path):
-    print(f"Uploading {media_path} to Gemini...")
-    uploaded_file = client.files.upload(file=media_path)
-    
-    import time
+# Upload-processing polls start fast and back off: most small audio files are
+# ACTIVE within a second, long videos take much longer.
+GEMINI_POLL_INITIAL = float(os.environ.get("GEMINI_POLL_INITIAL", "0.5"))
+GEMINI_POLL_MAX = float(os.environ.get("GEMINI_POLL_MAX", "5"))
+GEMINI_PREFETCH_WORKERS = int(os.environ.get("GEMINI_PREFETCH_WORKERS", "2"))
+
+_prefetch_lock = threading.Lock()
+_prefetch_executor = ThreadPoolExecutor(max_workers=GEMINI_PREFETCH_WORKERS, thread_name_prefix="gemini-upload")
+_prefetched = {}
+
+def _wait_until_active(client, uploaded_file, cancelled=None):
+    delay = GEMINI_POLL_INITIAL
     while uploaded_file.state.name == "PROCESSING":
+        if cancelled is not None and cancelled.is_set():
+            break
         print("Waiting for file to be processed by Gemini...")
-        time.sleep(2)
+        time.sleep(delay)
+        delay = min(delay * 1.5, GEMINI_POLL_MAX)
         uploaded_file = client.files.get(name=uploaded_file.name)
-        
+
     if uploaded_file.state.name == "FAILED":
         raise Exception("Gemini file processing failed.")
     return uploaded_file
 
+def _prefetch(media_path, cancelled, resolve=None):
+    if resolve is not None and not resolve():
+        return None
+    if cancelled.is_set() or not os.path.exists(media_path):
+        return None
+    client = get_client(get_api_key())
+    print(f"Prefetching {media_path} to Gemini...")
+    uploaded_file = client.files.upload(file=media_path)
+    uploaded_file = _wait_until_active(client, uploaded_file, cancelled)
+    if cancelled.is_set():
+        _delete_upload(uploaded_file)
+        return None
+    return uploaded_file
+
+def _delete_upload(uploaded_file):
+    try:
+        get_client(get_api_key()).files.delete(name=uploaded_file.name)
+    except Exception:
+        pass
+
+def prefetch_upload(media_path, resolve=None):
+    """
+    Starts uploading media_path to Gemini in the background so a later
+    _upload_and_wait for the same path finds it ready. resolve(), if given,
+    runs first in the background thread (e.g. to wait for the file to exist)
+    and skips the upload when it returns False.
+    """
+    api_key = get_api_key()
+    if not api_key or api_key == "YOUR_GEMINI_API_KEY":
+        return
+    key = os.path.abspath(media_path)
+    with _prefetch_lock:
+        if key in _prefetched:
+            return
+        cancelled = threading.Event()
+        _prefetched[key] = (_prefetch_executor.submit(_prefetch, key, cancelled, resolve), cancelled)
+
+def cancel_prefetch(media_path):
+    """
+    Drops a prefetch that turned out not to be needed, deleting the remote
+    copy if the upload already finished.
+    """
+    with _prefetch_lock:
+        entry = _prefetched.pop(os.path.abspath(media_path), None)
+    if entry is None:
+        return
+    future, cancelled = entry
+    cancelled.set()
+    if future.cancel():
+        return
+
+    def cleanup(done):
+        try:
+            uploaded_file = done.result()
+        except Exception:
+            return
+        if uploaded_file is not None:
+            _delete_upload(uploaded_file)
+    future.add_done_callback(cleanup)
+
+def _take_prefetched(media_path):
+    with _prefetch_lock:
+        entry = _prefetched.pop(os.path.abspath(media_path), None)
+    if entry is None:
+        return None
+    try:
+        return entry[0].result()
+    except Exception as e:
+        print(f"Prefetched upload failed ({e}); uploading again")
+        return None
+
+@tracing.traced("gemini.upload_wait")
+@metrics.timed(metrics.AI_CALL_SECONDS, call="upload_wait")
+def _upload_and_wait(client, media_path):
+    uploaded_file = _take_prefetched(media_path)
+    if uploaded_file is not None:
+        tracing.annotate(prefetched=True)
+        return uploaded_file
+
+    print(f"Uploading {media_path} to Gemini...")
+    uploaded_file = client.files.upload(file=media_path)
+    return _wait_until_active(client, uploaded_file)
+
+@tracing.traced("gemini.srt")
+@metrics.timed(metrics.AI_CALL_SECONDS, call="srt")
 def generate_srt_gemini(media_path: str, target_language: str = None):
     """
     Uploads a media file to Gemini and requests it to generate captions in SRT format.
@@ -57,53 +170,53 @@ def generate_srt_gemini(media_path: str, target_language: str = None):
     if not api_key or api_key == "YOUR_GEMINI_API_KEY":
         return "Error: Gemini API Key is missing."
 
-    import time
-    max_retries = 5
-    retry_delay = 2 # Initial delay in seconds
+    # Identical concurrent requests (same audio, same language) share one call
+    try:
+        key = ratelimit.request_key("srt", media_path, target_language)
+    except OSError as e:
+        return f"Error generating SRT: {e}"
+    return ratelimit.single_flight(key, _generate_srt, api_key, media_path, target_language, kind="srt")
+
+def _generate_srt(api_key, media_path, target_language):
+    # One attempt: on 429/503 ratelimit.generate has already tried the
+    # fallback model, and the caller falls back to local Whisper instead of
+    # sleeping here.
+    try:
+        client = get_client(api_key)
+        uploaded_file = _upload_and_wait(client, media_path)
 
-    for attempt in range(max_retries):
-        try:
-            client = genai.Client(api_key=api_key)
-            uploaded_file = _upload_and_wait(client, media_path)
-
-            lang_instruction = f"TRANSLATE EVERYTHING to {target_language}. Even if the original language is different, the output SRT MUST be in {target_language}." if target_language else "transcribe to the original language"
-            prompt = f"""
-            Generate a professional SRT subtitle file for this media with EXTRAORDINARY SURGICAL PRECISION.
-            Instruction: {lang_instruction}.
-            Rules:
-            - Output ONLY the raw SRT text. No markdown tags, no notes.
-            - STRICT Timestamp Format: HH:MM:SS,mmm (e.g., 00:00:05,123 --> 00:00:10,500).
-            - TIMESTAMPS MUST BE SURGICALLY TIGHT: Start the timestamp at the EXACT millisecond the first phoneme of a word begins, and end EXACTLY when the last phoneme ends. ZERO PADDING.
-            - Meaningful segment breaks.
-            - COMPLETELY IGNORE the original language if a target language is specified; PRODUCING ONLY {target_language if target_language else 'ORIGINAL LANGUAGE'} SUBTITLES.
-            """
-
-            print(f"Generating SRT using Gemini 2.5 Flash (Target: {target_language if target_language else 'Original'}). Attempt {attempt + 1}/{max_retries}...")
-            response = client.models.generate_content(
-                model="gemini-2.5-flash",
-                contents=[uploaded_file, prompt]
-            )
-            
-            try: client.files.delete(name=uploaded_file.name)
-            except: pass
-            
-            raw_srt = response.text.strip()
-            return _fix_srt_content(raw_srt)
+        lang_instruction = f"TRANSLATE EVERYTHING to {target_language}. Even if the original language is different, the output SRT MUST be in {target_language}." if target_language else "transcribe to the original language"
+        prompt = f"""
+        Generate a professional SRT subtitle file for this media with EXTRAORDINARY SURGICAL PRECISION.
+        Instruction: {lang_instruction}.
+        Rules:
+        - Output ONLY the raw SRT text. No markdown tags, no notes.
+        - STRICT Timestamp Format: HH:MM:SS,mmm (e.g., 00:00:05,123 --> 00:00:10,500).
+        - TIMESTAMPS MUST BE SURGICALLY TIGHT: Start the timestamp at the EXACT millisecond the first phoneme of a word begins, and end EXACTLY when the last phoneme ends. ZERO PADDING.
+        - Meaningful segment breaks.
+        - COMPLETELY IGNORE the original language if a target language is specified; PRODUCING ONLY {target_language if target_language else 'ORIGINAL LANGUAGE'} SUBTITLES.
+        """
 
-        except Exception as e:
-            error_msg = str(e)
-            is_transient = "503" in error_msg or "429" in error_msg or "UNAVAILABLE" in error_msg or "RESOURCE_EXHAUSTED" in error_msg
-            
-            if is_transient and attempt < max_retries - 1:
-                print(f"Transient error ({error_msg}) encountered. Retrying in {retry_delay}s...")
-                time.sleep(retry_delay)
-                retry_delay *= 2 # Exponential backoff
-                continue
-            
-            if "429" in error_msg:
-                print(f"Quota Error (429): Gemini API limit reached for Gemini 2.5 Flash.")
-            
-            return f"Error generating SRT: {error_msg}"
+        print(f"Generating SRT using Gemini 2.5 Flash (Target: {target_language if target_language else 'Original'})...")
+        response = ratelimit.generate(
+            client, "gemini-2.5-flash",
+            contents=[uploaded_file, prompt]
+        )
+        
+        try: client.files.delete(name=uploaded_file.name)
+        except: pass
+        
+        raw_srt = response.text.strip()
+        return _fix_srt_content(raw_srt)
+
+    except Exception as e:
+        error_msg = str(e)
+        metrics.AI_ERRORS.inc(call="srt", status=metrics.error_status(error_msg))
+        
+        if "429" in error_msg:
+            print(f"Quota Error (429): Gemini API limit reached for Gemini 2.5 Flash.")
+        
+        return f"Error generating SRT: {error_msg}"
 
 def _fix_srt_content(text):
     """
@@ -188,8 +301,8 @@ def _fix_srt_content(text):
         
     return "\n\n".join(fixed_blocks) + "\n"
 
-
-
+@tracing.traced("gemini.summary")
+@metrics.timed(metrics.AI_CALL_SECONDS, call="summary")
 def generate_summary_gemini(media_path: str, user_prompt: str = ""):
     """
     Uploads a media file to Gemini and requests a deep content analysis summary,
@@ -199,165 +312,187 @@ def generate_summary_gemini(media_path: str, user_prompt: str = ""):
     if not api_key or api_key == "YOUR_GEMINI_API_KEY":
         return "Error: Gemini API Key is missing."
 
-    import time
-    max_retries = 3
-    retry_delay = 2
+    try:
+        key = ratelimit.request_key("summary", media_path, user_prompt)
+    except OSError as e:
+        return f"Error analyzing video: {e}"
+    return ratelimit.single_flight(key, _generate_summary, api_key, media_path, user_prompt, kind="summary")
+
+def _generate_summary(api_key, media_path, user_prompt):
+    # One attempt, like _generate_srt: a busy Gemini returns its error (with
+    # the retry-after time) right away rather than sleeping in a request thread.
+    try:
+        client = get_client(api_key)
+        uploaded_file = _upload_and_wait(client, media_path)
 
-    for attempt in range(max_retries):
-        try:
-            client = genai.Client(api_key=api_key)
-            uploaded_file = _upload_and_wait(client, media_path)
+        prompt = f"""
+        Analyze this video/audio and provide a comprehensive, descriptive paragraph summary.
+        User Instruction: {user_prompt}
+        
+        CRITICAL:
+        1. Detect the language used in the 'User Instruction' above.
+        2. Generate the entire summary in that SAME language.
+        3. Provide only the descriptive paragraph. Do not use headings, titles, or bullet points.
+        """
 
-            prompt = f"""
-            Analyze this video/audio and provide a comprehensive, descriptive paragraph summary.
-            User Instruction: {user_prompt}
-            
-            CRITICAL:
-            1. Detect the language used in the 'User Instruction' above.
-            2. Generate the entire summary in that SAME language.
-            3. Provide only the descriptive paragraph. Do not use headings, titles, or bullet points.
-            """
-
-            print(f"Analyzing video content with Gemini 2.5 Flash. Attempt {attempt + 1}/{max_retries}...")
-            response = client.models.generate_content(
-                model="gemini-2.5-flash",
-                contents=[uploaded_file, prompt]
-            )
-            
-            try: client.files.delete(name=uploaded_file.name)
-            except: pass
-            
-            return response.text.strip()
-        except Exception as e:
-            error_msg = str(e)
-            is_transient = "503" in error_msg or "429" in error_msg or "UNAVAILABLE" in error_msg or "RESOURCE_EXHAUSTED" in error_msg
+        print(f"Analyzing video content with Gemini 2.5 Flash...")
+        response = ratelimit.generate(
+            client, "gemini-2.5-flash",
+            contents=[uploaded_file, prompt]
+        )
+        
+        try: client.files.delete(name=uploaded_file.name)
+        except: pass
+        
+        return response.text.strip()
+    except Exception as e:
+        error_msg = str(e)
+        metrics.AI_ERRORS.inc(call="summary", status=metrics.error_status(error_msg))
+        return f"Error analyzing video: {error_msg}"
+
+# Seconds added by the first Veo generation and by each extension.
+VEO_INITIAL_SECONDS = 8
+VEO_EXTENSION_SECONDS = 7
 
-            if is_transient and attempt < max_retries - 1:
-                print(f"Transient error ({error_msg}) encountered during analysis. Retrying in {retry_delay}s...")
-                time.sleep(retry_delay)
-                retry_delay *= 2
-                continue
+def veo_length(duration, budget=None):
+    """
+    Length Veo actually produces for a requested duration (8s plus whole 7s
+    extensions, rounding up), or the longest such length within budget.
+    """
+    extensions = max(0, int(-(-(duration - VEO_INITIAL_SECONDS) // VEO_EXTENSION_SECONDS)))
+    if budget is not None:
+        extensions = min(extensions, max(0, int((budget - VEO_INITIAL_SECONDS) // VEO_EXTENSION_SECONDS)))
+    return VEO_INITIAL_SECONDS + extensions * VEO_EXTENSION_SECONDS
 
-            return f"Error analyzing video: {error_msg}"
+def veo_exception(e):
+    """
+    User-facing exception for a failed Veo call.
+    """
+    error_str = str(e)
+    metrics.AI_ERRORS.inc(call="veo", status=metrics.error_status(error_str))
+    if "429" in error_str or "RESOURCE_EXHAUSTED" in error_str:
+        return Exception("REMOTE QUOTA EXHAUSTED: Google has temporarily blocked new video generations for your API key. This is a limit on their side. Try again in 15 minutes, or use a shorter prompt.")
+    return Exception(f"Veo Error: {error_str}")
 
-QUOTA_FILE = "quota_usage.json"
-MAX_DAILY_QUOTA_SEC = 30 # Reduced to 30s to stay within most preview limits
+def veo_operation_error(error):
+    """
+    Message for a Veo operation that finished with an error.
+    """
+    error_msg = str(error)
+    if "RESOURCE_EXHAUSTED" in error_msg or "429" in error_msg:
+        return "GOOGLE REMOTE QUOTA: Your GCP account has reached its Veo limit for now. These limits are very strict in preview (often 1-5 videos/day). Please wait 15-30 minutes or check your quota in the Google Cloud Console (https://console.cloud.google.com/benchmark/quotas)."
+    return f"Veo generation failed: {error_msg}"
+
+def _veo_video(video_uri):
+    """
+    Video reference accepted by generate_videos(video=...) and files.download().
+    """
+    if AI_BACKEND == "local":
+        from types import SimpleNamespace
+        return SimpleNamespace(name=video_uri, uri=video_uri)
+    from google.genai import types
+    return types.Video(uri=video_uri, mime_type="video/mp4")
+
+@metrics.timed(metrics.AI_CALL_SECONDS, call="veo_start")
+def start_veo(prompt: str, model: str, video_uri: str = None, fallback: bool = True):
+    """
+    Starts a Veo generation (or an extension of video_uri) and returns
+    (operation name, model used) without waiting for it. A 429 on the primary
+    model retries once on its fast variant.
+    """
+    client = get_client(get_api_key())
+
+    def call_veo(target_model):
+        if video_uri:
+            return client.models.generate_videos(model=target_model, video=_veo_video(video_uri), prompt=prompt)
+        return client.models.generate_videos(model=target_model, prompt=prompt)
 
-def _get_quota_usage():
-    if not os.path.exists(QUOTA_FILE):
-        return {"date": str(datetime.now().date()), "seconds_used": 0}
     try:
-        with open(QUOTA_FILE, "r") as f:
-            data = json.load(f)
-            if data.get("date") != str(datetime.now().date()):
-                return {"date": str(datetime.now().date()), "seconds_used": 0}
-            return data
-    except:
-        return {"date": str(datetime.now().date()), "seconds_used": 0}
-
-def _update_quota_usage(seconds):
-    usage = _get_quota_usage()
-    usage["seconds_used"] += seconds
-    with open(QUOTA_FILE, "w") as f:
-        json.dump(usage, f)
-
-def generate_video_veo(prompt: str, output_path: str, model: str = 'veo-3.1-generate-preview', duration: int = 8):
+        return call_veo(model).name, model
+    except Exception as e:
+        if fallback and ("429" in str(e) or "RESOURCE_EXHAUSTED" in str(e)) and "fast" not in model:
+            metrics.AI_ERRORS.inc(call="veo", status="429")
+            metrics.AI_RETRIES.inc(call="veo")
+            print("Primary model quota hit. Attempting fallback to 'fast-generate' variant...")
+            fallback_model = model.replace("generate-preview", "fast-generate-preview") if "preview" in model else "veo-3.1-fast-generate-preview"
+            return call_veo(fallback_model).name, fallback_model
+        raise e
+
+@metrics.timed(metrics.AI_CALL_SECONDS, call="veo_poll")
+def poll_veo(operation_name: str):
+    """
+    One status check of a Veo operation by name. Returns (done, video_uri, error).
+    """
+    client = get_client(get_api_key())
+    if AI_BACKEND == "local":
+        from types import SimpleNamespace
+        operation = SimpleNamespace(name=operation_name)
+    else:
+        from google.genai import types
+        operation = types.GenerateVideosOperation(name=operation_name)
+    operation = client.operations.get(operation)
+    if not operation.done:
+        return False, None, None
+    if operation.error:
+        return True, None, operation.error
+    video = operation.result.generated_videos[0].video
+    return True, video.uri or video.name, None
+
+# Generated videos are streamed to disk in chunks of this size.
+DOWNLOAD_CHUNK_BYTES = 1024 * 1024
+
+@metrics.timed(metrics.AI_CALL_SECONDS, call="veo_download")
+def download_veo(video_uri: str, dest_path: str):
+    """
+    Streams a generated video to dest_path with bounded memory and checks the
+    byte count against Content-Length. Returns the number of bytes written.
+    """
+    api_key = get_api_key()
+    if AI_BACKEND == "local" or not (video_uri or "").startswith("http"):
+        # Stand-in (or a reference the SDK must resolve): small, fetched whole
+        video_bytes = get_client(api_key).files.download(file=_veo_video(video_uri))
+        with open(dest_path, "wb") as f:
+            f.write(video_bytes)
+        return len(video_bytes)
+
+    import shutil
+    import urllib.request
+    request = urllib.request.Request(video_uri, headers={"x-goog-api-key": api_key})
+    with urllib.request.urlopen(request, timeout=60) as response, open(dest_path, "wb") as f:
+        expected = response.headers.get("Content-Length")
+        shutil.copyfileobj(response, f, DOWNLOAD_CHUNK_BYTES)
+        written = f.tell()
+    if expected is not None and int(expected) != written:
+        raise Exception(f"Incomplete download: got {written} of {expected} bytes")
+    if written == 0:
+        raise Exception("Empty download")
+    return written
+
+def generate_video_veo(prompt: str, output_path: str, model: str = 'veo-3.1-generate-preview', duration: int = 8, user: str = None):
     """
     Generates a video using Google Veo based on the provided prompt.
-    Supports extended durations by looping generation.
-    Includes Quota Management and Model Fallback (Fast).
+    Supports extended durations by chaining extensions.
+    Includes Quota Management (services/quota.py, charged to `user` and the
+    global budget) and Model Fallback (Fast).
+
+    The generation is handed to services/veo_tracker.py. With the server's
+    poller running this returns output_path right away (the file appears when
+    the tracker finishes; see veo_tracker.wait); otherwise it drives the
+    generation to completion in this thread.
     """
+    from services import veo_tracker
+
     api_key = get_api_key()
     if not api_key or api_key == "YOUR_GEMINI_API_KEY":
         return "Error: Gemini API Key is missing."
 
-    # 1. Quota Check
-    usage = _get_quota_usage()
-    remaining = MAX_DAILY_QUOTA_SEC - usage["seconds_used"]
-    target_duration = min(duration, remaining)
-    
-    if target_duration <= 0:
-        raise Exception(f"Local Quota Exceeded: You have used {usage['seconds_used']}s of your {MAX_DAILY_QUOTA_SEC}s daily safety limit. Please wait until tomorrow or increase MAX_DAILY_QUOTA_SEC in ai_service.py.")
-
-    try:
-        client = genai.Client(api_key=api_key)
-        
-        current_duration = 0
-        video = None
-        
-        print(f"Generating video with Veo ({model}): '{prompt}' (Target: {target_duration}s)")
-        
-        def call_veo(target_model, current_video=None):
-            if current_video:
-                return client.models.generate_videos(model=target_model, video=current_video, prompt=prompt)
-            return client.models.generate_videos(model=target_model, prompt=prompt)
-
-        # Try primary model first, fallback to fast if quota hit
-        try:
-            operation = call_veo(model)
-        except Exception as e:
-            if ("429" in str(e) or "RESOURCE_EXHAUSTED" in str(e)) and "fast" not in model:
-                print("Primary model quota hit. Attempting fallback to 'fast-generate' variant...")
-                fallback_model = model.replace("generate-preview", "fast-generate-preview") if "preview" in model else "veo-3.1-fast-generate-preview"
-                operation = call_veo(fallback_model)
-            else:
-                raise e
-
-        import time
-        while not operation.done:
-            print(f"Generation in progress...")
-            time.sleep(5)
-            operation = client.operations.get(operation)
-
-        if operation.error:
-            error_msg = str(operation.error)
-            if "RESOURCE_EXHAUSTED" in error_msg or "429" in error_msg:
-                 raise Exception("GOOGLE REMOTE QUOTA: Your GCP account has reached its Veo limit for now. These limits are very strict in preview (often 1-5 videos/day). Please wait 15-30 minutes or check your quota in the Google Cloud Console (https://console.cloud.google.com/benchmark/quotas).")
-            raise Exception(f"Veo generation failed: {operation.error}")
-
-        video = operation.result.generated_videos[0]
-        current_duration = 8 # Initial gen
-        
-        # Extension Loop
-        while current_duration < target_duration:
-            if (usage["seconds_used"] + current_duration + 7) > MAX_DAILY_QUOTA_SEC:
-                print("Stopping: Next extension would exceed daily quota.")
-                break
-
-            print(f"Extending video... (Current: {current_duration}s -> Target: {target_duration}s)")
-            try:
-                operation = call_veo(model, current_video=video)
-            except Exception as e:
-                 if "429" in str(e) or "RESOURCE_EXHAUSTED" in str(e):
-                     print("Quota hit during extension. Returning partial video.")
-                     break
-                 raise e
-
-            while not operation.done:
-                time.sleep(5)
-                operation = client.operations.get(operation)
-            
-            if operation.error:
-                print(f"Extension failed: {operation.error}. Returning partial video.")
-                break 
-
-            video = operation.result.generated_videos[0]
-            current_duration += 7
-
-        # Save
-        video_bytes = client.files.download(file=video)
-        with open(output_path, "wb") as f:
-            f.write(video_bytes)
-        
-        _update_quota_usage(current_duration)
+    generation_id = veo_tracker.submit(prompt, output_path, model=model, duration=duration, user=user)
+    if veo_tracker.poller_running():
         return output_path
-        
-    except Exception as e:
-        error_str = str(e)
-        if "429" in error_str or "RESOURCE_EXHAUSTED" in error_str:
-            raise Exception("REMOTE QUOTA EXHAUSTED: Google has temporarily blocked new video generations for your API key. This is a limit on their side. Try again in 15 minutes, or use a shorter prompt.")
-        raise Exception(f"Veo Error: {error_str}")
+    return veo_tracker.complete(generation_id)
 
+@tracing.traced("gemini.extract_intent")
+@metrics.timed(metrics.AI_CALL_SECONDS, call="extract_intent")
 def extract_intent_gemini(user_prompt: str):
     """
     Uses Gemini to extract structured intent from a natural language prompt.
@@ -367,8 +502,12 @@ def extract_intent_gemini(user_prompt: str):
     if not api_key or api_key == "YOUR_GEMINI_API_KEY":
         return None
 
+    key = ratelimit.request_key("intent", None, user_prompt)
+    return ratelimit.single_flight(key, _extract_intent, api_key, user_prompt, kind="intent")
+
+def _extract_intent(api_key, user_prompt):
     try:
-        client = genai.Client(api_key=api_key)
+        client = get_client(api_key)
         
         system_prompt = """
         You are an AI Video Editor intent extractor. Your job is to convert natural language instructions into structure JSON.
@@ -417,8 +556,8 @@ def extract_intent_gemini(user_prompt: str):
         If the user misspelled words (e.g., 'tirm', 'vidoe', 'captin'), detect the correct intent anyway.
         """
 
-        response = client.models.generate_content(
-            model="gemini-2.5-flash",
+        response = ratelimit.generate(
+            client, "gemini-2.5-flash",
             contents=f"{system_prompt}\n\nUser Instruction: {user_prompt}",
             config={
                 'response_mime_type': 'application/json'
@@ -428,34 +567,71 @@ def extract_intent_gemini(user_prompt: str):
         import json
         return json.loads(response.text.strip())
     except Exception as e:
+        metrics.AI_ERRORS.inc(call="extract_intent", status=metrics.error_status(str(e)))
         print(f"DEBUG: Intent extraction failed: {e}")
         return None
 
-def handle_chat_query(user_message: str) -> str:
+CHAT_SYSTEM_PROMPT = """
+You are the friendly and helpful Customer Support AI for PROMPTX STUDIO.
+PROMPTX STUDIO is an AI-powered Video Editing Engine that lets users edit videos using simple text prompts.
+Features include: AI Silence Removal, AI Captions, AI Trim, AI Vertical/Horizontal Resizing, Video generation from text (Veo), and AI audio extraction.
+Keep your answers concise, friendly, and helpful. Do not use complex markdown formatting unless necessary.
+If a user asks how to do something, tell them they can just upload their video and type what they want in the prompt box!
+"""
+
+def stream_chat_query(user_message: str, info: dict = None):
     """
-    Handles user chat queries regarding the PROMPTX STUDIO platform.
+    Yields the support reply to a chat message in pieces as the model writes
+    it. Common questions are answered from the FAQ, repeated ones from the
+    answer cache (services/faq.py), without calling the model. `info`, if
+    given, receives {"source": "faq" | "cache" | "model" | "error"}.
     """
+    info = {} if info is None else info
+    answer, source = faq.lookup(user_message)
+    if answer is not None:
+        info["source"] = source
+        yield answer
+        return
+
     api_key = get_api_key()
     if not api_key or api_key == "YOUR_GEMINI_API_KEY":
-        return "I'm sorry, my AI backend is not configured correctly (Missing API Key)."
+        info["source"] = "error"
+        yield "I'm sorry, my AI backend is not configured correctly (Missing API Key)."
+        return
 
+    parts = []
     try:
-        client = genai.Client(api_key=api_key)
-        
-        system_prompt = """
-        You are the friendly and helpful Customer Support AI for PROMPTX STUDIO.
-        PROMPTX STUDIO is an AI-powered Video Editing Engine that lets users edit videos using simple text prompts.
-        Features include: AI Silence Removal, AI Captions, AI Trim, AI Vertical/Horizontal Resizing, Video generation from text (Veo), and AI audio extraction.
-        Keep your answers concise, friendly, and helpful. Do not use complex markdown formatting unless necessary.
-        If a user asks how to do something, tell them they can just upload their video and type what they want in the prompt box!
-        """
-
-        response = client.models.generate_content(
-            model="gemini-2.5-flash",
-            contents=f"{system_prompt}\n\nUser: {user_message}",
+        client = get_client(api_key)
+        started = time.perf_counter()
+        chunks = ratelimit.generate(
+            client, "gemini-2.5-flash", stream=True,
+            contents=f"{CHAT_SYSTEM_PROMPT}\n\nUser: {user_message}",
         )
-        
-        return response.text.strip()
+        for chunk in chunks:
+            text = chunk.text or ""
+            if not parts:
+                text = text.lstrip()
+                metrics.AI_CALL_SECONDS.observe(time.perf_counter() - started, call="chat_first_token")
+            if text:
+                parts.append(text)
+                yield text
     except Exception as e:
+        metrics.AI_ERRORS.inc(call="chat", status=metrics.error_status(str(e)))
         print(f"DEBUG: Chat handle failed: {e}")
-        return f"I'm sorry, I'm having trouble connecting to my brain right now. Please try again later. ({str(e)})"
+        info["source"] = "error"
+        if not parts:
+            yield f"I'm sorry, I'm having trouble connecting to my brain right now. Please try again later. ({str(e)})"
+        return
+
+    metrics.AI_CALL_SECONDS.observe(time.perf_counter() - started, call="chat")
+    info["source"] = "model"
+    faq.ANSWERS.inc(source="model")
+    reply = "".join(parts).strip()
+    if reply:
+        faq.remember(user_message, reply)
+
+def handle_chat_query(user_message: str) -> str:
+    """
+    Handles user chat queries regarding the PROMPTX STUDIO platform.
+    """
+    return "".join(stream_chat_query(user_message)).strip()
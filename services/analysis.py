@@ -0,0 +1,173 @@
+import json
+import os
+import subprocess
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from services import tracing
+
+# Analysis results for an upload are kept in a JSON sidecar next to it
+# (uploads/<id>_<name>.analysis.json) so later jobs on the same file can
+# reuse them instead of re-running FFmpeg passes or AI calls.
+_lock = threading.Lock()
+
+# Upload-time analysis runs here while the prompt's intent is being resolved.
+UPLOAD_ANALYSIS_WORKERS = int(os.environ.get("UPLOAD_ANALYSIS_WORKERS", "2"))
+UPLOAD_ANALYSIS_WAIT = float(os.environ.get("UPLOAD_ANALYSIS_WAIT", "120"))
+_executor = ThreadPoolExecutor(max_workers=UPLOAD_ANALYSIS_WORKERS, thread_name_prefix="analysis")
+_pending = {}
+
+# Silence settings precomputed at upload (remove_silence's defaults).
+DEFAULT_SILENCE = ("-30dB", 0.5)
+# Mono 16 kHz FLAC: lossless timing, a fraction of the video's size.
+AUDIO_PROXY_SUFFIX = ".audio.flac"
+
+
+def sidecar_path(source_path):
+    return f"{source_path}.analysis.json"
+
+
+def audio_proxy_path(source_path):
+    return f"{source_path}{AUDIO_PROXY_SUFFIX}"
+
+
+def is_artifact(path):
+    """
+    True for files this module writes next to an upload.
+    """
+    return path.endswith((".analysis.json", AUDIO_PROXY_SUFFIX)) or path.endswith(".tmp")
+
+
+def silence_key(threshold, min_silence_len):
+    return f"silencedetect:{threshold}:{min_silence_len}"
+
+
+def _signature(source_path):
+    try:
+        stat = os.stat(source_path)
+    except OSError:
+        return None
+    return {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+
+
+def load(source_path):
+    """
+    Reads the sidecar. Entries recorded against a different version of the
+    source file are discarded.
+    """
+    try:
+        with open(sidecar_path(source_path), "r", encoding="utf-8") as f:
+            data = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    if data.get("source") != _signature(source_path):
+        return {}
+    return data
+
+
+def get(source_path, key, default=None):
+    if not source_path:
+        return default
+    return load(source_path).get(key, default)
+
+
+def put(source_path, key, value):
+    """
+    Stores one entry in the sidecar (atomic replace, so readers never see a
+    half-written file).
+    """
+    if not source_path:
+        return value
+    path = sidecar_path(source_path)
+    with _lock:
+        data = load(source_path)
+        data["source"] = _signature(source_path)
+        data[key] = value
+        temp_path = f"{path}.{os.getpid()}.tmp"
+        with open(temp_path, "w", encoding="utf-8") as f:
+            json.dump(data, f)
+        os.replace(temp_path, path)
+    return value
+
+
+def audio_source(source_path):
+    """
+    The upload's audio proxy if one was extracted, else the file itself. Used
+    for audio-only work (transcription, speech gating).
+    """
+    proxy = get(source_path, "audio_proxy")
+    if proxy:
+        proxy_path = os.path.join(os.path.dirname(source_path), proxy)
+        if os.path.exists(proxy_path):
+            return proxy_path
+    return source_path
+
+
+def analyze_upload(input_path):
+    """
+    Precomputes what the editing operations would otherwise rediscover: the
+    ffprobe description, keyframe times and, when there is audio, the default
+    silence map and an audio proxy, written in a single audio decode.
+    """
+    from services.probe import probe, get_keyframes
+    from services.video import parse_silences
+
+    info = probe(input_path, cached=False)
+    if not info:
+        return
+    put(input_path, "probe", info)
+
+    streams = info.get("streams", [])
+    if any(st.get("codec_type") == "video" for st in streams):
+        put(input_path, "keyframes", get_keyframes(input_path, cached=False))
+
+    if any(st.get("codec_type") == "audio" for st in streams):
+        threshold, min_silence_len = DEFAULT_SILENCE
+        proxy_path = audio_proxy_path(input_path)
+        command = [
+            "ffmpeg", "-y", "-i", input_path,
+            "-map", "0:a:0",
+            "-af", f"silencedetect=noise={threshold}:d={min_silence_len}",
+            "-ac", "1", "-ar", "16000", "-c:a", "flac",
+            proxy_path
+        ]
+        result = tracing.run(command, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+        if result.returncode == 0:
+            silences, duration = parse_silences(result.stderr)
+            put(input_path, silence_key(threshold, min_silence_len), [silences, duration])
+            put(input_path, "audio_proxy", os.path.basename(proxy_path))
+
+
+def _run_analysis(input_path):
+    try:
+        analyze_upload(input_path)
+    except Exception as e:
+        print(f"Upload analysis failed for {input_path}: {e}")
+
+
+def start_upload_analysis(input_path):
+    """
+    Queues analyze_upload in the background and returns immediately.
+    """
+    with _lock:
+        future = _pending.get(input_path)
+        if future is None or future.done():
+            _pending[input_path] = _executor.submit(_run_analysis, input_path)
+
+
+def wait_for_upload_analysis(input_path, timeout=None):
+    """
+    Blocks until a queued analysis of input_path has finished (or the timeout
+    passes; operations then fall back to probing on their own).
+    """
+    with _lock:
+        future = _pending.get(input_path)
+    if future is None:
+        return
+    try:
+        future.result(timeout=UPLOAD_ANALYSIS_WAIT if timeout is None else timeout)
+    except Exception:
+        return
+    with _lock:
+        if _pending.get(input_path) is future:
+            del _pending[input_path]
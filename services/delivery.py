@@ -0,0 +1,111 @@
+import mimetypes
+import os
+
+from fastapi import HTTPException, Request
+from fastapi.responses import Response, StreamingResponse
+
+from services import retention
+
+# Outputs are written once under unique names, so clients may cache them hard.
+OUTPUT_CACHE_SECONDS = int(os.environ.get("OUTPUT_CACHE_SECONDS", "86400"))
+STREAM_CHUNK_BYTES = 256 * 1024
+
+mimetypes.add_type("application/vnd.apple.mpegurl", ".m3u8")
+mimetypes.add_type("video/iso.segment", ".m4s")
+mimetypes.add_type("audio/mp4", ".m4a")
+
+
+def resolve_media_path(roots, relative_path):
+    """
+    Finds relative_path under one of the given roots, refusing anything that
+    escapes them.
+    """
+    for root in roots:
+        root = os.path.realpath(root)
+        candidate = os.path.realpath(os.path.join(root, relative_path))
+        if not candidate.startswith(root + os.sep):
+            continue
+        if os.path.isfile(candidate):
+            return candidate
+    return None
+
+
+def _parse_range(range_header, size):
+    """
+    Parses a single `bytes=` range. Returns (start, end) inclusive, None for a
+    header we should ignore, or raises for an unsatisfiable range.
+    """
+    if not range_header or not range_header.startswith("bytes=") or "," in range_header:
+        return None
+    start_s, _, end_s = range_header[6:].strip().partition("-")
+    try:
+        if start_s == "":
+            length = int(end_s)
+            if length <= 0:
+                raise ValueError
+            start, end = max(0, size - length), size - 1
+        else:
+            start = int(start_s)
+            end = int(end_s) if end_s else size - 1
+    except ValueError:
+        return None
+    if start >= size or start > end:
+        raise HTTPException(status_code=416, headers={"Content-Range": f"bytes */{size}"})
+    return start, min(end, size - 1)
+
+
+def _iter_file(path, start, length):
+    with open(path, "rb") as f:
+        f.seek(start)
+        remaining = length
+        while remaining > 0:
+            chunk = f.read(min(STREAM_CHUNK_BYTES, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
+
+
+def media_response(request: Request, path):
+    """
+    Serves a file with byte-range, ETag and cache headers. Playlists of
+    in-progress HLS renders are served uncached since they keep growing.
+    """
+    stat = os.stat(path)
+    size = stat.st_size
+    etag = f'"{stat.st_mtime_ns:x}-{size:x}"'
+    content_type = mimetypes.guess_type(path)[0] or "application/octet-stream"
+
+    headers = {
+        "Accept-Ranges": "bytes",
+        "ETag": etag,
+    }
+    if path.endswith(".m3u8"):
+        headers["Cache-Control"] = "no-cache"
+    else:
+        headers["Cache-Control"] = f"public, max-age={OUTPUT_CACHE_SECONDS}, immutable"
+
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers=headers)
+
+    byte_range = _parse_range(request.headers.get("range"), size)
+    if_range = request.headers.get("if-range")
+    if byte_range and if_range and if_range != etag:
+        byte_range = None
+
+    if byte_range:
+        start, end = byte_range
+        status_code = 206
+        headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+    else:
+        start, end = 0, size - 1
+        status_code = 200
+    length = end - start + 1
+    headers["Content-Length"] = str(length)
+
+    if request.method == "HEAD":
+        return Response(status_code=status_code, headers=headers, media_type=content_type)
+    if start == 0:
+        # A fresh download counts as a use for LRU eviction
+        retention.touch(path)
+    return StreamingResponse(_iter_file(path, start, length), status_code=status_code, headers=headers, media_type=content_type)
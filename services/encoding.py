@@ -0,0 +1,181 @@
+import os
+
+# Named encode tiers shared by every FFmpeg call. threads=0 lets x264 pick.
+ENCODE_PROFILES = {
+    "preview": {
+        "preset": "ultrafast",
+        "crf": 30,
+        "threads": 0,
+        "pix_fmt": "yuv420p",
+        "audio_bitrate": "96k",
+    },
+    "standard": {
+        "preset": "veryfast",
+        "crf": 23,
+        "threads": 0,
+        "pix_fmt": "yuv420p",
+        "audio_bitrate": "160k",
+    },
+    "archival": {
+        "preset": "slow",
+        "crf": 18,
+        "threads": 0,
+        "pix_fmt": "yuv420p",
+        "audio_bitrate": "256k",
+    },
+}
+# Cheapest to most expensive.
+PROFILE_ORDER = ["preview", "standard", "archival"]
+
+DEFAULT_ENCODE_PROFILE = os.environ.get("ENCODE_PROFILE", "standard")
+
+# Best tier each user plan may request (and the default when none is asked for).
+PLAN_PROFILES = {
+    "free": "standard",
+    "pro": "archival",
+}
+
+# Muxing: MP4-family outputs are finalized with the index up front; .m3u8
+# outputs are written as progressive fMP4 HLS.
+FASTSTART_EXTENSIONS = (".mp4", ".mov", ".m4a")
+HLS_SEGMENT_SECONDS = int(os.environ.get("HLS_SEGMENT_SECONDS", "4"))
+
+VIDEO_ENCODERS = {
+    "h264": "libx264",
+    "hevc": "libx265",
+}
+MP3_QUALITY = {
+    "preview": "6",
+    "standard": "4",
+    "archival": "2",
+}
+
+
+def resolve_profile(requested=None, plan=None):
+    """
+    Picks the tier for a job: the requested tier if given, else the plan's
+    default, never above what the plan allows. Jobs without a plan (admin,
+    anonymous) get the requested tier or ENCODE_PROFILE.
+    """
+    if plan is None:
+        return requested if requested in ENCODE_PROFILES else DEFAULT_ENCODE_PROFILE
+
+    ceiling = PLAN_PROFILES.get(plan, PLAN_PROFILES["free"])
+    name = requested if requested in ENCODE_PROFILES else ceiling
+    if PROFILE_ORDER.index(name) > PROFILE_ORDER.index(ceiling):
+        name = ceiling
+    return name
+
+
+def get_profile(profile=None):
+    return ENCODE_PROFILES.get(profile or DEFAULT_ENCODE_PROFILE, ENCODE_PROFILES["standard"])
+
+
+def video_args(profile=None, codec="h264", pix_fmt=None):
+    """
+    Video encoder arguments for a tier. pix_fmt overrides the tier's format
+    (e.g. to match a source when splicing re-encoded and copied GOPs).
+    """
+    settings = get_profile(profile)
+    return [
+        "-c:v", VIDEO_ENCODERS.get(codec, "libx264"),
+        "-preset", settings["preset"],
+        "-crf", str(settings["crf"]),
+        "-threads", str(settings["threads"]),
+        "-pix_fmt", pix_fmt or settings["pix_fmt"],
+    ]
+
+
+# Source profile (as ffprobe names it) -> encoder profile, for re-encoding
+# GOPs that are spliced next to copied ones. Anything else can't be matched.
+SPLICE_PROFILES = {
+    "h264": {
+        "Constrained Baseline": "baseline",
+        "Baseline": "baseline",
+        "Main": "main",
+        "High": "high",
+        "High 10": "high10",
+        "High 4:2:2": "high422",
+        "High 4:4:4 Predictive": "high444",
+    },
+    "hevc": {
+        "Main": "main",
+        "Main 10": "main10",
+    },
+}
+COLOR_OPTIONS = {
+    "color_primaries": "-color_primaries",
+    "color_transfer": "-color_trc",
+    "color_space": "-colorspace",
+    "color_range": "-color_range",
+}
+
+
+def _splice_level(codec, level):
+    if not isinstance(level, int) or level <= 0:
+        return None
+    if codec == "hevc":
+        # general_level_idc is 30x the level: 93 -> 3.1
+        return f"{level // 30}.{level % 30 // 3}"
+    return f"{level // 10}.{level % 10}"
+
+
+def splice_video_args(stream, profile=None):
+    """
+    Encoder arguments for GOPs that are stream-copied alongside the rest of
+    `stream` (an ffprobe stream dict): the tier's preset and quality, but the
+    source's codec profile, level, pixel format and colour tags. Raises
+    ValueError when the source can't be matched.
+    """
+    codec = stream.get("codec_name")
+    encoder_profile = SPLICE_PROFILES.get(codec, {}).get(stream.get("profile"))
+    level = _splice_level(codec, stream.get("level"))
+    pix_fmt = stream.get("pix_fmt")
+    if encoder_profile is None or level is None or not pix_fmt:
+        raise ValueError(
+            f"cannot match {codec} profile={stream.get('profile')} level={stream.get('level')} pix_fmt={pix_fmt}"
+        )
+
+    args = video_args(profile, codec, pix_fmt) + ["-profile:v", encoder_profile]
+    if codec == "hevc":
+        args += ["-x265-params", f"level-idc={level}"]
+    else:
+        args += ["-level:v", level]
+    for key, option in COLOR_OPTIONS.items():
+        value = stream.get(key)
+        if value and value != "unknown":
+            args += [option, value]
+    return args
+
+
+def audio_args(profile=None, output_path=""):
+    """
+    Audio encoder arguments for a tier: AAC by default, LAME VBR for .mp3.
+    """
+    if output_path.lower().endswith(".mp3"):
+        return ["-c:a", "libmp3lame", "-q:a", MP3_QUALITY.get(profile or DEFAULT_ENCODE_PROFILE, "4")]
+    return ["-c:a", "aac", "-b:a", get_profile(profile)["audio_bitrate"]]
+
+
+def container_args(output_path):
+    """
+    Muxer arguments by output type: MP4-family files get their index (moov)
+    written up front so playback can start before the download finishes;
+    .m3u8 outputs become an fMP4 HLS event playlist whose segments are
+    playable while FFmpeg is still writing.
+    """
+    lower = output_path.lower()
+    if lower.endswith(FASTSTART_EXTENSIONS):
+        return ["-movflags", "+faststart"]
+    if lower.endswith(".m3u8"):
+        segment_dir = os.path.dirname(os.path.abspath(output_path))
+        return [
+            "-f", "hls",
+            "-hls_time", str(HLS_SEGMENT_SECONDS),
+            "-hls_playlist_type", "event",
+            "-hls_segment_type", "fmp4",
+            "-hls_fmp4_init_filename", "init.mp4",
+            "-hls_segment_filename", os.path.join(segment_dir, "seg_%05d.m4s"),
+            "-hls_flags", "independent_segments",
+        ]
+    return []
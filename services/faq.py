@@ -0,0 +1,154 @@
+"""
+Answers for the support chat that don't need the model.
+
+- A small FAQ index: "how do I ...?" questions about a feature ("how do I
+  add captions?") are matched by keywords and answered from fixed text.
+  Anything else (troubleshooting, "why ...", pricing) goes to the model.
+- An answer cache: model replies are kept for CHAT_CACHE_TTL seconds under
+  the normalized question, so the same question asked again (any case,
+  punctuation or filler words) is answered from memory.
+
+chat_answers_total{source="faq"|"cache"|"model"} gives the hit rate.
+"""
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+
+from services import metrics
+
+CHAT_CACHE_TTL = float(os.environ.get("CHAT_CACHE_TTL", "3600"))
+CHAT_CACHE_SIZE = int(os.environ.get("CHAT_CACHE_SIZE", "500"))
+CHAT_FAQ = os.environ.get("CHAT_FAQ", "1") == "1"
+# Longer questions are usually specific enough to deserve the model.
+FAQ_MAX_WORDS = 12
+
+ANSWERS = metrics.Counter("chat_answers_total", "Chat replies by source (faq, cache, model).", ("source",))
+CACHE_ENTRIES = metrics.Gauge("chat_cache_entries", "Questions held in the chat answer cache.")
+
+# How-to phrasing the FAQ answers; without it the question goes to the model.
+HOW_TO = re.compile(r"\b(how (do|can|could|would|should|to)|can (i|you|we)|is it possible to|where do i)\b")
+# Troubleshooting, complaints and pricing: never answered from the FAQ. Words
+# are normalized like the question (lowercase, plural "s" dropped).
+SKIP_WORDS = {
+    "why", "wrong", "sync", "broken", "broke", "error", "fail", "failed", "failing", "bug",
+    "issue", "problem", "not", "didn", "doesn", "isn", "won", "cannot", "stuck",
+    "blur", "blurry", "bad", "weird", "missing", "lost", "refund",
+    "price", "pricing", "cost", "pay", "paid", "free", "plan", "subscription", "trial", "pro",
+}
+
+FILLER = {
+    "a", "an", "the", "please", "pls", "hi", "hello", "hey", "thanks", "thank", "you",
+    "can", "could", "would", "i", "me", "my", "do", "does", "is", "it", "to", "in", "on",
+    "of", "for", "with", "this", "that", "there", "way", "want",
+}
+
+# (keyword sets, answer): an entry matches when every word of one of its
+# sets appears in the question. Words are normalized (lowercase, plural "s"
+# dropped), so list them in singular form.
+FAQ = [
+    ([{"caption"}, {"subtitle"}],
+     "Upload your video and type something like \"add captions\" in the prompt box. "
+     "You can also ask for them in another language, e.g. \"add Spanish subtitles\"."),
+    ([{"silence"}, {"silent"}, {"pause"}],
+     "Upload your video and type \"remove silence\" in the prompt box. Quiet gaps are cut automatically."),
+    ([{"trim"}, {"cut", "start"}, {"cut", "end"}],
+     "Upload your video and describe the cut, e.g. \"trim the first 5 seconds\" or \"cut 10 seconds from the end\"."),
+    ([{"vertical"}, {"reel"}, {"short"}, {"tiktok"}, {"portrait"}],
+     "Upload your video and type \"make it vertical\" to get a 9:16 version for Reels, Shorts and TikTok."),
+    ([{"horizontal"}, {"landscape"}, {"youtube"}],
+     "Upload your video and type \"make it horizontal\" to get a 16:9 version."),
+    ([{"noise"}],
+     "Upload your video and type \"remove background noise\" to clean up the audio between spoken parts."),
+    ([{"audio"}, {"mp3"}],
+     "Upload your video and type \"extract audio\" to download its soundtrack as an audio file."),
+    # "background" alone also matches "add background music"
+    ([{"remove", "background"}, {"background", "removal"}, {"delete", "background"}],
+     "Upload your video and type \"remove background\". The person stays and the background is removed."),
+    ([{"watermark"}, {"logo"}],
+     "Upload your video and type \"remove watermark\", optionally with its position, e.g. \"remove the logo in the top left\"."),
+    ([{"generate"}, {"veo"}, {"text", "video"}, {"create", "video"}],
+     "You don't need to upload anything: just describe the video you want in the prompt box, "
+     "e.g. \"generate a drone shot over a beach at sunset\"."),
+    ([{"speed"}, {"faster"}, {"slower"}],
+     "Upload your video and type e.g. \"speed it up 1.5x\" or \"slow it down\"."),
+    ([{"summary"}, {"summarize"}],
+     "Upload your video and type \"summarize this video\" to get a short text summary of what happens in it."),
+]
+
+_lock = threading.Lock()
+_cache = OrderedDict()
+
+
+def _words(text):
+    words = re.findall(r"[a-z0-9]+", text.lower())
+    # Crude singular form: "captions" and "caption" match the same entry
+    return [w[:-1] if len(w) > 3 and w.endswith("s") and not w.endswith("ss") else w for w in words]
+
+
+def normalize(question):
+    """
+    Cache key for a question: lowercase words without punctuation or filler.
+    """
+    words = [w for w in _words(question) if w not in FILLER]
+    return " ".join(words) or question.strip().lower()
+
+
+def match(question):
+    """
+    Fixed answer for a short "how do I <feature>?" question, or None.
+    """
+    words = _words(question)
+    if not CHAT_FAQ or len(words) > FAQ_MAX_WORDS:
+        return None
+    present = set(words)
+    if present & SKIP_WORDS or not HOW_TO.search(" ".join(re.findall(r"[a-z0-9']+", question.lower()))):
+        return None
+    for keyword_sets, answer in FAQ:
+        if any(keywords <= present for keywords in keyword_sets):
+            return answer
+    return None
+
+
+def cached(question):
+    key = normalize(question)
+    now = time.monotonic()
+    with _lock:
+        entry = _cache.get(key)
+        if entry is None:
+            return None
+        if now - entry[0] > CHAT_CACHE_TTL:
+            del _cache[key]
+            CACHE_ENTRIES.set(len(_cache))
+            return None
+        _cache.move_to_end(key)
+        return entry[1]
+
+
+def remember(question, answer):
+    if CHAT_CACHE_TTL <= 0 or CHAT_CACHE_SIZE <= 0:
+        return
+    key = normalize(question)
+    with _lock:
+        _cache[key] = (time.monotonic(), answer)
+        _cache.move_to_end(key)
+        while len(_cache) > CHAT_CACHE_SIZE:
+            _cache.popitem(last=False)
+        CACHE_ENTRIES.set(len(_cache))
+
+
+def lookup(question):
+    """
+    (answer, source) from the FAQ or the cache, or (None, None) if the
+    model has to answer. Counts hits.
+    """
+    answer = match(question)
+    if answer is not None:
+        ANSWERS.inc(source="faq")
+        return answer, "faq"
+    answer = cached(question)
+    if answer is not None:
+        ANSWERS.inc(source="cache")
+        return answer, "cache"
+    return None, None
@@ -0,0 +1,114 @@
+import os
+import queue
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from services import metrics, tracing
+
+# Worker threads for per-frame work. OpenCV and onnxruntime release the GIL
+# inside their native calls, so threads scale across cores without the cost of
+# pickling frames to worker processes.
+FRAME_WORKERS = int(os.environ.get("FRAME_WORKERS", "0")) or (os.cpu_count() or 1)
+# Frames allowed in flight (decoded but not yet written). 0 = 2 per worker.
+FRAME_QUEUE_SIZE = int(os.environ.get("FRAME_QUEUE_SIZE", "0"))
+
+_EOF = object()
+
+
+def _read_frames(cap, frames, stop, errors):
+    """
+    Reader stage: decodes frames into a bounded queue. Blocks when the queue is
+    full, which is what gives the pipeline its backpressure.
+    """
+    try:
+        while not stop.is_set():
+            ret, frame = cap.read()
+            if not ret:
+                break
+            while not stop.is_set():
+                try:
+                    frames.put(frame, timeout=0.1)
+                    break
+                except queue.Full:
+                    continue
+    except Exception as e:
+        errors.append(e)
+    finally:
+        while not stop.is_set():
+            try:
+                frames.put(_EOF, timeout=0.1)
+                break
+            except queue.Full:
+                continue
+
+
+def process_frames(cap, writer, frame_fn, workers=None, max_pending=None, on_progress=None):
+    """
+    Runs frame_fn over every frame of an open cv2.VideoCapture and writes the
+    results to writer in source order.
+
+    Pipeline: reader thread -> bounded queue -> N worker threads -> ordered writer.
+    At most 2 * max_pending frames are held in memory at any time regardless of
+    video length. Returns the number of frames written.
+    """
+    workers = max(1, int(workers or FRAME_WORKERS))
+    max_pending = max(1, int(max_pending or FRAME_QUEUE_SIZE or workers * 2))
+
+    with tracing.span("frames", workers=workers, max_pending=max_pending) as attrs:
+        # Worker threads' CPU is not in the span's thread time, so record the
+        # process-wide figure as well.
+        cpu_start = time.process_time()
+        wall_start = time.perf_counter()
+        frames = queue.Queue(maxsize=max_pending)
+        stop = threading.Event()
+        errors = []
+
+        reader = threading.Thread(target=_read_frames, args=(cap, frames, stop, errors), daemon=True)
+        reader.start()
+
+        pending = deque()
+        written = 0
+
+        def write_next():
+            nonlocal written
+            writer.write(pending.popleft().result())
+            written += 1
+            if on_progress:
+                on_progress(written)
+
+        pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="frame")
+        try:
+            while True:
+                frame = frames.get()
+                if frame is _EOF:
+                    break
+                pending.append(pool.submit(frame_fn, frame))
+                # Ordered writer: always drain the oldest frame first.
+                if len(pending) >= max_pending:
+                    write_next()
+
+            while pending:
+                write_next()
+        except BaseException:
+            stop.set()
+            for future in pending:
+                future.cancel()
+            raise
+        finally:
+            pool.shutdown(wait=True)
+            stop.set()
+            reader.join()
+
+        if errors:
+            raise errors[0]
+
+        elapsed = time.perf_counter() - wall_start
+        if written and elapsed > 0:
+            metrics.FRAME_FPS.observe(written / elapsed, workers=workers)
+        if attrs is not None:
+            attrs["frames"] = written
+            attrs["process_cpu_s"] = round(time.process_time() - cpu_start, 4)
+
+    return written
@@ -0,0 +1,227 @@
+"""
+Process-local metrics in the Prometheus text exposition format, served at
+/metrics. Counters, gauges and histograms take label values as keyword
+arguments; collectors registered with add_collector() refresh gauges right
+before each scrape.
+"""
+import functools
+import os
+import shutil
+import threading
+import time
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+RENDER_BUCKETS = (0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, 1200, 3600)
+FPS_BUCKETS = (1, 2, 5, 10, 15, 20, 30, 45, 60, 90, 120, 240)
+
+_registry = []
+_collectors = []
+_registry_lock = threading.Lock()
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+
+def _format_labels(names, values, extra=None):
+    pairs = list(zip(names, values))
+    if extra:
+        pairs.append(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in pairs) + "}"
+
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+        with _registry_lock:
+            _registry.append(self)
+
+    def _key(self, labels):
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+    def expose(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        with self._lock:
+            items = sorted(self._values.items())
+        for key, value in items:
+            lines.append(f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}")
+        return lines
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def set(self, value, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (float("inf"),)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            counts, total = self._values.get(key, ([0] * len(self.buckets), 0.0))
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+            self._values[key] = (counts, total + value)
+
+    def expose(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            items = sorted((key, (list(counts), total)) for key, (counts, total) in self._values.items())
+        for key, (counts, total) in items:
+            for bound, count in zip(self.buckets, counts):
+                labels = _format_labels(self.labelnames, key, ("le", _format_value(bound)))
+                lines.append(f"{self.name}_bucket{labels} {count}")
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(total)}")
+            lines.append(f"{self.name}_count{labels} {counts[-1]}")
+        return lines
+
+
+def timed(histogram, **labels):
+    """
+    Decorator observing a function's wall time into histogram.
+    """
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                histogram.observe(time.perf_counter() - start, **labels)
+        return wrapper
+    return decorator
+
+
+def add_collector(fn):
+    """
+    Registers fn() to run before every scrape (e.g. to sample disk usage).
+    """
+    _collectors.append(fn)
+    return fn
+
+
+def expose():
+    for collector in list(_collectors):
+        try:
+            collector()
+        except Exception as e:
+            print(f"Metrics collector {getattr(collector, '__name__', collector)} failed: {e}")
+    with _registry_lock:
+        metrics = list(_registry)
+    lines = []
+    for metric in metrics:
+        lines.extend(metric.expose())
+    return "\n".join(lines) + "\n"
+
+
+# --- Shared metrics -------------------------------------------------------
+
+HTTP_REQUESTS = Counter("http_requests_total", "HTTP requests by route and status.", ("method", "route", "status"))
+HTTP_LATENCY = Histogram("http_request_duration_seconds", "HTTP request latency.", ("method", "route"))
+HTTP_IN_FLIGHT = Gauge("http_requests_in_flight", "HTTP requests being served.")
+
+JOBS_IN_FLIGHT = Gauge("render_jobs_in_flight", "Prompt jobs currently running.")
+JOBS = Counter("render_jobs_total", "Finished prompt jobs by outcome.", ("outcome",))
+OPERATION_SECONDS = Histogram("render_operation_seconds", "Wall time per editing operation.", ("operation",), RENDER_BUCKETS)
+FRAME_FPS = Histogram("render_frames_per_second", "Throughput of per-frame loops.", ("workers",), FPS_BUCKETS)
+
+AI_CALL_SECONDS = Histogram("ai_call_seconds", "Latency of AI backend calls.", ("call",), LATENCY_BUCKETS + (120, 300))
+AI_RETRIES = Counter("ai_retries_total", "AI calls retried after a transient error.", ("call",))
+AI_ERRORS = Counter("ai_errors_total", "AI call failures by status.", ("call", "status"))
+
+THREADPOOL_BUSY = Gauge("threadpool_busy_threads", "Worker threads in use by the API's blocking-call pool.")
+THREADPOOL_SIZE = Gauge("threadpool_max_threads", "Size of the API's blocking-call pool.")
+
+MONGO_CONNECTIONS = Gauge("mongo_pool_connections", "Open MongoDB connections.")
+MONGO_CHECKED_OUT = Gauge("mongo_pool_checked_out", "MongoDB connections currently checked out.")
+MONGO_CHECKOUT_FAILURES = Counter("mongo_pool_checkout_failures_total", "Failed MongoDB connection checkouts.", ("reason",))
+
+DISK_BYTES = Gauge("disk_usage_bytes", "Bytes used by a media directory.", ("dir",))
+DISK_FILES = Gauge("disk_files", "Files in a media directory.", ("dir",))
+DISK_FREE = Gauge("disk_free_bytes", "Free bytes on the volume holding a media directory.", ("dir",))
+
+
+def error_status(message):
+    """
+    Coarse status label for an AI error message.
+    """
+    for status in ("429", "503", "500", "400", "403", "404"):
+        if status in message:
+            return status
+    if "RESOURCE_EXHAUSTED" in message:
+        return "429"
+    if "UNAVAILABLE" in message:
+        return "503"
+    return "other"
+
+
+def watch_directories(dirs, interval=60):
+    """
+    Reports size, file count and free space of the given {label: path}
+    directories, re-walking them at most every `interval` seconds.
+    """
+    state = {"at": 0.0}
+
+    @add_collector
+    def collect_disk():
+        if time.monotonic() - state["at"] < interval:
+            return
+        state["at"] = time.monotonic()
+        for label, path in dirs.items():
+            total = files = 0
+            for root, _, names in os.walk(path):
+                for name in names:
+                    try:
+                        total += os.path.getsize(os.path.join(root, name))
+                        files += 1
+                    except OSError:
+                        continue
+            DISK_BYTES.set(total, dir=label)
+            DISK_FILES.set(files, dir=label)
+            if os.path.isdir(path):
+                DISK_FREE.set(shutil.disk_usage(path).free, dir=label)
@@ -0,0 +1,189 @@
+"""
+Cost-based ordering of an edit plan.
+
+build_operations() emits steps in a fixed order. optimize() estimates what
+each step costs on the video it will actually see (duration x megapixels x a
+per-operation factor) and swaps neighbouring steps that commute whenever the
+swap lowers the total, so length-reducing (speed) and pixel-reducing (crop)
+steps run ahead of per-frame work like background removal and watermark
+healing. Steps whose output is discarded (visual edits before an audio
+extraction) are dropped.
+
+Only pairs listed in COMMUTING are ever reordered; everything else keeps
+build_operations' order.
+"""
+import os
+
+from services import analysis
+from services.probe import probe
+
+PLAN_OPTIMIZER = os.environ.get("PLAN_OPTIMIZER", "1") == "1"
+
+# Relative cost per second of media: (factor, scales with "video" pixels or
+# "audio" only). 1.0 ~ one x264 encode pass of 1 MP video.
+OP_COSTS = {
+    "trim_video": (0.05, "video"),  # smart cut: mostly stream copy
+    "remove_silence": (1.0, "video"),
+    "remove_noise": (0.3, "audio"),
+    "add_captions": (1.0, "video"),
+    "resize_to_vertical": (1.0, "video"),
+    "resize_to_horizontal": (1.0, "video"),
+    "adjust_speed": (1.0, "video"),
+    "remove_watermark": (8.0, "video"),  # "heal" inpainting; other strategies ~1.0
+    "remove_background": (30.0, "video"),
+    "extract_audio": (0.05, "audio"),
+}
+
+# Unordered pairs giving the same output in either order. Per-frame visual
+# steps don't care how many frames there are or when they play (speed), the
+# background matte is computed per frame (crop), and audio-only steps don't
+# touch pixels. Watermark positions are relative to the uncropped frame, and
+# transcript-driven steps depend on the timeline, so neither moves past a
+# crop or speed change respectively.
+COMMUTING = {frozenset(pair) for pair in [
+    ("adjust_speed", "remove_background"),
+    ("adjust_speed", "remove_watermark"),
+    ("adjust_speed", "resize_to_vertical"),
+    ("adjust_speed", "resize_to_horizontal"),
+    ("resize_to_vertical", "remove_background"),
+    ("resize_to_horizontal", "remove_background"),
+    ("remove_silence", "remove_background"),
+    ("remove_silence", "remove_watermark"),
+    ("remove_noise", "remove_background"),
+    ("remove_noise", "remove_watermark"),
+    ("remove_noise", "resize_to_vertical"),
+    ("remove_noise", "resize_to_horizontal"),
+]}
+
+# Steps that only change the picture; pointless before extract_audio.
+VISUAL_ONLY_OPS = {"remove_background", "remove_watermark", "add_captions", "resize_to_vertical", "resize_to_horizontal"}
+
+DEFAULT_SECONDS = 60.0
+DEFAULT_SIZE = (1920, 1080)
+# Share of the timeline remove_silence is assumed to keep when the upload's
+# silence map isn't known yet.
+DEFAULT_SILENCE_KEEP = 0.85
+
+
+def _name(op):
+    return getattr(op, "func", op).__name__
+
+
+def _kwargs(op):
+    return getattr(op, "keywords", {}) or {}
+
+
+def describe(video_path=None, duration=None, width=None, height=None):
+    """
+    Starting state of the plan: duration, frame size and (if the upload's
+    silence map is cached) the share remove_silence will keep.
+    """
+    state = {"duration": DEFAULT_SECONDS, "width": DEFAULT_SIZE[0], "height": DEFAULT_SIZE[1], "silence_keep": DEFAULT_SILENCE_KEEP}
+    if video_path:
+        info = probe(video_path)
+        try:
+            state["duration"] = float(info.get("format", {}).get("duration", 0)) or state["duration"]
+        except (TypeError, ValueError):
+            pass
+        video = next((s for s in info.get("streams", []) if s.get("codec_type") == "video"), None)
+        if video:
+            state["width"], state["height"] = video.get("width") or state["width"], video.get("height") or state["height"]
+        silences = analysis.get(video_path, analysis.silence_key(*analysis.DEFAULT_SILENCE))
+        if silences and silences[1]:
+            silent = sum(e - s for s, e in silences[0])
+            state["silence_keep"] = max(0.0, 1.0 - silent / silences[1])
+    for key, value in (("duration", duration), ("width", width), ("height", height)):
+        if value:
+            state[key] = float(value)
+    return state
+
+
+def _apply(op, state):
+    name, kwargs = _name(op), _kwargs(op)
+    state = dict(state)
+    if name == "trim_video":
+        state["duration"] = max(0.0, state["duration"] - kwargs.get("start_trim", 0) - kwargs.get("end_trim", 0))
+    elif name == "remove_silence":
+        state["duration"] *= state["silence_keep"]
+        # Later steps see a timeline with the silence already gone
+        state["silence_keep"] = 1.0
+    elif name == "adjust_speed":
+        state["duration"] /= max(0.5, min(kwargs.get("speed", 1.5), 2.0))
+    elif name == "resize_to_vertical":
+        state["width"] = min(state["width"], state["height"] * 9 / 16)
+    elif name == "resize_to_horizontal":
+        state["height"] = min(state["height"], state["width"] * 9 / 16)
+    elif name == "extract_audio":
+        state["width"] = state["height"] = 0
+    return state
+
+
+def op_cost(op, state):
+    name = _name(op)
+    factor, scale = OP_COSTS.get(name, (1.0, "video"))
+    if name == "remove_watermark" and _kwargs(op).get("strategy", "heal") != "heal":
+        factor = 1.0
+    if scale == "audio":
+        return factor * state["duration"]
+    return factor * state["duration"] * max(state["width"] * state["height"] / 1e6, 0.01)
+
+
+def estimate(operations, state):
+    """
+    (total cost, per-step breakdown) of running operations in order.
+    """
+    total = 0.0
+    steps = []
+    for op in operations:
+        cost = op_cost(op, state)
+        total += cost
+        steps.append({
+            "operation": _name(op),
+            "cost": round(cost, 2),
+            "input_seconds": round(state["duration"], 2),
+            "input_size": [int(state["width"]), int(state["height"])],
+        })
+        state = _apply(op, state)
+    return total, steps
+
+
+def _commutes(a, b):
+    return frozenset((_name(a), _name(b))) in COMMUTING
+
+
+def optimize(operations, state):
+    """
+    Returns (operations, report): the cheapest equivalent order found by
+    swapping commuting neighbours, and a summary of both plans.
+    """
+    original_cost, _ = estimate(operations, state)
+    plan = list(operations)
+    dropped = []
+
+    if PLAN_OPTIMIZER:
+        if any(_name(op) == "extract_audio" for op in plan):
+            dropped = [_name(op) for op in plan if _name(op) in VISUAL_ONLY_OPS]
+            plan = [op for op in plan if _name(op) not in VISUAL_ONLY_OPS]
+
+        improved = True
+        while improved:
+            improved = False
+            for i in range(len(plan) - 1):
+                if not _commutes(plan[i], plan[i + 1]):
+                    continue
+                candidate = plan[:i] + [plan[i + 1], plan[i]] + plan[i + 2:]
+                if estimate(candidate, state)[0] < estimate(plan, state)[0] - 1e-6:
+                    plan = candidate
+                    improved = True
+
+    cost, steps = estimate(plan, state)
+    report = {
+        "requested": [_name(op) for op in operations],
+        "plan": [_name(op) for op in plan],
+        "dropped": dropped,
+        "steps": steps,
+        "estimated_cost": round(cost, 2),
+        "requested_cost": round(original_cost, 2),
+        "input": {"seconds": round(state["duration"], 2), "size": [int(state["width"]), int(state["height"])]},
+    }
+    return plan, report
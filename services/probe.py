@@ -0,0 +1,84 @@
+import json
+import subprocess
+
+from services import analysis, tracing
+
+# Descriptions of paths that must not be probed (FIFOs between piped steps).
+_known = {}
+
+
+def register(input_path, info):
+    """
+    Answers probe(input_path) with info until forget() is called.
+    """
+    _known[input_path] = info
+
+
+def forget(input_path):
+    _known.pop(input_path, None)
+
+
+def probe(input_path, cached=True):
+    """
+    Returns ffprobe's format/stream description of a media file as a dict
+    (empty if the file cannot be probed). Uploads analyzed on arrival are
+    answered from their sidecar.
+    """
+    if input_path in _known:
+        return _known[input_path]
+    if cached:
+        info = analysis.get(input_path, "probe")
+        if info:
+            return info
+    command = [
+        "ffprobe", "-v", "error",
+        "-print_format", "json",
+        "-show_format", "-show_streams",
+        input_path
+    ]
+    result = tracing.run(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+    if result.returncode != 0:
+        return {}
+    try:
+        return json.loads(result.stdout or "{}")
+    except ValueError:
+        return {}
+
+
+def get_duration(input_path):
+    """
+    Container duration in seconds, 0 if unknown.
+    """
+    try:
+        return float(probe(input_path).get("format", {}).get("duration", 0))
+    except (TypeError, ValueError):
+        return 0.0
+
+
+def get_keyframes(input_path, cached=True):
+    """
+    Presentation timestamps (seconds) of every keyframe in the first video
+    stream. Reads packet flags only, so no frames are decoded.
+    """
+    if cached:
+        keyframes = analysis.get(input_path, "keyframes")
+        if keyframes is not None:
+            return keyframes
+    command = [
+        "ffprobe", "-v", "error",
+        "-select_streams", "v:0",
+        "-show_entries", "packet=pts_time,flags",
+        "-of", "csv=p=0",
+        input_path
+    ]
+    result = tracing.run(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+    keyframes = []
+    for line in result.stdout.splitlines():
+        parts = line.strip().split(",")
+        if len(parts) < 2 or "K" not in parts[1]:
+            continue
+        try:
+            keyframes.append(float(parts[0]))
+        except ValueError:
+            continue
+    return sorted(keyframes)
@@ -1,15 +1,79 @@
-from services.video import remove_silence, add_captions, resize_to_vertical, resize_to_horizontal, adjust_speed, trim_video, extract_audio, summarize_video, generate_new_video, remove_noise, remove_watermark
+from services.video import remove_silence, add_captions, resize_to_vertical, resize_to_horizontal, adjust_speed, trim_video, extract_audio, summarize_video, generate_new_video, remove_noise, remove_watermark, remove_background, copy_media, ensure_faststart, make_proxy
 import os
 import shutil
 import re
 from functools import partial
 import uuid
-from services import ai_service
+from services import ai_service, analysis, metrics, planner, retention, scratch, tracing
+from services.probe import get_duration
+from services.render import input_analyses, render
+from services.transcribe import choose_backend
 
-def handle_prompt(prompt_text: str, video_path: str = None, final_output_path: str = None) -> str:
+# Start the Gemini upload of media a prompt will likely need while the intent
+# call is in flight; cancelled once the intent says otherwise.
+GEMINI_PREFETCH = os.environ.get("GEMINI_PREFETCH", "1") == "1"
+SUMMARY_WORDS = ("summary", "summarize", "summarise")
+TRANSCRIPT_WORDS = ("caption", "subtitle", "transcri", "translat", "noise", "clean audio")
+# Operations whose analysis may transcribe the upload's own audio proxy.
+TRANSCRIPT_OPS = {"add_captions", "remove_noise"}
+
+def handle_prompt(prompt_text: str, video_path: str = None, final_output_path: str = None, profile: str = None,
+                  intent: dict = None, preview: bool = False, preview_seconds: float = None, job_id: str = None,
+                  user: str = None) -> str:
+    """
+    Runs a prompt as one traced job (traces/<job_id>.jsonl, see services/tracing.py).
+    `user` is charged for any video generation (services/quota.py).
+    """
+    input_bytes = os.path.getsize(video_path) if video_path and os.path.isfile(video_path) else None
+    metrics.JOBS_IN_FLIGHT.inc()
+    outcome = "error"
+    result = None
+    try:
+        with retention.active(job_id), scratch.job(job_id, final_output_path), \
+                tracing.job(job_id, prompt=prompt_text[:200], input_bytes=input_bytes, profile=profile, preview=preview):
+            result = _run_prompt(prompt_text, video_path, final_output_path, profile, intent, preview, preview_seconds, user)
+        outcome = "ok"
+        return result
+    finally:
+        # Step files, proxies and the like, whether the job finished or failed
+        retention.cleanup_intermediates(final_output_path, keep=[result])
+        metrics.JOBS_IN_FLIGHT.dec()
+        metrics.JOBS.inc(outcome=outcome)
+        if video_path and os.path.isfile(video_path):
+            _cancel_prefetch(video_path)
+
+def _start_prefetch(p, video_path, preview):
+    """
+    Guesses from the prompt text which Gemini upload the job will need.
+    """
+    if not GEMINI_PREFETCH:
+        return
+    if any(w in p for w in SUMMARY_WORDS):
+        ai_service.prefetch_upload(video_path)
+    if not preview and any(w in p for w in TRANSCRIPT_WORDS):
+        # Previews transcribe their proxy, not the upload's audio
+        audio_path = analysis.audio_proxy_path(video_path)
+
+        def audio_goes_to_gemini():
+            analysis.wait_for_upload_analysis(video_path)
+            return os.path.exists(audio_path) and choose_backend(audio_path) == "gemini"
+
+        ai_service.prefetch_upload(audio_path, audio_goes_to_gemini)
+
+def _cancel_prefetch(video_path, keep=()):
+    for path in (video_path, analysis.audio_proxy_path(video_path)):
+        if path not in keep:
+            ai_service.cancel_prefetch(path)
+
+def _run_prompt(prompt_text, video_path, final_output_path, profile, intent, preview, preview_seconds, user=None):
     """
     Analyzes the prompt and routes to the appropriate service.
     Now uses Gemini for robust natural language understanding of user instructions.
+    `profile` names the encode tier (see services/encoding.py) used by every step.
+
+    preview=True renders the same plan on a low-resolution proxy (optionally only
+    the first preview_seconds); a later call with the stored `intent` finalizes
+    at full quality and reuses the preview's cached analysis.
     """
     p = prompt_text.lower()
     print(f"DEBUG: handle_prompt called. video_path={repr(video_path)}")
@@ -19,8 +83,14 @@ def handle_prompt(prompt_text: str, video_path: str = None, final_output_path: s
         video_path = None
 
     # Step 1: Use Gemini to extract intent and parameters (Handles misspellings/extra words)
-    intent = ai_service.extract_intent_gemini(prompt_text)
-    print(f"DEBUG: AI Intent Extracted: {intent}")
+    if intent is None and video_path:
+        _start_prefetch(p, video_path, preview)
+    if intent is None:
+        intent = ai_service.extract_intent_gemini(prompt_text)
+        print(f"DEBUG: AI Intent Extracted: {intent}")
+        if video_path:
+            # Remembered so a preview can be finalized without re-asking Gemini
+            analysis.put(video_path, "plan", {"prompt": prompt_text, "intent": intent})
 
     # Extract detected operation and parameters
     op = intent.get("operation") if intent else None
@@ -35,11 +105,12 @@ def handle_prompt(prompt_text: str, video_path: str = None, final_output_path: s
         # Extract duration from AI detected params
         duration = params.get("duration", 8)
         
-        output_filename = f"generated_{uuid.uuid4()}.mp4"
-        output_path = os.path.join("static", "outputs", output_filename)
+        generation_id = str(uuid.uuid4())
+        output_filename = f"generated_{generation_id}.mp4"
+        output_path = os.path.join(retention.shard_dir(os.path.join("static", "outputs"), generation_id), output_filename)
         
         print(f"DEBUG: Routing to Video Generation. Model: {model_version}, Duration: {duration}s")
-        return ai_service.generate_video_veo(prompt_text, output_path, model=model_version, duration=duration)
+        return ai_service.generate_video_veo(prompt_text, output_path, model=model_version, duration=duration, user=user)
 
     # 2. Video Editing Operations
     if not final_output_path:
@@ -49,8 +120,83 @@ def handle_prompt(prompt_text: str, video_path: str = None, final_output_path: s
     if op == "summarize" or any(k in p for k in ["summary", "summarize"]):
         base, _ = os.path.splitext(final_output_path)
         summary_path = base + ".txt"
+        _cancel_prefetch(video_path, keep=[video_path])
         return summarize_video(video_path, summary_path, p)
 
+    operations = build_operations(prompt_text, intent)
+
+    # Fallback: Just copy if no operations detected
+    if not operations:
+        _cancel_prefetch(video_path)
+        return copy_media(video_path, final_output_path)
+
+    # Upload analysis started when the file landed; let it finish so the
+    # operations read the sidecar instead of probing again.
+    with tracing.span("upload_analysis_wait"):
+        analysis.wait_for_upload_analysis(video_path)
+
+    # Cheapest equivalent order (e.g. speed-up and crop before background removal)
+    operations, plan = planner.optimize(operations, planner.describe(video_path))
+    if plan["plan"] != plan["requested"]:
+        tracing.annotate(requested_plan=",".join(plan["requested"]), requested_cost=plan["requested_cost"])
+    tracing.annotate(input_duration=get_duration(video_path), operations=len(operations),
+                     plan=",".join(plan["plan"]), plan_cost=plan["estimated_cost"])
+
+    # The order is final: keep the audio upload only if a step transcribes the
+    # upload itself (previews transcribe their proxy instead)
+    if not preview and input_analyses(operations) & TRANSCRIPT_OPS:
+        _cancel_prefetch(video_path, keep=[analysis.audio_proxy_path(video_path)])
+    else:
+        _cancel_prefetch(video_path)
+
+    analysis_source = video_path
+    if preview:
+        # Same plan, low-resolution proxy, fastest encode tier
+        base, _ = os.path.splitext(final_output_path)
+        video_path = make_proxy(video_path, f"{base}_proxy.mp4", max_seconds=preview_seconds)
+        profile = "preview"
+        if preview_seconds:
+            # Analysis of a shortened timeline is not valid for the full render
+            analysis_source = None
+
+    # Every step encodes with the job's tier
+    operations = [partial(op_func, profile=profile) for op_func in operations]
+
+    # Execute operations (segmented across processes for long inputs)
+    final_path = render(operations, video_path, final_output_path, analysis_source=analysis_source)
+    # Safety net for outputs written outside FFmpeg (e.g. merge fallbacks)
+    return ensure_faststart(final_path)
+
+def plan_prompt(prompt_text: str, video_path: str = None, intent: dict = None,
+                duration: float = None, width: int = None, height: int = None) -> dict:
+    """
+    Dry run: the intent, the operation order the planner picks and its
+    estimated cost, without rendering anything. Without a video the input is
+    described by duration/width/height (defaults: 60s of 1080p).
+    """
+    if intent is None:
+        intent = ai_service.extract_intent_gemini(prompt_text)
+    op = intent.get("operation") if intent else None
+    p = prompt_text.lower()
+
+    if op == "generate_video":
+        return {"intent": intent, "kind": "generate"}
+    if op == "summarize" or any(k in p for k in ["summary", "summarize"]):
+        return {"intent": intent, "kind": "summarize"}
+
+    operations = build_operations(prompt_text, intent)
+    state = planner.describe(video_path, duration=duration, width=width, height=height)
+    _, report = planner.optimize(operations, state)
+    return dict(report, intent=intent, kind="edit")
+
+def build_operations(prompt_text: str, intent: dict = None) -> list:
+    """
+    Turns the prompt and its extracted intent into the ordered list of edit steps.
+    """
+    p = prompt_text.lower()
+    op = intent.get("operation") if intent else None
+    params = intent.get("params", {}) if intent else {}
+
     operations = []
 
     # Trim Logic (Prefer AI extracted values)
@@ -119,20 +265,4 @@ def handle_prompt(prompt_text: str, video_path: str = None, final_output_path: s
     if op == "extract_audio" or any(k in p for k in ["audio", "mp3", "extract"]):
         operations.append(extract_audio)
 
-    # Fallback: Just copy if no operations detected
-    if not operations:
-        shutil.copy(video_path, final_output_path)
-        return final_output_path
-
-    # Execute operations sequentially
-    current_input = video_path
-    for i, op_func in enumerate(operations):
-        if i == len(operations) - 1:
-            output = final_output_path
-        else:
-            base, ext = os.path.splitext(final_output_path)
-            output = f"{base}_step{i}{ext}"
-        
-        current_input = op_func(current_input, output)
-
-    return current_input
+    return operations
@@ -0,0 +1,209 @@
+"""
+Daily Veo quota with reserve / commit / release semantics, safe across
+uvicorn workers on one host.
+
+    reservation, seconds = quota.reserve(12, user="a@b.c", minimum=8)
+    ...                                 # call Veo for at most `seconds`
+    quota.commit(reservation, 15)       # or quota.release(reservation)
+
+State lives in QUOTA_PATH and every change happens under an exclusive file
+lock (fcntl / msvcrt) with an atomic replace. Used and reserved seconds are
+kept as running totals per scope, so a check never scans past jobs.
+Reservations not committed within QUOTA_RESERVATION_TTL (a crashed worker)
+are dropped on the next write.
+
+    python -m services.quota
+"""
+import json
+import os
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from datetime import datetime
+
+from services import metrics
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+QUOTA_PATH = os.environ.get("QUOTA_PATH", os.path.join(BASE_DIR, "quota_usage.json"))
+# Generated seconds per day across all users, and per user (0 = no per-user cap).
+QUOTA_DAILY_SECONDS = float(os.environ.get("QUOTA_DAILY_SECONDS", "30"))
+QUOTA_USER_DAILY_SECONDS = float(os.environ.get("QUOTA_USER_DAILY_SECONDS", "0"))
+QUOTA_RESERVATION_TTL = float(os.environ.get("QUOTA_RESERVATION_TTL", "7200"))
+
+DENIED = metrics.Counter("quota_denied_total", "Quota reservations refused, by exhausted scope.", ("scope",))
+
+_thread_lock = threading.Lock()
+
+
+class QuotaExceeded(Exception):
+    pass
+
+
+@contextmanager
+def _locked():
+    """
+    Exclusive lock held by one thread of one process at a time.
+    """
+    with _thread_lock, open(f"{QUOTA_PATH}.lock", "a+b") as f:
+        if fcntl:
+            fcntl.flock(f, fcntl.LOCK_EX)
+        else:
+            f.seek(0)
+            msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+        try:
+            yield
+        finally:
+            if fcntl:
+                fcntl.flock(f, fcntl.LOCK_UN)
+            else:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+def _today():
+    return str(datetime.now().date())
+
+
+def _empty():
+    return {"date": _today(), "used": 0.0, "reserved": 0.0, "users": {}, "reservations": {}}
+
+
+def _read():
+    try:
+        with open(QUOTA_PATH, "r", encoding="utf-8") as f:
+            state = json.load(f)
+    except (OSError, ValueError):
+        return _empty()
+    if "reservations" not in state:
+        # Pre-reservation format: {"date": ..., "seconds_used": ...}
+        state = dict(_empty(), date=state.get("date", _today()), used=float(state.get("seconds_used", 0)))
+    if state["date"] != _today():
+        # New day: usage resets, open reservations carry over
+        state.update(date=_today(), used=0.0)
+        for scope in state["users"].values():
+            scope["used"] = 0.0
+    return state
+
+
+def _write(state):
+    temp_path = f"{QUOTA_PATH}.{os.getpid()}.tmp"
+    with open(temp_path, "w", encoding="utf-8") as f:
+        json.dump(state, f)
+    os.replace(temp_path, QUOTA_PATH)
+
+
+def _user(state, user):
+    return state["users"].setdefault(user, {"used": 0.0, "reserved": 0.0})
+
+
+def _drop(state, reservation_id):
+    entry = state["reservations"].pop(reservation_id, None)
+    if entry is None:
+        return None
+    state["reserved"] = max(0.0, state["reserved"] - entry["seconds"])
+    if entry["user"]:
+        scope = _user(state, entry["user"])
+        scope["reserved"] = max(0.0, scope["reserved"] - entry["seconds"])
+    return entry
+
+
+def _expire(state, now):
+    for reservation_id, entry in list(state["reservations"].items()):
+        if now - entry["at"] > QUOTA_RESERVATION_TTL:
+            _drop(state, reservation_id)
+
+
+def _available(state, user):
+    available = QUOTA_DAILY_SECONDS - state["used"] - state["reserved"]
+    scope = "global"
+    if user and QUOTA_USER_DAILY_SECONDS > 0:
+        user_state = _user(state, user)
+        user_available = QUOTA_USER_DAILY_SECONDS - user_state["used"] - user_state["reserved"]
+        if user_available < available:
+            available, scope = user_available, "user"
+    return max(0.0, available), scope
+
+
+def reserve(seconds, user=None, minimum=None):
+    """
+    Holds up to `seconds` of today's budget (global and, if set, the user's).
+    Grants less when less is left, as long as at least `minimum` (default
+    `seconds`) fits; otherwise raises QuotaExceeded. Returns
+    (reservation_id, granted_seconds).
+    """
+    minimum = seconds if minimum is None else minimum
+    with _locked():
+        state = _read()
+        _expire(state, time.time())
+        available, scope = _available(state, user)
+        if available < minimum:
+            DENIED.inc(scope=scope)
+            _write(state)
+            if scope == "user":
+                raise QuotaExceeded(f"Daily Quota Exceeded: {available:.0f}s of your {QUOTA_USER_DAILY_SECONDS:.0f}s daily video budget is left. Please wait until tomorrow.")
+            raise QuotaExceeded(f"Local Quota Exceeded: {state['used']:.0f}s of the {QUOTA_DAILY_SECONDS:.0f}s daily safety limit are used ({state['reserved']:.0f}s more in progress). Please wait until tomorrow or increase QUOTA_DAILY_SECONDS.")
+        granted = min(seconds, available)
+        reservation_id = uuid.uuid4().hex
+        state["reservations"][reservation_id] = {"seconds": granted, "user": user, "at": time.time()}
+        state["reserved"] += granted
+        if user:
+            _user(state, user)["reserved"] += granted
+        _write(state)
+    return reservation_id, granted
+
+
+def commit(reservation_id, seconds):
+    """
+    Charges the seconds actually generated and frees the rest of the
+    reservation.
+    """
+    with _locked():
+        state = _read()
+        entry = _drop(state, reservation_id)
+        user = entry["user"] if entry else None
+        state["used"] += seconds
+        if user:
+            _user(state, user)["used"] += seconds
+        _write(state)
+
+
+def release(reservation_id):
+    """
+    Returns a reservation unused (the generation failed).
+    """
+    with _locked():
+        state = _read()
+        _drop(state, reservation_id)
+        _write(state)
+
+
+def usage(user=None):
+    """
+    {"used", "reserved", "limit"} for the global budget, or for one user.
+    """
+    with _locked():
+        state = _read()
+    if user:
+        scope = state["users"].get(user, {"used": 0.0, "reserved": 0.0})
+        return {"used": scope["used"], "reserved": scope["reserved"], "limit": QUOTA_USER_DAILY_SECONDS or None}
+    return {"used": state["used"], "reserved": state["reserved"], "limit": QUOTA_DAILY_SECONDS}
+
+
+def main():
+    total = usage()
+    print(f"{_today()}: {total['used']:.0f}s used, {total['reserved']:.0f}s reserved of {total['limit']:.0f}s")
+    with _locked():
+        state = _read()
+    for user, scope in sorted(state["users"].items()):
+        print(f"  {user}: {scope['used']:.0f}s used, {scope['reserved']:.0f}s reserved")
+
+
+if __name__ == "__main__":
+    main()
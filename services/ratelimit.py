@@ -0,0 +1,254 @@
+"""
+Process-wide guards for Gemini calls.
+
+- Token bucket per model (GEMINI_RPM, GEMINI_BURST): callers wait briefly
+  for a token instead of all firing at once. If the next token is more than
+  GEMINI_MAX_WAIT away, the call fails fast with RateLimited (retry_after
+  set) rather than holding a threadpool thread.
+- Circuit breaker per model: GEMINI_BREAKER_THRESHOLD consecutive quota or
+  availability errors open it for GEMINI_BREAKER_COOLDOWN seconds. While it
+  is open, generate() routes to the fallback model or fails fast with
+  CircuitOpen, so callers stop retrying and use their own fallbacks (e.g.
+  local Whisper) instead of sleeping in threadpool threads.
+- Single-flight: identical concurrent requests (same media fingerprint and
+  prompt) share one in-flight call.
+"""
+import copy
+import hashlib
+import itertools
+import os
+import threading
+import time
+from concurrent.futures import Future
+
+from services import metrics
+
+GEMINI_RPM = float(os.environ.get("GEMINI_RPM", "60"))
+GEMINI_BURST = float(os.environ.get("GEMINI_BURST", "10"))
+GEMINI_MAX_WAIT = float(os.environ.get("GEMINI_MAX_WAIT", "2"))
+GEMINI_BREAKER_THRESHOLD = int(os.environ.get("GEMINI_BREAKER_THRESHOLD", "5"))
+GEMINI_BREAKER_COOLDOWN = float(os.environ.get("GEMINI_BREAKER_COOLDOWN", "60"))
+# Where calls to a model go while its circuit is open ("" = nowhere).
+FALLBACK_MODELS = {
+    "gemini-2.5-flash": [m for m in os.environ.get("GEMINI_FALLBACK_MODEL", "gemini-2.5-flash-lite").split(",") if m],
+}
+
+FINGERPRINT_BYTES = 1024 * 1024
+
+LIMIT_WAIT = metrics.Histogram("gemini_rate_limit_wait_seconds", "Time spent waiting for a client-side rate-limit token.", ("model",))
+BREAKER_OPEN = metrics.Gauge("gemini_circuit_open", "1 while a model's circuit breaker is open.", ("model",))
+FALLBACKS = metrics.Counter("gemini_fallback_calls_total", "Calls routed to a fallback model.", ("model", "fallback"))
+COALESCED = metrics.Counter("gemini_coalesced_calls_total", "Calls that shared another identical in-flight call.", ("kind",))
+
+
+class RateLimited(Exception):
+    def __init__(self, message, retry_after=0.0):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class CircuitOpen(Exception):
+    def __init__(self, message, retry_after=0.0):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+def is_overload(error):
+    message = str(error)
+    return any(s in message for s in ("429", "RESOURCE_EXHAUSTED", "503", "UNAVAILABLE"))
+
+
+class TokenBucket:
+    def __init__(self, rate_per_minute, burst):
+        self.rate = rate_per_minute / 60.0
+        self.capacity = max(1.0, burst)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def _reserve(self):
+        """
+        Takes a token (possibly going negative) and returns how long the
+        caller must wait for it.
+        """
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            self.tokens -= 1
+            return 0.0 if self.tokens >= 0 else -self.tokens / self.rate
+
+    def _refund(self):
+        with self.lock:
+            self.tokens = min(self.capacity, self.tokens + 1)
+
+    def acquire(self, max_wait=None):
+        if self.rate <= 0:
+            return 0.0
+        wait = self._reserve()
+        if max_wait is not None and wait > max_wait:
+            self._refund()
+            raise RateLimited(f"Client-side rate limit: retry in {wait:.0f}s", retry_after=wait)
+        if wait > 0:
+            time.sleep(wait)
+        return wait
+
+
+class CircuitBreaker:
+    def __init__(self, model):
+        self.model = model
+        self.failures = 0
+        self.open_until = 0.0
+        self.probing = False
+        self.lock = threading.Lock()
+
+    def allow(self):
+        """
+        True if a call may go out: circuit closed, or cooled down and no other
+        trial call is in flight (half-open).
+        """
+        with self.lock:
+            if self.open_until == 0.0:
+                return True
+            if time.monotonic() < self.open_until or self.probing:
+                return False
+            self.probing = True
+            return True
+
+    def retry_in(self):
+        with self.lock:
+            return max(0.0, self.open_until - time.monotonic())
+
+    def record_success(self):
+        with self.lock:
+            self.failures = 0
+            self.open_until = 0.0
+            self.probing = False
+        BREAKER_OPEN.set(0, model=self.model)
+
+    def record_failure(self, error):
+        if not is_overload(error):
+            with self.lock:
+                self.probing = False
+            return
+        with self.lock:
+            self.failures += 1
+            opened = self.probing or self.failures >= GEMINI_BREAKER_THRESHOLD
+            self.probing = False
+            if opened:
+                self.open_until = time.monotonic() + GEMINI_BREAKER_COOLDOWN
+        if opened:
+            print(f"Circuit opened for {self.model} for {GEMINI_BREAKER_COOLDOWN:.0f}s after repeated overload errors")
+            BREAKER_OPEN.set(1, model=self.model)
+
+
+_lock = threading.Lock()
+_buckets = {}
+_breakers = {}
+_inflight = {}
+
+
+def bucket(model):
+    with _lock:
+        if model not in _buckets:
+            _buckets[model] = TokenBucket(GEMINI_RPM, GEMINI_BURST)
+        return _buckets[model]
+
+
+def breaker(model):
+    with _lock:
+        if model not in _breakers:
+            _breakers[model] = CircuitBreaker(model)
+        return _breakers[model]
+
+
+def generate(client, model, stream=False, **kwargs):
+    """
+    client.models.generate_content under the model's rate limit and circuit
+    breaker, falling back to the next model while a circuit is open or the
+    call hits a quota error. stream=True uses generate_content_stream and
+    returns an iterator of chunks; the first chunk is fetched here, so quota
+    errors still fall back.
+    """
+    candidates = [model] + FALLBACK_MODELS.get(model, [])
+    last_error = None
+    for candidate in candidates:
+        guard = breaker(candidate)
+        if not guard.allow():
+            continue
+        try:
+            waited = bucket(candidate).acquire(GEMINI_MAX_WAIT)
+        except RateLimited as e:
+            with guard.lock:
+                guard.probing = False
+            last_error = e
+            continue
+        LIMIT_WAIT.observe(waited, model=candidate)
+        if candidate != model:
+            FALLBACKS.inc(model=model, fallback=candidate)
+        try:
+            if stream:
+                chunks = iter(client.models.generate_content_stream(model=candidate, **kwargs))
+                response = itertools.chain([next(chunks)], chunks)
+            else:
+                response = client.models.generate_content(model=candidate, **kwargs)
+        except StopIteration:
+            response = iter(())
+        except Exception as e:
+            guard.record_failure(e)
+            if is_overload(e) and candidate != candidates[-1]:
+                last_error = e
+                continue
+            raise
+        guard.record_success()
+        return response
+    if last_error is not None:
+        raise last_error
+    retry_in = breaker(model).retry_in()
+    raise CircuitOpen(f"Circuit open for {model}: Gemini is over quota, retry in {retry_in:.0f}s", retry_after=retry_in)
+
+
+def media_fingerprint(path):
+    """
+    Cheap content fingerprint: size plus the first and last MiB.
+    """
+    digest = hashlib.sha1()
+    size = os.path.getsize(path)
+    digest.update(str(size).encode())
+    with open(path, "rb") as f:
+        digest.update(f.read(FINGERPRINT_BYTES))
+        if size > FINGERPRINT_BYTES:
+            f.seek(max(FINGERPRINT_BYTES, size - FINGERPRINT_BYTES))
+            digest.update(f.read(FINGERPRINT_BYTES))
+    return digest.hexdigest()
+
+
+def request_key(kind, media_path=None, *parts):
+    key = [kind, media_fingerprint(media_path) if media_path else ""]
+    key += [str(p) for p in parts]
+    return hashlib.sha1("\0".join(key).encode("utf-8")).hexdigest()
+
+
+def single_flight(key, fn, *args, kind="call"):
+    """
+    Runs fn(*args) unless an identical call (same key) is already running, in
+    which case its result (or exception) is shared.
+    """
+    with _lock:
+        future = _inflight.get(key)
+        leader = future is None
+        if leader:
+            future = _inflight[key] = Future()
+    if not leader:
+        COALESCED.inc(kind=kind)
+        return copy.deepcopy(future.result())
+    try:
+        result = fn(*args)
+        future.set_result(result)
+        return result
+    except BaseException as e:
+        future.set_exception(e)
+        raise
+    finally:
+        with _lock:
+            _inflight.pop(key, None)
@@ -0,0 +1,712 @@
+import contextvars
+import hashlib
+import multiprocessing
+import os
+import re
+import shutil
+import tempfile
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+from functools import partial
+
+from services import analysis, metrics, probe, retention, scratch, tracing
+from services.encoding import audio_args, container_args
+from services.frames import FRAME_WORKERS
+from services.streams import plan_streams, stream_info
+from services.transcribe import transcribe_srt
+from services.video import concat_files, detect_silence, get_speech_intervals, write_concat_list
+
+# Segmented render: long inputs are split at keyframes and each chunk runs the
+# operation chain in its own process.
+SEGMENTED_RENDER = os.environ.get("SEGMENTED_RENDER", "1") == "1"
+SEGMENT_MIN_DURATION = float(os.environ.get("SEGMENT_MIN_DURATION", "120"))
+SEGMENT_SECONDS = float(os.environ.get("SEGMENT_SECONDS", "30"))
+SEGMENT_WORKERS = int(os.environ.get("SEGMENT_WORKERS", "0")) or (os.cpu_count() or 1)
+
+# Operations that give the same result whether run on the whole video or on
+# independent chunks (given precomputed global context where needed).
+SEGMENTABLE_OPS = {
+    "remove_silence", "remove_noise", "add_captions",
+    "remove_watermark", "remove_background",
+    "resize_to_vertical", "resize_to_horizontal", "adjust_speed",
+}
+# Chunk-safe operations that need whole-timeline analysis, computed once up front.
+GLOBAL_CONTEXT_OPS = {"remove_silence", "remove_noise", "add_captions"}
+# Operations that change the timeline, invalidating analysis done on their input.
+RETIMING_OPS = {"trim_video", "remove_silence", "adjust_speed"}
+# Per-frame operations that spin up their own thread pool.
+FRAME_OPS = {"remove_watermark", "remove_background"}
+# Keyword through which each context op accepts precomputed analysis.
+ANALYSIS_KWARGS = {
+    "remove_silence": "silences",
+    "remove_noise": "intervals",
+    "add_captions": "srt_content",
+}
+# Keywords that never affect an operation's timeline.
+NON_TIMELINE_KWARGS = {"silences", "intervals", "srt_content", "profile", "workers", "mode"}
+# Single-FFmpeg-pass operations that can write to / read from a FIFO. Consumers
+# must not seek or analyze their input; their stream info is predicted.
+PIPE_PRODUCERS = {
+    "remove_silence", "remove_noise", "add_captions",
+    "resize_to_vertical", "resize_to_horizontal", "adjust_speed",
+}
+PIPE_CONSUMERS = {"resize_to_vertical", "resize_to_horizontal", "adjust_speed"}
+# Encoder output codec names, for predicting what a producer writes.
+ENCODED_CODECS = {"video": "h264", "audio": "aac"}
+# Plan as a dependency graph: each op's analysis (transcript, speech
+# intervals, silence map) starts as soon as the step it reads is done and runs
+# beside the frame steps; the op that consumes it (e.g. the caption burn-in)
+# joins it.
+DAG_RENDER = os.environ.get("DAG_RENDER", "1") == "1"
+ANALYSIS_WORKERS = int(os.environ.get("RENDER_ANALYSIS_WORKERS", "4"))
+# Steps after which analysis must be redone: they change the timeline or the
+# audio. Everything else (crops, frame edits, burn-ins) leaves it valid.
+ANALYSIS_BARRIER_OPS = RETIMING_OPS | {"remove_noise", "extract_audio"}
+
+_analysis_executor = ThreadPoolExecutor(max_workers=ANALYSIS_WORKERS, thread_name_prefix="render-analysis")
+
+# One chunk pool for every job. Its workers are started with forkserver (spawn
+# where that's unavailable), never forked from this threaded server process.
+_chunk_pool = None
+_chunk_pool_lock = threading.Lock()
+
+
+def op_name(op):
+    return getattr(op, "func", op).__name__
+
+
+def _intermediate_path(output_path, suffix):
+    """
+    Path for an intermediate beside output_path. Intermediates of HLS outputs
+    are plain MP4; only the final step writes the playlist.
+    """
+    base, ext = os.path.splitext(output_path)
+    if ext.lower() == ".m3u8":
+        ext = ".mp4"
+    return f"{base}_{suffix}{ext}"
+
+
+def _timeline_key(previous_ops):
+    """
+    Identifies the timeline an operation sees: the retiming steps (with their
+    parameters) applied before it. A 360p proxy and the full-resolution source
+    share keys, so analysis done in a preview is valid for the final render.
+    """
+    parts = []
+    for op in previous_ops:
+        name = op_name(op)
+        if name in RETIMING_OPS:
+            kwargs = {k: v for k, v in (getattr(op, "keywords", {}) or {}).items() if k not in NON_TIMELINE_KWARGS}
+            parts.append(f"{name}{sorted(kwargs.items())}")
+    return hashlib.sha1("|".join(parts).encode("utf-8")).hexdigest()[:12]
+
+
+def _analysis_key(op):
+    name = op_name(op)
+    kwargs = getattr(op, "keywords", {}) or {}
+    if name == "remove_silence":
+        return f"silences:{kwargs.get('threshold', '-30dB')}:{kwargs.get('min_silence_len', 0.5)}"
+    if name == "remove_noise":
+        return "speech_intervals"
+    return f"srt:{kwargs.get('target_language') or 'original'}"
+
+
+def _needs_analysis(op):
+    kwarg = ANALYSIS_KWARGS.get(op_name(op))
+    return kwarg is not None and (getattr(op, "keywords", {}) or {}).get(kwarg) is None
+
+
+def _compute_analysis(op, input_path):
+    name = op_name(op)
+    kwargs = getattr(op, "keywords", {}) or {}
+    if name == "remove_silence":
+        silences, _ = detect_silence(
+            input_path,
+            kwargs.get("threshold", "-30dB"),
+            kwargs.get("min_silence_len", 0.5)
+        )
+        return silences
+    if name == "remove_noise":
+        return get_speech_intervals(input_path)
+    srt_content = transcribe_srt(analysis.audio_source(input_path), kwargs.get("target_language"))
+    if srt_content.startswith("Error"):
+        raise Exception(f"Caption Generation Failed: {srt_content}")
+    return srt_content
+
+
+def analyze(op, input_path, analysis_source=None, previous_ops=()):
+    """
+    Whole-timeline analysis a context op needs (silences, speech intervals or
+    SRT). With analysis_source set, results are shared through that source's
+    analysis cache, e.g. between a preview and its finalize.
+    """
+    with tracing.span(f"analysis.{op_name(op)}"):
+        cache_key = None
+        if analysis_source:
+            cache_key = f"{_analysis_key(op)}@{_timeline_key(previous_ops)}"
+            cached = analysis.get(analysis_source, cache_key)
+            if cached is not None:
+                print(f"DEBUG: Reusing cached analysis '{cache_key}'")
+                tracing.annotate(cached=True)
+                return cached
+
+        value = _compute_analysis(op, input_path)
+        if cache_key:
+            analysis.put(analysis_source, cache_key, value)
+        return value
+
+
+def _analysis_inputs(operations):
+    """
+    {op index: index of the step whose output it analyzes} for every op that
+    needs analysis; -1 is the chain's input. That step is the last earlier
+    barrier op, so the analysis can run while the steps after it do.
+    """
+    inputs = {}
+    source = -1
+    for i, op in enumerate(operations):
+        if _needs_analysis(op):
+            inputs[i] = source
+        if op_name(op) in ANALYSIS_BARRIER_OPS:
+            source = i
+    return inputs
+
+
+def input_analyses(operations):
+    """
+    Names of the ops whose whole-timeline analysis reads the chain's input
+    itself rather than an intermediate step (see _analysis_inputs).
+    """
+    if not DAG_RENDER:
+        return {op_name(operations[0])} if operations and _needs_analysis(operations[0]) else set()
+    return {op_name(operations[i]) for i, source in _analysis_inputs(operations).items() if source == -1}
+
+
+def _submit_analysis(op, input_path, analysis_source=None, previous_ops=()):
+    """
+    analyze() on the analysis pool, inside the caller's trace and scratch
+    space. Returns (future, args) for _join_analysis.
+    """
+    args = (op, input_path, analysis_source, list(previous_ops))
+    return _analysis_executor.submit(contextvars.copy_context().run, analyze, *args), args
+
+
+def _join_analysis(pending):
+    future, args = pending
+    if future.cancel():
+        # Pool busy with other jobs: don't queue behind them, run it here
+        return analyze(*args)
+    with tracing.span("analysis_join", operation=op_name(args[0])):
+        return future.result()
+
+
+def _settle(pending):
+    """
+    Cancels queued analyses and waits for running ones, so none outlives its
+    job (or the files it reads).
+    """
+    running = [future for future, _ in pending if not future.cancel()]
+    wait(running)
+
+
+def render(operations, input_path, output_path, analysis_source=None):
+    """
+    Runs an operation chain, switching to segmented rendering for long inputs.
+    Returns the path of the final output. analysis_source names the original
+    upload whose analysis cache may be used.
+    """
+    if SEGMENTED_RENDER and SEGMENT_WORKERS > 1 and any(op_name(op) in SEGMENTABLE_OPS for op in operations):
+        duration = probe.get_duration(input_path)
+        if duration >= SEGMENT_MIN_DURATION:
+            print(f"DEBUG: Segmented render ({duration:.1f}s input, {SEGMENT_WORKERS} workers)")
+            return render_segmented(operations, input_path, output_path, analysis_source=analysis_source)
+    return render_serial(operations, input_path, output_path, analysis_source=analysis_source)
+
+
+def _scratch_output(output_path, suffix, input_path, space, reserved):
+    """
+    Intermediate path for one step: in the job's scratch space when there is
+    one (RAM while it fits), else beside output_path.
+    """
+    path = _intermediate_path(output_path, suffix)
+    if space is None:
+        return path
+    try:
+        estimate = int(os.path.getsize(input_path) * 1.5)
+    except OSError:
+        estimate = 0
+    path = space.path(os.path.basename(path), estimate)
+    reserved[path] = estimate
+    return path
+
+
+def _release(path, space, reserved):
+    if space is not None and path in reserved:
+        space.release(path, reserved.pop(path))
+    else:
+        retention.discard(path)
+
+
+def _run_op(op_func, step, input_path, output_path):
+    started = time.perf_counter()
+    with tracing.span(f"op.{op_name(op_func)}", step=step, input=os.path.basename(input_path)):
+        result = op_func(input_path, output_path)
+    metrics.OPERATION_SECONDS.observe(time.perf_counter() - started, operation=op_name(op_func))
+    return result
+
+
+def _can_pipe(producer, consumer, space):
+    return (
+        space is not None and space.pipes
+        and op_name(producer) in PIPE_PRODUCERS
+        and op_name(consumer) in PIPE_CONSUMERS
+        and not _needs_analysis(consumer)
+    )
+
+
+def _predict_probe(producer, input_path, pipe_path):
+    """
+    What probe() would report for the producer's output: copied streams as in
+    its input, encoded ones with the encoder's codec.
+    """
+    info = stream_info(input_path)
+    plan = plan_streams(op_name(producer), pipe_path, info)
+    streams = []
+    for kind in ("video", "audio"):
+        if plan[kind] == "copy":
+            streams.append(info[kind])
+        elif plan[kind] == "encode":
+            streams.append(dict(info[kind], codec_name=ENCODED_CODECS[kind]))
+    return {"streams": streams}
+
+
+def _run_piped(producer, consumer, step, input_path, output_path, space):
+    """
+    Runs producer -> consumer through a FIFO, both FFmpeg processes at once,
+    so the intermediate never touches disk. Raises if either side fails.
+    """
+    fifo = space.make_pipe(f"pipe{step}.nut")
+    probe.register(fifo, _predict_probe(producer, input_path, fifo))
+    failure = []
+    consumer_done = threading.Event()
+    context = contextvars.copy_context()
+
+    def produce():
+        try:
+            context.run(_run_op, producer, step, input_path, fifo)
+        except BaseException as e:
+            failure.append(e)
+            # Let a consumer blocked opening the FIFO see EOF
+            while not consumer_done.is_set():
+                try:
+                    os.close(os.open(fifo, os.O_WRONLY | os.O_NONBLOCK))
+                except OSError:
+                    pass
+                consumer_done.wait(0.2)
+
+    thread = threading.Thread(target=produce, name=f"pipe{step}", daemon=True)
+    thread.start()
+    try:
+        with tracing.span("pipe", step=step):
+            result = _run_op(consumer, step + 1, fifo, output_path)
+    finally:
+        consumer_done.set()
+        while thread.is_alive():
+            # Unblock a producer still waiting for a reader; its writes then fail
+            try:
+                os.close(os.open(fifo, os.O_RDONLY | os.O_NONBLOCK))
+            except OSError:
+                pass
+            thread.join(0.2)
+        probe.forget(fifo)
+        space.release(fifo)
+    if failure:
+        raise failure[0]
+    return result
+
+
+def render_serial(operations, input_path, output_path, step_prefix="step", analysis_source=None, previous_ops=()):
+    space = scratch.current()
+    reserved = {}
+    last = len(operations) - 1
+    sources = _analysis_inputs(operations) if DAG_RENDER else {}
+    pending = {}
+    readers = {}
+    deferred = []
+
+    def start_analysis(step, path):
+        for i, source in sources.items():
+            if source == step:
+                pending[i] = _submit_analysis(operations[i], path, analysis_source, list(previous_ops) + operations[:i])
+                readers.setdefault(path, []).append(pending[i][0])
+
+    def release_when_read(path):
+        # An analysis still reading a consumed file keeps it until it is done
+        if any(not future.done() for future in readers.get(path, [])):
+            deferred.append(path)
+        else:
+            _release(path, space, reserved)
+
+    current_input = input_path
+    try:
+        start_analysis(-1, input_path)
+        i = 0
+        while i <= last:
+            op_func = operations[i]
+            if i in pending:
+                value = _join_analysis(pending.pop(i))
+                op_func = partial(op_func, **{ANALYSIS_KWARGS[op_name(op_func)]: value})
+            elif analysis_source and _needs_analysis(op_func):
+                value = analyze(op_func, current_input, analysis_source, list(previous_ops) + operations[:i])
+                op_func = partial(op_func, **{ANALYSIS_KWARGS[op_name(op_func)]: value})
+
+            result = None
+            steps = 1
+            # A step whose output feeds an analysis must write a real file
+            if i < last and i not in sources.values() and _can_pipe(op_func, operations[i + 1], space):
+                if i + 1 == last:
+                    output = output_path
+                else:
+                    output = _scratch_output(output_path, f"{step_prefix}{i + 1}", current_input, space, reserved)
+                try:
+                    result = _run_piped(op_func, operations[i + 1], i, current_input, output, space)
+                    steps = 2
+                except Exception as e:
+                    print(f"DEBUG: Piped steps {i}-{i + 1} failed ({e}); running them through files")
+                    if output != output_path:
+                        _release(output, space, reserved)
+
+            if result is None:
+                if i == last:
+                    output = output_path
+                else:
+                    output = _scratch_output(output_path, f"{step_prefix}{i}", current_input, space, reserved)
+                result = _run_op(op_func, i, current_input, output)
+
+            start_analysis(i + steps - 1, result)
+            # The previous step's file is consumed; don't keep it until the job ends
+            if current_input != input_path and current_input != result:
+                release_when_read(current_input)
+            current_input = result
+            i += steps
+            for path in [p for p in deferred if all(f.done() for f in readers[p])]:
+                deferred.remove(path)
+                _release(path, space, reserved)
+    finally:
+        _settle(pending.values())
+        for path in deferred:
+            _release(path, space, reserved)
+
+    return current_input
+
+
+def _partition(operations):
+    """
+    Splits the chain into (head, body, tail): head runs serially, body is the
+    first contiguous segmentable run, tail is whatever follows. A context op
+    placed after a retiming op inside the body ends the body, since its global
+    analysis would otherwise be computed on the wrong timeline.
+    """
+    i = 0
+    while i < len(operations) and op_name(operations[i]) not in SEGMENTABLE_OPS:
+        i += 1
+    head = operations[:i]
+
+    j = i
+    retimed = False
+    while j < len(operations):
+        name = op_name(operations[j])
+        if name not in SEGMENTABLE_OPS or (retimed and name in GLOBAL_CONTEXT_OPS):
+            break
+        retimed = retimed or name in RETIMING_OPS
+        j += 1
+
+    return head, operations[i:j], operations[j:]
+
+
+def render_segmented(operations, input_path, output_path, depth=0, analysis_source=None, previous_ops=()):
+    head, body, tail = _partition(operations)
+    previous_ops = list(previous_ops)
+    space = scratch.current()
+    reserved = {}
+    current = input_path
+
+    if head:
+        if body or tail:
+            out = _scratch_output(output_path, f"pass{depth}_head", current, space, reserved)
+        else:
+            out = output_path
+        current = render_serial(head, current, out, f"pass{depth}_step", analysis_source, previous_ops)
+    if body:
+        out = output_path if not tail else _scratch_output(output_path, f"pass{depth}_seg", current, space, reserved)
+        started = time.perf_counter()
+        previous = current
+        current = _render_chunks(body, current, out, analysis_source, previous_ops + head)
+        # Chunk workers are separate processes, so time the body as a whole
+        metrics.OPERATION_SECONDS.observe(time.perf_counter() - started, operation="segmented_body")
+        if previous != input_path and previous != current:
+            _release(previous, space, reserved)
+    if tail:
+        previous = current
+        current = render_segmented(tail, current, output_path, depth + 1, analysis_source, previous_ops + head + body)
+        if previous != input_path and previous != current:
+            _release(previous, space, reserved)
+
+    return current
+
+
+def split_at_keyframes(input_path, work_dir, segment_seconds=None):
+    """
+    Stream-copies the input into chunks of roughly segment_seconds, each cut on
+    a keyframe. Returns [(chunk_path, start, end)] in source time.
+    """
+    pattern = os.path.join(work_dir, "chunk_%04d.mkv")
+    list_path = os.path.join(work_dir, "chunks.csv")
+    command = [
+        "ffmpeg", "-y", "-nostdin",
+        "-i", input_path,
+        "-map", "0:v:0", "-map", "0:a:0?",
+        "-c", "copy",
+        "-f", "segment",
+        "-segment_time", str(segment_seconds or SEGMENT_SECONDS),
+        "-reset_timestamps", "1",
+        "-segment_list", list_path,
+        "-segment_list_type", "csv",
+        pattern
+    ]
+    tracing.run(command, check=True)
+
+    chunks = []
+    with open(list_path, "r", encoding="utf-8") as f:
+        for line in f:
+            parts = line.strip().split(",")
+            if len(parts) < 3:
+                continue
+            chunks.append((os.path.join(work_dir, parts[0]), float(parts[1]), float(parts[2])))
+    return chunks
+
+
+def _precompute_context(operations, input_path, analysis_source=None, previous_ops=()):
+    """
+    Starts whole-timeline analysis for every context op in the body, all at
+    once. Returns {index: pending analysis}; see _collect_context.
+    """
+    pending = {}
+    for i, op in enumerate(operations):
+        if _needs_analysis(op):
+            pending[i] = _submit_analysis(op, input_path, analysis_source, list(previous_ops) + operations[:i])
+    return pending
+
+
+def _collect_context(pending):
+    try:
+        return {i: _join_analysis(p) for i, p in pending.items()}
+    finally:
+        _settle(pending.values())
+
+
+def _clip_intervals(intervals, start, end):
+    """
+    Intervals overlapping [start, end), clipped and shifted to chunk-local time.
+    """
+    clipped = []
+    for s, e in intervals:
+        if e <= start or s >= end:
+            continue
+        clipped.append((max(s, start) - start, min(e, end) - start))
+    return clipped
+
+
+def _slice_srt(srt_content, start, end):
+    """
+    SRT cues overlapping [start, end), re-timed to chunk-local time and re-indexed.
+    """
+    pattern = re.compile(r"(\d{2}):(\d{2}):(\d{2}),(\d{3}) --> (\d{2}):(\d{2}):(\d{2}),(\d{3})")
+
+    def to_ts(sec):
+        ms = int(round(sec * 1000))
+        h, ms = divmod(ms, 3600000)
+        m, ms = divmod(ms, 60000)
+        s, ms = divmod(ms, 1000)
+        return f"{h:02d}:{m:02d}:{s:02d},{ms:03d}"
+
+    blocks = []
+    for block in re.split(r"\n\s*\n", srt_content.strip()):
+        lines = block.strip().splitlines()
+        for k, line in enumerate(lines):
+            match = pattern.search(line)
+            if not match:
+                continue
+            g = [int(x) for x in match.groups()]
+            cue_start = g[0]*3600 + g[1]*60 + g[2] + g[3]/1000.0
+            cue_end = g[4]*3600 + g[5]*60 + g[6] + g[7]/1000.0
+            if cue_end <= start or cue_start >= end:
+                break
+            text = lines[k+1:]
+            timing = f"{to_ts(max(cue_start, start) - start)} --> {to_ts(min(cue_end, end) - start)}"
+            blocks.append("\n".join([str(len(blocks) + 1), timing] + text))
+            break
+    return "\n\n".join(blocks) + "\n" if blocks else ""
+
+
+def _bind_chunk(operations, context, start, end, frame_workers):
+    """
+    Returns the chunk's operation chain with its slice of the global context
+    bound in, or None if the chunk is dropped entirely (all silence).
+    """
+    bound = []
+    for i, op in enumerate(operations):
+        name = op_name(op)
+        if name == "remove_silence" and i in context:
+            silences = _clip_intervals(context[i], start, end)
+            if sum(e - s for s, e in silences) >= (end - start) - 0.05:
+                return None
+            if context[i] and not silences:
+                # Silence elsewhere but not here: this chunk must still be
+                # re-encoded like its neighbours, so skip the no-op copy.
+                silences = [(0.0, 0.0)]
+            op = partial(op, silences=silences)
+        elif name == "remove_noise" and i in context:
+            intervals = _clip_intervals(context[i], start, end)
+            if context[i] and not intervals:
+                # No speech in this chunk: gate it shut, as the whole-file pass would.
+                intervals = [(0.0, 0.0)]
+            op = partial(op, intervals=intervals)
+        elif name == "add_captions" and i in context:
+            op = partial(op, srt_content=_slice_srt(context[i], start, end))
+
+        # Split the frame thread budget between concurrent chunk processes.
+        if name in FRAME_OPS and (getattr(op, "keywords", {}) or {}).get("workers") is None:
+            op = partial(op, workers=frame_workers)
+        bound.append(op)
+    return bound
+
+
+def _render_chunk(trace, index, operations, chunk_path, chunk_output):
+    """
+    Process-pool entry point: renders one chunk inside the job's trace.
+    """
+    with tracing.attach(trace), tracing.span("chunk", index=index):
+        return render_serial(operations, chunk_path, chunk_output, f"chunk{index}_step")
+
+
+def _chunk_executor():
+    global _chunk_pool
+    with _chunk_pool_lock:
+        if _chunk_pool is None:
+            method = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+            _chunk_pool = ProcessPoolExecutor(max_workers=SEGMENT_WORKERS, mp_context=multiprocessing.get_context(method))
+        return _chunk_pool
+
+
+def _discard_chunk_executor(pool):
+    # A worker died: the pool refuses new work, so the next job starts a new one
+    global _chunk_pool
+    with _chunk_pool_lock:
+        if _chunk_pool is pool:
+            _chunk_pool = None
+    pool.shutdown(wait=False, cancel_futures=True)
+
+
+def _video_duration(path):
+    info = probe.probe(path, cached=False)
+    video = next((st for st in info.get("streams", []) if st.get("codec_type") == "video"), {})
+    try:
+        return float(video.get("duration") or info.get("format", {}).get("duration") or 0)
+    except ValueError:
+        return 0.0
+
+
+def _concat_chunks(outputs, output_path, work_dir, profile=None):
+    """
+    Joins rendered chunks: video is stream-copied with the concat demuxer,
+    audio is decoded, padded or trimmed to each chunk's video length (chunk
+    audio was cut at video keyframes, not on audio frames) and encoded once
+    over the whole timeline, so it can't drift against the picture.
+    """
+    if stream_info(outputs[0])["audio"] is None:
+        return concat_files(outputs, output_path, work_dir)
+
+    list_path = write_concat_list(outputs, os.path.join(work_dir, "rendered.txt"))
+    inputs = ["-f", "concat", "-safe", "0", "-i", list_path]
+    filters = []
+    for i, path in enumerate(outputs):
+        inputs += ["-i", path]
+        filters.append(f"[{i + 1}:a:0]apad,atrim=0:{_video_duration(path):.6f},asetpts=N/SR/TB[a{i}]")
+    labels = "".join(f"[a{i}]" for i in range(len(outputs)))
+    filters.append(f"{labels}concat=n={len(outputs)}:v=0:a=1[aout]")
+
+    script_path = os.path.join(work_dir, "audio_filter.txt")
+    with open(script_path, "w", encoding="utf-8") as f:
+        f.write(";\n".join(filters))
+    command = [
+        "ffmpeg", "-y", "-nostdin",
+        *inputs,
+        "-filter_complex_script", script_path,
+        "-map", "0:v:0", "-map", "[aout]",
+        "-c:v", "copy",
+        *audio_args(profile, output_path),
+        *container_args(output_path),
+        output_path
+    ]
+    tracing.run(command, check=True)
+    return output_path
+
+
+def _render_chunks(operations, input_path, output_path, analysis_source=None, previous_ops=()):
+    space = scratch.current()
+    if space is not None:
+        # Source chunks plus rendered chunks
+        estimate = os.path.getsize(input_path) * 3
+        work_dir = space.mkdtemp("segments_", estimate)
+    else:
+        estimate = 0
+        work_dir = tempfile.mkdtemp(prefix="segments_", dir=os.path.dirname(os.path.abspath(output_path)))
+    ext = os.path.splitext(_intermediate_path(output_path, "chunk"))[1]
+    try:
+        # Transcription and silence detection run while the input is split
+        pending = _precompute_context(operations, input_path, analysis_source, previous_ops)
+        try:
+            chunks = split_at_keyframes(input_path, work_dir)
+        except BaseException:
+            _settle(pending.values())
+            raise
+        context = _collect_context(pending)
+        if not chunks:
+            return render_serial(operations, input_path, output_path)
+
+        workers = min(SEGMENT_WORKERS, len(chunks))
+        frame_workers = max(1, FRAME_WORKERS // workers)
+
+        jobs = []
+        pool = _chunk_executor()
+        try:
+            for i, (chunk_path, start, end) in enumerate(chunks):
+                chunk_ops = _bind_chunk(operations, context, start, end, frame_workers)
+                if chunk_ops is None:
+                    continue
+                chunk_output = os.path.join(work_dir, f"out_{i:04d}{ext}")
+                jobs.append(pool.submit(_render_chunk, tracing.carrier(), i, chunk_ops, chunk_path, chunk_output))
+            outputs = [job.result() for job in jobs]
+        except BaseException as e:
+            # Don't delete the work dir under chunks that are still rendering
+            for job in jobs:
+                job.cancel()
+            wait(jobs)
+            if isinstance(e, BrokenProcessPool):
+                _discard_chunk_executor(pool)
+            raise
+
+        if not outputs:
+            # Every chunk was silence; let the serial path apply its own fallback.
+            return render_serial(operations, input_path, output_path)
+
+        profile = next((op.keywords["profile"] for op in operations if "profile" in (getattr(op, "keywords", None) or {})), None)
+        return _concat_chunks(outputs, output_path, work_dir, profile)
+    finally:
+        if space is not None:
+            space.release(work_dir, estimate)
+        else:
+            shutil.rmtree(work_dir, ignore_errors=True)
@@ -0,0 +1,318 @@
+"""
+Disk retention for uploads, rendered outputs, generated videos and temp files.
+
+- Sharded layout: new media goes to <root>/<first two chars of job id>/, so
+  no single directory grows huge.
+- Per-artifact TTLs, measured from last access (atime, bumped on download)
+  or last write, whichever is newer.
+- High-water-mark evictor: when the volume passes RETENTION_HIGH_WATER,
+  least recently used artifacts go first (temp files, intermediates and
+  previews ahead of uploads and finished outputs) until usage is back under
+  RETENTION_LOW_WATER.
+- Files belonging to a running job, or touched within RETENTION_MIN_AGE, are
+  never removed.
+
+    python -m services.retention --dry-run
+"""
+import argparse
+import fnmatch
+import os
+import shutil
+import threading
+import time
+from contextlib import contextmanager
+
+from services import metrics, tracing
+
+HOUR = 3600
+TTLS = {
+    "temp": float(os.environ.get("RETENTION_TEMP_HOURS", "1")) * HOUR,
+    "intermediate": float(os.environ.get("RETENTION_INTERMEDIATE_HOURS", "1")) * HOUR,
+    "preview": float(os.environ.get("RETENTION_PREVIEW_HOURS", "6")) * HOUR,
+    "upload": float(os.environ.get("RETENTION_UPLOAD_HOURS", "24")) * HOUR,
+    "output": float(os.environ.get("RETENTION_OUTPUT_HOURS", "72")) * HOUR,
+    "generated": float(os.environ.get("RETENTION_GENERATED_HOURS", "168")) * HOUR,
+    "trace": float(os.environ.get("RETENTION_TRACE_HOURS", "168")) * HOUR,
+}
+# High-water eviction order; traces are left to their TTL.
+EVICTION_ORDER = ["temp", "intermediate", "preview", "upload", "output", "generated"]
+
+RETENTION_HIGH_WATER = float(os.environ.get("RETENTION_HIGH_WATER", "0.90"))
+RETENTION_LOW_WATER = float(os.environ.get("RETENTION_LOW_WATER", "0.80"))
+RETENTION_MIN_AGE = float(os.environ.get("RETENTION_MIN_AGE", "900"))
+RETENTION_INTERVAL = float(os.environ.get("RETENTION_INTERVAL", "600"))
+
+SHARD_CHARS = 2
+# Name patterns of intermediates left beside outputs by render/video helpers.
+INTERMEDIATE_PATTERNS = ("*_step[0-9]*", "*_pass[0-9]*", "*_proxy.*", "*_faststart.*", "*_chunk*", "*_download.*")
+TEMP_PATTERNS = ("temp_heal_*", "temp_rembg_*", "temp_captions_*", "*.tmp")
+# Work directories removed as a whole.
+UNIT_DIR_PATTERNS = ("hls_*", "segments_*", "smartcut_*", "scratch_*")
+
+REMOVED_BYTES = metrics.Counter("retention_removed_bytes_total", "Bytes removed by retention.", ("category", "reason"))
+
+_roots = {}
+_active = set()
+_active_lock = threading.Lock()
+_sweeper = None
+
+
+def configure(uploads=None, outputs=None, generated=None, temp=None, traces=None):
+    """
+    Tells retention where each kind of artifact lives.
+    """
+    for label, path in (("uploads", uploads), ("outputs", outputs), ("generated", generated),
+                        ("temp", temp), ("traces", traces)):
+        if path:
+            _roots[label] = os.path.abspath(path)
+
+
+def shard_dir(root, key):
+    """
+    <root>/<key[:2]>/, created on demand.
+    """
+    path = os.path.join(root, key[:SHARD_CHARS].lower())
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+@contextmanager
+def active(job_id):
+    """
+    Protects every artifact whose name contains job_id while the block runs.
+    """
+    if not job_id:
+        yield
+        return
+    with _active_lock:
+        _active.add(job_id)
+    try:
+        yield
+    finally:
+        with _active_lock:
+            _active.discard(job_id)
+
+
+def touch(path):
+    """
+    Records a read (for LRU) without changing mtime, which outputs' ETags use.
+    """
+    try:
+        stat = os.stat(path)
+        if time.time() - stat.st_atime > 60:
+            os.utime(path, ns=(time.time_ns(), stat.st_mtime_ns))
+    except OSError:
+        pass
+
+
+def discard(path):
+    """
+    Removes a file or work directory if it exists.
+    """
+    try:
+        if os.path.isdir(path):
+            shutil.rmtree(path, ignore_errors=True)
+        elif os.path.exists(path):
+            os.remove(path)
+    except OSError as e:
+        print(f"Warning: could not remove {path}: {e}")
+
+
+def cleanup_intermediates(output_path, keep=()):
+    """
+    Deletes step/pass/proxy files left beside output_path by a job.
+    """
+    if not output_path:
+        return
+    directory = os.path.dirname(os.path.abspath(output_path))
+    base = os.path.splitext(os.path.basename(output_path))[0]
+    keep = {os.path.abspath(k) for k in keep if k}
+    try:
+        names = os.listdir(directory)
+    except OSError:
+        return
+    for name in names:
+        path = os.path.join(directory, name)
+        if not name.startswith(base + "_") or path in keep:
+            continue
+        if any(fnmatch.fnmatch(name, p) for p in INTERMEDIATE_PATTERNS):
+            discard(path)
+
+
+def _classify(label, name, is_dir):
+    if any(fnmatch.fnmatch(name, p) for p in TEMP_PATTERNS):
+        return "temp"
+    if label == "temp":
+        return None
+    if label == "traces":
+        return "trace" if not is_dir else None
+    if label == "uploads":
+        return "upload"
+    if is_dir and any(fnmatch.fnmatch(name, p) for p in ("segments_*", "smartcut_*", "scratch_*")):
+        return "intermediate"
+    if any(fnmatch.fnmatch(name, p) for p in INTERMEDIATE_PATTERNS):
+        return "intermediate"
+    if label == "generated":
+        return "generated"
+    if name.startswith("preview_"):
+        return "preview"
+    return "output"
+
+
+def _dir_stats(path):
+    size, last = 0, 0.0
+    for root, _, names in os.walk(path):
+        for name in names:
+            try:
+                st = os.stat(os.path.join(root, name))
+            except OSError:
+                continue
+            size += st.st_size
+            last = max(last, st.st_atime, st.st_mtime)
+    return size, last or os.stat(path).st_mtime
+
+
+def scan():
+    """
+    Yields (path, category, bytes, last_access) for every managed artifact.
+    """
+    for label, root in _roots.items():
+        if not os.path.isdir(root):
+            continue
+        if label == "temp":
+            # Project root: only stray temp files at the top level
+            for name in os.listdir(root):
+                path = os.path.join(root, name)
+                if os.path.isfile(path) and _classify(label, name, False):
+                    st = os.stat(path)
+                    yield path, "temp", st.st_size, max(st.st_atime, st.st_mtime)
+            continue
+        for dirpath, dirnames, filenames in os.walk(root):
+            for name in list(dirnames):
+                if any(fnmatch.fnmatch(name, p) for p in UNIT_DIR_PATTERNS):
+                    dirnames.remove(name)
+                    path = os.path.join(dirpath, name)
+                    category = _classify(label, name, True)
+                    if category:
+                        size, last = _dir_stats(path)
+                        yield path, category, size, last
+            for name in filenames:
+                path = os.path.join(dirpath, name)
+                category = _classify(label, name, False)
+                if not category:
+                    continue
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    continue
+                yield path, category, st.st_size, max(st.st_atime, st.st_mtime)
+
+
+def _protected(path, last_access, now):
+    if now - last_access < RETENTION_MIN_AGE:
+        return True
+    with _active_lock:
+        jobs = list(_active)
+    return any(job_id in path for job_id in jobs)
+
+
+def _volume_usage():
+    root = _roots.get("outputs") or next(iter(_roots.values()), None)
+    if not root:
+        return None
+    usage = shutil.disk_usage(root)
+    return usage.used, usage.total
+
+
+def _prune_empty_shards():
+    for label in ("uploads", "outputs", "generated"):
+        root = _roots.get(label)
+        if not root or not os.path.isdir(root):
+            continue
+        for name in os.listdir(root):
+            path = os.path.join(root, name)
+            if len(name) == SHARD_CHARS and os.path.isdir(path) and not os.listdir(path):
+                try:
+                    os.rmdir(path)
+                except OSError:
+                    pass
+
+
+def sweep(dry_run=False, now=None):
+    """
+    One retention pass: TTL expiry, then high-water eviction. Returns the
+    removed artifacts as (path, category, bytes, reason).
+    """
+    now = now or time.time()
+    removed = []
+    remaining = []
+
+    for path, category, size, last in scan():
+        if _protected(path, last, now):
+            continue
+        if now - last > TTLS.get(category, float("inf")):
+            removed.append((path, category, size, "ttl"))
+        elif category in EVICTION_ORDER:
+            remaining.append((EVICTION_ORDER.index(category), last, path, category, size))
+
+    usage = _volume_usage()
+    if usage:
+        used, total = usage
+        used -= sum(r[2] for r in removed)
+        if total and used / total > RETENTION_HIGH_WATER:
+            for _, _, path, category, size in sorted(remaining):
+                if used / total <= RETENTION_LOW_WATER:
+                    break
+                removed.append((path, category, size, "high_water"))
+                used -= size
+
+    for path, category, size, reason in removed:
+        if not dry_run:
+            discard(path)
+            REMOVED_BYTES.inc(size, category=category, reason=reason)
+    if not dry_run:
+        _prune_empty_shards()
+    return removed
+
+
+def _sweep_forever():
+    while True:
+        try:
+            removed = sweep()
+            if removed:
+                freed = sum(r[2] for r in removed) / (1024 * 1024)
+                print(f"Retention: removed {len(removed)} artifacts ({freed:.1f} MB)")
+        except Exception as e:
+            print(f"Retention sweep failed: {e}")
+        time.sleep(RETENTION_INTERVAL)
+
+
+def start_sweeper():
+    """
+    Runs sweep() every RETENTION_INTERVAL seconds on a daemon thread.
+    """
+    global _sweeper
+    if _sweeper is None or not _sweeper.is_alive():
+        _sweeper = threading.Thread(target=_sweep_forever, name="retention", daemon=True)
+        _sweeper.start()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--dry-run", action="store_true")
+    args = parser.parse_args()
+
+    base_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    configure(
+        uploads=os.path.join(base_dir, "uploads"),
+        outputs=os.path.join(base_dir, "outputs"),
+        generated=os.path.join(base_dir, "static", "outputs"),
+        temp=base_dir,
+        traces=tracing.TRACE_DIR,
+    )
+    for path, category, size, reason in sweep(dry_run=args.dry_run):
+        print(f"{reason:<11} {category:<13} {size / (1024 * 1024):>9.1f} MB  {path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,154 @@
+"""
+Per-job scratch space for intermediates.
+
+Each job gets its own directory on a RAM-backed filesystem (SCRATCH_RAM_DIR,
+/dev/shm by default) and a disk fallback beside the job's output. Files go to
+RAM while their estimated size fits the job's RAM budget and the tmpfs has
+room, otherwise to disk. Both directories are removed when the job ends.
+Where both neighbouring steps can stream, render connects them with a FIFO
+from make_pipe() instead of a file.
+"""
+import contextvars
+import os
+import shutil
+import tempfile
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+def _default_ram_dir():
+    return "/dev/shm" if os.path.isdir("/dev/shm") and os.access("/dev/shm", os.W_OK) else ""
+
+SCRATCH_RAM_DIR = os.environ.get("SCRATCH_RAM_DIR", _default_ram_dir())
+# Largest total a single job may keep in RAM, and free space always left on the tmpfs.
+SCRATCH_RAM_MAX_BYTES = int(float(os.environ.get("SCRATCH_RAM_MAX_MB", "2048")) * 1024 * 1024)
+SCRATCH_RAM_HEADROOM = int(float(os.environ.get("SCRATCH_RAM_HEADROOM_MB", "512")) * 1024 * 1024)
+# 0 disables FIFO streaming between steps.
+SCRATCH_PIPES = os.environ.get("SCRATCH_PIPES", "1") == "1" and hasattr(os, "mkfifo")
+
+DIR_PREFIX = "scratch_"
+
+_current = contextvars.ContextVar("scratch", default=None)
+
+
+class Scratch:
+    def __init__(self, job_id, disk_parent):
+        self.job_id = job_id
+        self.disk_dir = os.path.join(disk_parent, f"{DIR_PREFIX}{job_id}")
+        self.ram_dir = os.path.join(SCRATCH_RAM_DIR, f"promptx_{DIR_PREFIX}{job_id}") if SCRATCH_RAM_DIR else None
+        self.pipes = SCRATCH_PIPES
+        self._ram_reserved = 0
+        self._lock = threading.Lock()
+
+    def _fits_in_ram(self, estimated_bytes):
+        if not self.ram_dir:
+            return False
+        with self._lock:
+            if self._ram_reserved + estimated_bytes > SCRATCH_RAM_MAX_BYTES:
+                return False
+            try:
+                free = shutil.disk_usage(SCRATCH_RAM_DIR).free
+            except OSError:
+                return False
+            if free - estimated_bytes < SCRATCH_RAM_HEADROOM:
+                return False
+            self._ram_reserved += estimated_bytes
+            return True
+
+    def path(self, name, estimated_bytes=0):
+        """
+        A scratch file path: RAM-backed when estimated_bytes fits, else disk.
+        """
+        directory = self.ram_dir if self._fits_in_ram(estimated_bytes) else self.disk_dir
+        os.makedirs(directory, exist_ok=True)
+        return os.path.join(directory, name)
+
+    def mkdtemp(self, prefix, estimated_bytes=0):
+        """
+        A fresh work directory, RAM-backed when estimated_bytes fits.
+        """
+        directory = self.ram_dir if self._fits_in_ram(estimated_bytes) else self.disk_dir
+        os.makedirs(directory, exist_ok=True)
+        return tempfile.mkdtemp(prefix=prefix, dir=directory)
+
+    def release(self, path, estimated_bytes=0):
+        """
+        Deletes a scratch file or directory and returns its RAM reservation.
+        """
+        if self.ram_dir and path.startswith(self.ram_dir + os.sep):
+            with self._lock:
+                self._ram_reserved = max(0, self._ram_reserved - estimated_bytes)
+        try:
+            if os.path.isdir(path):
+                shutil.rmtree(path, ignore_errors=True)
+            elif os.path.lexists(path):
+                os.remove(path)
+        except OSError:
+            pass
+
+    def make_pipe(self, name):
+        """
+        A FIFO in the job's scratch space (RAM dir when available).
+        """
+        directory = self.ram_dir or self.disk_dir
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, name)
+        if os.path.exists(path):
+            os.remove(path)
+        os.mkfifo(path)
+        return path
+
+    def cleanup(self):
+        for directory in (self.ram_dir, self.disk_dir):
+            if directory:
+                shutil.rmtree(directory, ignore_errors=True)
+
+
+@contextmanager
+def job(job_id=None, output_path=None):
+    """
+    Scratch space for one job, removed on exit. current() returns it inside
+    the block.
+    """
+    job_id = job_id or uuid.uuid4().hex
+    disk_parent = os.path.dirname(os.path.abspath(output_path)) if output_path else tempfile.gettempdir()
+    space = Scratch(job_id, disk_parent)
+    token = _current.set(space)
+    try:
+        yield space
+    finally:
+        _current.reset(token)
+        space.cleanup()
+
+
+def current():
+    return _current.get()
+
+
+def temp_path(prefix, suffix):
+    """
+    A throwaway file in the current job's scratch (RAM when possible), or in
+    the working directory outside a job.
+    """
+    name = f"{prefix}{uuid.uuid4().hex[:8]}{suffix}"
+    space = current()
+    return space.path(name, 1024 * 1024) if space else name
+
+
+def purge_stale(max_age=3600):
+    """
+    Removes RAM scratch left behind by a crashed process.
+    """
+    if not SCRATCH_RAM_DIR or not os.path.isdir(SCRATCH_RAM_DIR):
+        return
+    now = time.time()
+    for name in os.listdir(SCRATCH_RAM_DIR):
+        if not name.startswith(f"promptx_{DIR_PREFIX}"):
+            continue
+        path = os.path.join(SCRATCH_RAM_DIR, name)
+        try:
+            if now - os.stat(path).st_mtime > max_age:
+                shutil.rmtree(path, ignore_errors=True)
+        except OSError:
+            continue
@@ -0,0 +1,107 @@
+"""
+Signed session tokens: sign-in hands one out, and later requests prove who
+they are with it (Authorization: Bearer <token>) without a database lookup.
+
+    token = session.issue("a@b.c")
+    session.verify(token)  # "a@b.c", or None if forged or expired
+
+A token is base64url(JSON {"sub", "exp"}) + "." + base64url(HMAC-SHA256).
+The key is SESSION_SECRET, or a random key kept in SESSION_SECRET_PATH so
+every worker on the host (and the next start) accepts the same tokens.
+"""
+import base64
+import hashlib
+import hmac
+import json
+import os
+import threading
+import time
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SESSION_SECRET_PATH = os.environ.get("SESSION_SECRET_PATH", os.path.join(BASE_DIR, ".session_secret"))
+SESSION_TTL = float(os.environ.get("SESSION_TTL_HOURS", "168")) * 3600
+# Compatibility: trust a posted user_email from clients that send no token.
+# Anyone can post any email, so keep this off outside migrations.
+SESSION_ALLOW_EMAIL = os.environ.get("SESSION_ALLOW_EMAIL", "0") == "1"
+
+_secret = None
+_secret_lock = threading.Lock()
+
+
+def _key():
+    global _secret
+    with _secret_lock:
+        if _secret is None:
+            configured = os.environ.get("SESSION_SECRET")
+            if configured:
+                _secret = configured.encode("utf-8")
+            else:
+                _secret = _stored_key()
+        return _secret
+
+
+def _stored_key():
+    try:
+        with open(SESSION_SECRET_PATH, "rb") as f:
+            key = f.read().strip()
+        if key:
+            return key
+    except OSError:
+        pass
+    key = base64.urlsafe_b64encode(os.urandom(32))
+    try:
+        # O_EXCL: if another worker got there first, use its key
+        fd = os.open(SESSION_SECRET_PATH, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+        with os.fdopen(fd, "wb") as f:
+            f.write(key)
+    except FileExistsError:
+        time.sleep(0.1)
+        with open(SESSION_SECRET_PATH, "rb") as f:
+            return f.read().strip() or key
+    except OSError as e:
+        print(f"Warning: Could not store session key ({e}); sessions end when this process exits.")
+    return key
+
+
+def _encode(raw):
+    return base64.urlsafe_b64encode(raw).rstrip(b"=").decode("ascii")
+
+
+def _decode(text):
+    return base64.urlsafe_b64decode(text + "=" * (-len(text) % 4))
+
+
+def _sign(payload):
+    return _encode(hmac.new(_key(), payload.encode("ascii"), hashlib.sha256).digest())
+
+
+def issue(email, ttl=None):
+    payload = _encode(json.dumps({"sub": email, "exp": int(time.time() + (ttl or SESSION_TTL))}).encode("utf-8"))
+    return f"{payload}.{_sign(payload)}"
+
+
+def verify(token):
+    """
+    Email the token was issued to, or None if it's malformed, forged or expired.
+    """
+    if not token or token.count(".") != 1:
+        return None
+    payload, signature = token.split(".")
+    try:
+        if not hmac.compare_digest(signature.encode("ascii"), _sign(payload).encode("ascii")):
+            return None
+        claims = json.loads(_decode(payload))
+    except ValueError:
+        return None
+    if claims.get("exp", 0) < time.time():
+        return None
+    return claims.get("sub")
+
+
+def from_header(authorization):
+    """
+    Token from an Authorization header value ("Bearer <token>"), or None.
+    """
+    if authorization and authorization[:7].lower() == "bearer ":
+        return authorization[7:].strip()
+    return None
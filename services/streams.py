@@ -0,0 +1,125 @@
+import os
+
+from services.encoding import video_args, audio_args, container_args
+from services.probe import probe
+
+# What each operation does to each stream:
+#   "copy"   - stream passes through untouched
+#   "encode" - stream goes through a filter and must be re-encoded
+#   "drop"   - stream is removed from the output
+OPERATION_STREAMS = {
+    "trim_video": {"video": "copy", "audio": "copy"},
+    "remove_silence": {"video": "encode", "audio": "encode"},
+    "adjust_speed": {"video": "encode", "audio": "encode"},
+    "remove_noise": {"video": "copy", "audio": "encode"},
+    "add_captions": {"video": "encode", "audio": "copy"},
+    "resize_to_vertical": {"video": "encode", "audio": "copy"},
+    "resize_to_horizontal": {"video": "encode", "audio": "copy"},
+    "remove_watermark": {"video": "encode", "audio": "copy"},
+    "remove_background": {"video": "encode", "audio": "copy"},
+    "extract_audio": {"video": "drop", "audio": "copy"},
+}
+
+# Codecs each output container can carry without transcoding. "*" = anything.
+CONTAINER_CODECS = {
+    ".mp4": {
+        "video": {"h264", "hevc", "av1", "mpeg4", "vp9"},
+        "audio": {"aac", "mp3", "alac", "opus", "ac3", "eac3", "flac"},
+    },
+    ".mov": {
+        "video": {"h264", "hevc", "mpeg4", "prores", "mjpeg"},
+        "audio": {"aac", "mp3", "alac", "pcm_s16le", "pcm_s24le"},
+    },
+    ".m4a": {"video": set(), "audio": {"aac", "alac"}},
+    ".mp3": {"video": set(), "audio": {"mp3"}},
+    ".mkv": "*",
+    ".nut": "*",
+    # HLS outputs are written as fMP4 segments (see encoding.container_args).
+    ".m3u8": {
+        "video": {"h264", "hevc", "av1"},
+        "audio": {"aac", "mp3", "ac3", "eac3", "opus", "flac"},
+    },
+    ".ts": {
+        "video": {"h264", "hevc", "mpeg2video"},
+        "audio": {"aac", "mp3", "ac3", "eac3"},
+    },
+}
+
+
+def stream_info(input_path):
+    """
+    First video and audio stream of a file (None where absent). Cover-art
+    pictures in audio files are not counted as video.
+    """
+    streams = probe(input_path).get("streams", [])
+    video = next(
+        (st for st in streams
+         if st.get("codec_type") == "video" and not (st.get("disposition") or {}).get("attached_pic")),
+        None
+    )
+    audio = next((st for st in streams if st.get("codec_type") == "audio"), None)
+    return {"video": video, "audio": audio}
+
+
+def has_audio(info):
+    return info.get("audio") is not None
+
+
+def can_copy(stream, kind, output_path):
+    """
+    True if the stream can be muxed into output_path's container as-is.
+    """
+    if not stream:
+        return False
+    allowed = CONTAINER_CODECS.get(os.path.splitext(output_path)[1].lower())
+    if allowed is None:
+        return False
+    if allowed == "*":
+        return True
+    return stream.get("codec_name") in allowed[kind]
+
+
+def plan_streams(operation, output_path, info):
+    """
+    Resolves each stream to copy / encode / drop / absent for one operation.
+    Untouched streams fall back to encode when the target container cannot
+    hold their codec.
+    """
+    actions = OPERATION_STREAMS.get(operation, {"video": "encode", "audio": "encode"})
+    plan = {}
+    for kind in ("video", "audio"):
+        stream = info.get(kind)
+        action = actions[kind]
+        if stream is None:
+            plan[kind] = "absent"
+        elif action == "copy" and not can_copy(stream, kind, output_path):
+            plan[kind] = "encode"
+        else:
+            plan[kind] = action
+    return plan
+
+
+def codec_args(operation, output_path, info, profile=None):
+    """
+    FFmpeg codec arguments for an operation's output: `-c:v copy` / `-c:a copy`
+    for streams the operation leaves alone, the encode tier's settings otherwise,
+    followed by the output container's muxer flags.
+    """
+    plan = plan_streams(operation, output_path, info)
+    args = []
+
+    if plan["video"] == "copy":
+        args += ["-c:v", "copy"]
+    elif plan["video"] == "encode":
+        args += video_args(profile)
+    elif plan["video"] == "drop":
+        args += ["-vn"]
+
+    if plan["audio"] == "copy":
+        args += ["-c:a", "copy"]
+    elif plan["audio"] == "encode":
+        args += audio_args(profile, output_path)
+    elif plan["audio"] == "drop":
+        args += ["-an"]
+
+    return args + container_args(output_path)
@@ -0,0 +1,238 @@
+"""
+Per-job tracing. Spans (intent call, Gemini upload wait, each operation, each
+FFmpeg/ffprobe process, frame loops) are appended as JSON lines to
+traces/<job_id>.jsonl when they finish. Outside a job every helper here is a
+no-op.
+
+Span CPU time (`cpu_s`) is the CPU of the thread that ran the span; spans
+around subprocesses also carry `child_cpu_s`, taken from the process-wide
+child rusage (approximate while several jobs run at once).
+"""
+import contextvars
+import functools
+import json
+import os
+import subprocess
+import threading
+import time
+import urllib.request
+import uuid
+from contextlib import contextmanager
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+TRACING = os.environ.get("TRACING", "1") == "1"
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# Relative paths are taken from the project directory, not the working directory.
+TRACE_DIR = os.path.join(BASE_DIR, os.environ.get("TRACE_DIR", "traces"))
+# OpenTelemetry export: OTLP/JSON file next to the job log, and/or POST to a
+# collector's OTLP/HTTP endpoint (e.g. http://localhost:4318).
+TRACE_OTLP_FILE = os.environ.get("TRACE_OTLP_FILE", "0") == "1"
+OTLP_ENDPOINT = os.environ.get("OTEL_EXPORTER_OTLP_ENDPOINT")
+SERVICE_NAME = "promptx-studio"
+
+_job = contextvars.ContextVar("trace_job", default=None)
+_span = contextvars.ContextVar("trace_span", default=None)
+_write_lock = threading.Lock()
+
+
+def trace_path(job_id):
+    return os.path.join(TRACE_DIR, f"{job_id}.jsonl")
+
+
+def _child_cpu():
+    if not resource:
+        return 0.0
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return usage.ru_utime + usage.ru_stime
+
+
+def _write(job, record):
+    line = json.dumps(record, default=str) + "\n"
+    with _write_lock:
+        with open(job["path"], "a", encoding="utf-8") as f:
+            f.write(line)
+
+
+@contextmanager
+def span(name, **attrs):
+    """
+    Times a block as a child of the current span. Yields the span's attribute
+    dict (add to it freely), or None outside a job.
+    """
+    job = _job.get()
+    if job is None:
+        yield None
+        return
+
+    parent = _span.get()
+    record = {
+        "job_id": job["job_id"],
+        "trace_id": job["trace_id"],
+        "span_id": os.urandom(8).hex(),
+        "parent_id": parent["span_id"] if parent else job.get("parent_id"),
+        "name": name,
+        "start_ns": time.time_ns(),
+        "attrs": dict(attrs),
+    }
+    token = _span.set(record)
+    wall_start = time.perf_counter()
+    cpu_start = time.thread_time()
+    status, error = "ok", None
+    try:
+        yield record["attrs"]
+    except BaseException as e:
+        status, error = "error", str(e)[:500]
+        raise
+    finally:
+        _span.reset(token)
+        record["duration_s"] = round(time.perf_counter() - wall_start, 4)
+        record["cpu_s"] = round(time.thread_time() - cpu_start, 4)
+        record["status"] = status
+        if error:
+            record["error"] = error
+        _write(job, record)
+
+
+def annotate(**attrs):
+    """
+    Adds attributes to the current span.
+    """
+    current = _span.get()
+    if current is not None:
+        current["attrs"].update(attrs)
+
+
+@contextmanager
+def job(job_id, **attrs):
+    """
+    Root span for one job; everything traced inside it lands in its log.
+    """
+    if not TRACING or job_id is None:
+        yield None
+        return
+    os.makedirs(TRACE_DIR, exist_ok=True)
+    token = _job.set({"job_id": job_id, "trace_id": uuid.uuid4().hex, "path": trace_path(job_id)})
+    try:
+        with span("job", **attrs) as root:
+            child_start = _child_cpu()
+            try:
+                yield root
+            finally:
+                root["child_cpu_s"] = round(_child_cpu() - child_start, 4)
+    finally:
+        _job.reset(token)
+        if TRACE_OTLP_FILE or OTLP_ENDPOINT:
+            export_otlp(job_id)
+
+
+def carrier():
+    """
+    The current job/span, in a picklable form for worker processes.
+    """
+    job_state = _job.get()
+    if job_state is None:
+        return None
+    current = _span.get()
+    return dict(job_state, parent_id=current["span_id"] if current else None)
+
+
+@contextmanager
+def attach(context):
+    """
+    Continues a job's trace (from carrier()) in another process or thread.
+    """
+    if context is None:
+        yield
+        return
+    token = _job.set(context)
+    try:
+        yield
+    finally:
+        _job.reset(token)
+
+
+def traced(name):
+    """
+    Decorator form of span().
+    """
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with span(name):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def run(command, **kwargs):
+    """
+    subprocess.run with a span named after the tool (ffmpeg, ffprobe...).
+    """
+    with span(os.path.basename(command[0]), args=" ".join(str(c) for c in command)[:1000]) as attrs:
+        child_start = _child_cpu() if attrs is not None else 0.0
+        result = subprocess.run(command, **kwargs)
+        if attrs is not None:
+            attrs["returncode"] = result.returncode
+            attrs["child_cpu_s"] = round(_child_cpu() - child_start, 4)
+        return result
+
+
+def _otlp_value(value):
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+def to_otlp(records):
+    """
+    OTLP/JSON ExportTraceServiceRequest for a job's span records.
+    """
+    spans = []
+    for r in records:
+        attrs = dict(r.get("attrs", {}), job_id=r["job_id"], cpu_s=r.get("cpu_s", 0.0))
+        item = {
+            "traceId": r["trace_id"],
+            "spanId": r["span_id"],
+            "name": r["name"],
+            "kind": 1,
+            "startTimeUnixNano": str(r["start_ns"]),
+            "endTimeUnixNano": str(r["start_ns"] + int(r.get("duration_s", 0) * 1e9)),
+            "attributes": [{"key": k, "value": _otlp_value(v)} for k, v in attrs.items() if v is not None],
+            "status": {"code": 2, "message": r.get("error", "")} if r.get("status") == "error" else {"code": 1},
+        }
+        if r.get("parent_id"):
+            item["parentSpanId"] = r["parent_id"]
+        spans.append(item)
+    return {
+        "resourceSpans": [{
+            "resource": {"attributes": [{"key": "service.name", "value": {"stringValue": SERVICE_NAME}}]},
+            "scopeSpans": [{"scope": {"name": "services.tracing"}, "spans": spans}],
+        }]
+    }
+
+
+def export_otlp(job_id):
+    try:
+        with open(trace_path(job_id), "r", encoding="utf-8") as f:
+            records = [json.loads(line) for line in f if line.strip()]
+        payload = to_otlp(records)
+        if TRACE_OTLP_FILE:
+            with open(os.path.join(TRACE_DIR, f"{job_id}.otlp.json"), "w", encoding="utf-8") as f:
+                json.dump(payload, f)
+        if OTLP_ENDPOINT:
+            request = urllib.request.Request(
+                f"{OTLP_ENDPOINT.rstrip('/')}/v1/traces",
+                data=json.dumps(payload).encode("utf-8"),
+                headers={"Content-Type": "application/json"},
+            )
+            urllib.request.urlopen(request, timeout=5).close()
+    except Exception as e:
+        print(f"Trace export failed for job {job_id}: {e}")
@@ -0,0 +1,175 @@
+import importlib.util
+import os
+import subprocess
+import threading
+
+import numpy as np
+
+from services import tracing
+from services.ai_service import generate_srt_gemini, get_api_key, _fix_srt_content
+from services.probe import get_duration
+
+# Transcription backend: "auto" picks per job, "local" = Whisper, "gemini" = API.
+TRANSCRIBE_BACKEND = os.environ.get("TRANSCRIBE_BACKEND", "auto")
+# tiny / base / small / medium / large: bigger is slower and more accurate.
+WHISPER_MODEL = os.environ.get("WHISPER_MODEL", "base")
+# Audio is decoded and transcribed this many seconds at a time.
+WHISPER_CHUNK_SECONDS = float(os.environ.get("WHISPER_CHUNK_SECONDS", "300"))
+# Auto mode: files longer than this, or jobs arriving while every local slot is
+# busy, go to Gemini.
+LOCAL_MAX_SECONDS = float(os.environ.get("WHISPER_MAX_SECONDS", "900"))
+LOCAL_SLOTS = int(os.environ.get("WHISPER_SLOTS", "1"))
+
+SAMPLE_RATE = 16000
+ENGLISH = {"en", "english"}
+
+_models = {}
+_model_lock = threading.Lock()
+_active_lock = threading.Lock()
+_active_local = 0
+
+
+def whisper_available():
+    return importlib.util.find_spec("whisper") is not None
+
+
+def local_supports(target_language=None):
+    """
+    Whisper transcribes any language but only translates into English.
+    """
+    return not target_language or target_language.strip().lower() in ENGLISH
+
+
+def get_model(size=None):
+    """
+    Loads a Whisper model once per process and reuses it.
+    """
+    size = size or WHISPER_MODEL
+    with _model_lock:
+        if size not in _models:
+            import whisper
+            print(f"Loading Whisper model '{size}'...")
+            _models[size] = whisper.load_model(size)
+        return _models[size]
+
+
+def _load_chunk(media_path, start, length):
+    """
+    Decodes [start, start + length) of the first audio stream as 16 kHz mono
+    float32 samples.
+    """
+    command = [
+        "ffmpeg", "-nostdin", "-v", "error",
+        "-ss", f"{start:.3f}", "-t", f"{length:.3f}",
+        "-i", media_path,
+        "-vn", "-f", "s16le", "-ac", "1", "-ar", str(SAMPLE_RATE),
+        "-"
+    ]
+    result = tracing.run(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    if result.returncode != 0:
+        raise Exception(f"Audio decode failed: {result.stderr.decode(errors='ignore')}")
+    return np.frombuffer(result.stdout, np.int16).astype(np.float32) / 32768.0
+
+
+def _format_ts(seconds):
+    ms = int(round(max(seconds, 0) * 1000))
+    h, ms = divmod(ms, 3600000)
+    m, ms = divmod(ms, 60000)
+    s, ms = divmod(ms, 1000)
+    return f"{h:02d}:{m:02d}:{s:02d},{ms:03d}"
+
+
+def segments_to_srt(segments):
+    blocks = []
+    for i, (start, end, text) in enumerate(segments, 1):
+        blocks.append(f"{i}\n{_format_ts(start)} --> {_format_ts(end)}\n{text}")
+    return _fix_srt_content("\n\n".join(blocks))
+
+
+def transcribe_local(media_path, target_language=None, model_size=None):
+    """
+    Transcribes with Whisper in fixed-length chunks (bounded memory on long
+    files) and returns SRT in the same shape as the Gemini path.
+    """
+    global _active_local
+    model = get_model(model_size)
+    task = "translate" if target_language else "transcribe"
+    duration = get_duration(media_path)
+
+    with _active_lock:
+        _active_local += 1
+    try:
+        segments = []
+        start = 0.0
+        language = None
+        while duration <= 0 or start < duration:
+            audio = _load_chunk(media_path, start, WHISPER_CHUNK_SECONDS)
+            if audio.size == 0:
+                break
+            result = model.transcribe(
+                audio,
+                task=task,
+                language=language,
+                fp16=model.device.type == "cuda",
+                condition_on_previous_text=False,
+            )
+            # Keep the first chunk's language for the rest of the file
+            language = language or result.get("language")
+            for seg in result.get("segments", []):
+                text = seg.get("text", "").strip()
+                if text:
+                    segments.append((start + seg["start"], start + seg["end"], text))
+            start += WHISPER_CHUNK_SECONDS
+            if audio.size < WHISPER_CHUNK_SECONDS * SAMPLE_RATE:
+                break
+        return segments_to_srt(segments)
+    finally:
+        with _active_lock:
+            _active_local -= 1
+
+
+def choose_backend(media_path, target_language=None):
+    """
+    Picks "local" or "gemini" for a transcription job. Auto mode prefers
+    Whisper for short files while a local slot is free, and Gemini for long
+    files, busy workers and non-English translation.
+    """
+    local_ok = whisper_available() and local_supports(target_language)
+    if TRANSCRIBE_BACKEND == "gemini" or not local_ok:
+        return "gemini"
+    if TRANSCRIBE_BACKEND == "local":
+        return "local"
+
+    api_key = get_api_key()
+    if not api_key or api_key == "YOUR_GEMINI_API_KEY":
+        return "local"
+    if get_duration(media_path) > LOCAL_MAX_SECONDS:
+        return "gemini"
+    with _active_lock:
+        busy = _active_local >= LOCAL_SLOTS
+    return "gemini" if busy else "local"
+
+
+def transcribe_srt(media_path, target_language=None):
+    """
+    SRT for a media file from the chosen backend, falling back to the other
+    one on failure. Returns an "Error..." string like generate_srt_gemini.
+    """
+    backend = choose_backend(media_path, target_language)
+    print(f"Transcription backend: {backend}")
+
+    if backend == "local":
+        try:
+            return transcribe_local(media_path, target_language)
+        except Exception as e:
+            print(f"Local transcription failed ({e}). Falling back to Gemini...")
+            return generate_srt_gemini(media_path, target_language)
+
+    srt_content = generate_srt_gemini(media_path, target_language)
+    if srt_content.startswith("Error") and whisper_available() and local_supports(target_language):
+        print(f"{srt_content}. Falling back to local Whisper...")
+        try:
+            return transcribe_local(media_path, target_language)
+        except Exception as e:
+            return f"Error generating SRT: {e}"
+    return srt_content
@@ -0,0 +1,439 @@
+"""
+Veo generations as persisted, resumable jobs.
+
+submit() starts the first Veo operation and records it (operation name,
+prompt, target duration, extension progress) in VEO_STATE_PATH. A single
+asyncio poller started with the server advances every pending generation a
+step at a time: status check, next extension, download. Nothing sleeps in a
+worker thread, and generations still pending at shutdown pick up where they
+left off on the next start.
+
+Status: "generating" -> "extending" (optional, repeated) -> "downloading"
+-> "done", or "error" at any point.
+
+A request that took a trial for the generation hands it over with
+attach_trial(); from then on a failed generation gives the trial back here,
+even if it fails long after the request stopped waiting.
+
+Every uvicorn worker runs a poller on the same state file. Changes happen
+under an exclusive file lock, and each pending generation is leased to one
+worker (its "owner", until "lease_until"), so only that worker polls,
+extends and downloads it. A lease left by a dead worker expires after
+VEO_LEASE_SECONDS and another worker takes the generation over.
+"""
+import asyncio
+import json
+import os
+import socket
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+from database import get_db
+from services import accounts, ai_service, metrics, quota
+from services.video import ensure_faststart
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+VEO_STATE_PATH = os.environ.get("VEO_STATE_PATH", os.path.join(BASE_DIR, "veo_operations.json"))
+VEO_POLL_INTERVAL = float(os.environ.get("VEO_POLL_INTERVAL", "5"))
+# Consecutive failed status checks (or downloads) before a generation is given up.
+VEO_MAX_POLL_FAILURES = int(os.environ.get("VEO_MAX_POLL_FAILURES", "10"))
+# Finished records are dropped from the state file after this long.
+VEO_KEEP_SECONDS = float(os.environ.get("VEO_KEEP_HOURS", "24")) * 3600
+# Longest a request waits for its generation before handing back the
+# generation id to poll instead.
+VEO_WAIT_TIMEOUT = float(os.environ.get("VEO_WAIT_TIMEOUT", "300"))
+# How long a worker holds a generation without renewing it. Longer than the
+# slowest single step (a download), shorter than you'd wait for a crashed
+# worker's generations to resume.
+VEO_LEASE_SECONDS = float(os.environ.get("VEO_LEASE_SECONDS", "300"))
+
+PENDING = ("generating", "extending", "downloading")
+
+PENDING_GAUGE = metrics.Gauge("veo_generations_pending", "Veo generations this worker is polling (or may take over).")
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+_lock = threading.Lock()
+_advancing = set()
+_waiters = {}
+_poller = None
+
+
+def _worker_id():
+    # Read per call: forked workers (e.g. gunicorn --preload) share module state
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+@contextmanager
+def _locked():
+    """
+    Exclusive lock held by one thread of one process at a time; every read
+    and read-modify-write of the state file happens under it.
+    """
+    with _lock, open(f"{VEO_STATE_PATH}.lock", "a+b") as f:
+        if fcntl:
+            fcntl.flock(f, fcntl.LOCK_EX)
+        else:
+            f.seek(0)
+            msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+        try:
+            yield
+        finally:
+            if fcntl:
+                fcntl.flock(f, fcntl.LOCK_UN)
+            else:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+def _load():
+    try:
+        with open(VEO_STATE_PATH, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def _store(records):
+    now = time.time()
+    records = {
+        k: r for k, r in records.items()
+        if r["status"] in PENDING or now - r["updated_at"] < VEO_KEEP_SECONDS
+    }
+    temp_path = f"{VEO_STATE_PATH}.{os.getpid()}.tmp"
+    with open(temp_path, "w", encoding="utf-8") as f:
+        json.dump(records, f, indent=2)
+    os.replace(temp_path, VEO_STATE_PATH)
+
+
+def _update(generation_id, **changes):
+    """
+    Applies changes to a generation this worker owns. Returns the updated
+    record, or None if it is gone (pruned) or another worker has taken it
+    over, in which case the changes are dropped.
+    """
+    with _locked():
+        records = _load()
+        record = records.get(generation_id)
+        if record is None:
+            print(f"Veo tracker: generation {generation_id} is gone; dropping update")
+            return None
+        if record.get("owner") not in (None, _worker_id()):
+            print(f"Veo tracker: generation {generation_id} is now owned by {record['owner']}; dropping update")
+            return None
+        record.update(changes, updated_at=time.time())
+        _store(records)
+        return dict(record)
+
+
+def _claimable(record, now):
+    return record["status"] in PENDING and (
+        record.get("owner") in (None, _worker_id()) or record.get("lease_until", 0) < now
+    )
+
+
+def _claim(generation_id):
+    """
+    Takes or renews this worker's lease on a pending generation. Returns
+    (record, claimed); only a claimed generation may be advanced.
+    """
+    with _locked():
+        records = _load()
+        record = records.get(generation_id)
+        now = time.time()
+        if record is None or not _claimable(record, now):
+            return (dict(record) if record else None), False
+        # Renew only once half the lease is used, not on every poll
+        if record.get("owner") != _worker_id() or record.get("lease_until", 0) - now < VEO_LEASE_SECONDS / 2:
+            if record.get("owner") not in (None, _worker_id()):
+                print(f"Veo tracker: taking over generation {generation_id} from {record['owner']}")
+            record.update(owner=_worker_id(), lease_until=now + VEO_LEASE_SECONDS)
+            _store(records)
+        return dict(record), True
+
+
+def get(generation_id):
+    with _locked():
+        record = _load().get(generation_id)
+    return dict(record) if record else None
+
+
+def pending_ids():
+    """
+    Pending generations this worker owns or may take over.
+    """
+    now = time.time()
+    with _locked():
+        return [k for k, r in _load().items() if _claimable(r, now)]
+
+
+def job_for(output_path):
+    """
+    Generation id writing output_path, or None.
+    """
+    target = os.path.abspath(output_path)
+    with _locked():
+        records = _load()
+    for generation_id, record in records.items():
+        if os.path.abspath(record["output_path"]) == target:
+            return generation_id
+    return None
+
+
+def submit(prompt, output_path, model, duration=8, user=None):
+    """
+    Reserves quota, starts a generation and persists it. Raises right away on
+    quota or API errors; everything after the first request happens in
+    advance().
+    """
+    reservation, granted = quota.reserve(
+        ai_service.veo_length(duration), user=user, minimum=ai_service.VEO_INITIAL_SECONDS)
+    target_duration = ai_service.veo_length(duration, budget=granted)
+    print(f"Generating video with Veo ({model}): '{prompt}' (Target: {target_duration}s)")
+    try:
+        operation_name, model = ai_service.start_veo(prompt, model)
+    except Exception as e:
+        quota.release(reservation)
+        raise ai_service.veo_exception(e)
+
+    generation_id = uuid.uuid4().hex
+    now = time.time()
+    record = {
+        "prompt": prompt,
+        "model": model,
+        "user": user,
+        "output_path": output_path,
+        "target_duration": target_duration,
+        "current_duration": 0,
+        "reservation": reservation,
+        "operation": operation_name,
+        "video_uri": None,
+        "status": "generating",
+        "error": None,
+        "poll_failures": 0,
+        # The submitting worker polls it (its request is the one waiting)
+        "owner": _worker_id(),
+        "lease_until": now + VEO_LEASE_SECONDS,
+        "created_at": now,
+        "updated_at": now,
+    }
+    with _locked():
+        records = _load()
+        records[generation_id] = record
+        _store(records)
+    return generation_id
+
+
+def _next_step(generation_id, record, video_uri, current_duration):
+    """
+    Starts the next extension, or moves on to the download when the target
+    (already capped by the quota reservation) is reached or the extension is
+    refused.
+    """
+    if current_duration < record["target_duration"]:
+        print(f"Extending video... (Current: {current_duration}s -> Target: {record['target_duration']}s)")
+        try:
+            operation_name, _ = ai_service.start_veo(record["prompt"], record["model"], video_uri=video_uri, fallback=False)
+            return _update(generation_id, status="extending", operation=operation_name,
+                           video_uri=video_uri, current_duration=current_duration, poll_failures=0)
+        except Exception as e:
+            if "429" not in str(e) and "RESOURCE_EXHAUSTED" not in str(e):
+                return _fail(generation_id, record, ai_service.veo_exception(e))
+            print("Quota hit during extension. Returning partial video.")
+    return _update(generation_id, status="downloading", video_uri=video_uri,
+                   current_duration=current_duration, poll_failures=0)
+
+
+def attach_trial(generation_id, email):
+    """
+    Makes the tracker responsible for refunding `email`'s trial if the
+    generation fails. Returns False if it has already failed (or is gone),
+    in which case the caller refunds.
+    """
+    with _locked():
+        records = _load()
+        record = records.get(generation_id)
+        if record is None or record["status"] == "error":
+            return False
+        record["trial_user"] = email
+        _store(records)
+        return True
+
+
+def _refund_trial(record):
+    email = record.get("trial_user")
+    db = get_db() if email else None
+    if db is not None:
+        accounts.refund_trial(db, email)
+
+
+def _fail(generation_id, record, error):
+    updated = _update(generation_id, status="error", error=str(error))
+    if updated is not None:
+        # Nothing is delivered, so nothing is charged
+        quota.release(record.get("reservation"))
+        _refund_trial(updated)
+    return updated
+
+
+def _download(record):
+    """
+    Streams the video to a temp file beside the output, makes it fast-start,
+    then moves it into place, so the output only ever appears complete.
+    """
+    base, ext = os.path.splitext(record["output_path"])
+    temp_path = f"{base}_download{ext}"
+    try:
+        ai_service.download_veo(record["video_uri"], temp_path)
+        ensure_faststart(temp_path)
+        os.replace(temp_path, record["output_path"])
+    finally:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+
+
+def _advance(generation_id, record):
+    if record["status"] == "downloading":
+        try:
+            _download(record)
+        except Exception as e:
+            failures = record["poll_failures"] + 1
+            if failures >= VEO_MAX_POLL_FAILURES:
+                return _fail(generation_id, record, ai_service.veo_exception(e))
+            print(f"Veo download failed ({e}); retrying")
+            return _update(generation_id, poll_failures=failures)
+        updated = _update(generation_id, status="done")
+        if updated is not None:
+            quota.commit(record.get("reservation"), record["current_duration"])
+            print(f"Veo generation finished: {record['output_path']} ({record['current_duration']}s)")
+        return updated
+
+    try:
+        done, video_uri, error = ai_service.poll_veo(record["operation"])
+    except Exception as e:
+        failures = record["poll_failures"] + 1
+        if failures >= VEO_MAX_POLL_FAILURES:
+            return _fail(generation_id, record, ai_service.veo_exception(e))
+        return _update(generation_id, poll_failures=failures)
+    if not done:
+        return record
+
+    if record["status"] == "generating":
+        if error:
+            return _fail(generation_id, record, ai_service.veo_operation_error(error))
+        return _next_step(generation_id, record, video_uri, ai_service.VEO_INITIAL_SECONDS)
+
+    if error:
+        print(f"Extension failed: {error}. Returning partial video.")
+        return _update(generation_id, status="downloading", poll_failures=0)
+    return _next_step(generation_id, record, video_uri, record["current_duration"] + ai_service.VEO_EXTENSION_SECONDS)
+
+
+def advance(generation_id):
+    """
+    Moves one generation forward by at most one remote call. Blocking; the
+    poller runs it off the event loop. Returns the updated record.
+    """
+    with _lock:
+        if generation_id in _advancing:
+            return None
+        _advancing.add(generation_id)
+    try:
+        record, claimed = _claim(generation_id)
+        if not claimed:
+            return record
+        return _advance(generation_id, record)
+    finally:
+        with _lock:
+            _advancing.discard(generation_id)
+
+
+def _result(record):
+    if record["status"] == "error":
+        raise Exception(record["error"])
+    return record["output_path"]
+
+
+def complete(generation_id):
+    """
+    Drives a generation to the end in the calling thread (no poller running,
+    e.g. scripts and benchmarks). Returns the output path.
+    """
+    while True:
+        record = advance(generation_id) or get(generation_id)
+        if record is None:
+            raise Exception(f"Unknown generation {generation_id}")
+        if record["status"] not in PENDING:
+            return _result(record)
+        if record["status"] != "downloading" or record["poll_failures"] or record.get("owner") != _worker_id():
+            time.sleep(VEO_POLL_INTERVAL)
+
+
+async def wait(generation_id):
+    """
+    Waits on the event loop until the poller finishes a generation. Returns
+    the output path or raises its error.
+    """
+    while True:
+        record = get(generation_id)
+        if record is None:
+            raise Exception(f"Unknown generation {generation_id}")
+        if record["status"] not in PENDING:
+            return _result(record)
+        future = asyncio.get_running_loop().create_future()
+        _waiters.setdefault(generation_id, []).append(future)
+        await future
+
+
+def _wake(generation_id):
+    for future in _waiters.pop(generation_id, []):
+        if not future.done():
+            future.set_result(None)
+
+
+async def _poll_forever():
+    while True:
+        ids = pending_ids()
+        PENDING_GAUGE.set(len(ids))
+        if ids:
+            results = await asyncio.gather(
+                *(asyncio.to_thread(advance, generation_id) for generation_id in ids),
+                return_exceptions=True,
+            )
+            for generation_id, result in zip(ids, results):
+                if isinstance(result, Exception):
+                    print(f"Veo poller: {generation_id} failed to advance: {result}")
+                _wake(generation_id)
+            # Downloads and new extensions go straight to the next step
+            if any(
+                isinstance(r, dict) and r["status"] == "downloading" and not r["poll_failures"]
+                and r.get("owner") == _worker_id() for r in results
+            ):
+                continue
+        # Requests here may wait on generations another worker advances
+        for generation_id in list(_waiters):
+            _wake(generation_id)
+        await asyncio.sleep(VEO_POLL_INTERVAL)
+
+
+def start_poller():
+    """
+    Starts the shared poller on the running event loop; generations left
+    pending by a previous run resume here.
+    """
+    global _poller
+    if _poller is None or _poller.done():
+        resumed = pending_ids()
+        if resumed:
+            print(f"Resuming {len(resumed)} pending Veo generation(s)")
+        _poller = asyncio.get_running_loop().create_task(_poll_forever())
+
+
+def poller_running():
+    return _poller is not None and not _poller.done()
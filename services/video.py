@@ -3,44 +3,162 @@ import os
 import re
 import uuid
 import shutil
-from services.ai_service import generate_srt_gemini, generate_summary_gemini, generate_video_veo
+import tempfile
+from services import analysis, scratch, tracing
+from services.ai_service import generate_summary_gemini, generate_video_veo
+from services.frames import process_frames
+from services.probe import get_duration, get_keyframes
+from services.streams import stream_info, has_audio, codec_args
+from services.transcribe import transcribe_srt
+from services.encoding import video_args, splice_video_args, container_args, FASTSTART_EXTENSIONS
+
+def _top_level_atoms(path, limit=16):
+    """
+    Yields the first top-level MP4 box types of a file.
+    """
+    with open(path, "rb") as f:
+        for _ in range(limit):
+            header = f.read(8)
+            if len(header) < 8:
+                return
+            size = int.from_bytes(header[:4], "big")
+            box_type = header[4:8].decode("latin-1")
+            yield box_type
+            if size == 1:
+                size = int.from_bytes(f.read(8), "big")
+                f.seek(size - 16, os.SEEK_CUR)
+            elif size == 0:
+                return
+            else:
+                f.seek(size - 8, os.SEEK_CUR)
+
+def is_faststart(path):
+    for box_type in _top_level_atoms(path):
+        if box_type == "moov":
+            return True
+        if box_type == "mdat":
+            return False
+    return False
+
+def ensure_faststart(path):
+    """
+    Moves the moov atom to the front of an MP4-family file if it is not there
+    already (stream copy, no re-encode).
+    """
+    if not path or not path.lower().endswith(FASTSTART_EXTENSIONS) or not os.path.exists(path):
+        return path
+    try:
+        if is_faststart(path):
+            return path
+    except OSError:
+        return path
+
+    base, ext = os.path.splitext(path)
+    temp_path = f"{base}_faststart{ext}"
+    command = [
+        "ffmpeg", "-y", "-nostdin",
+        "-i", path,
+        "-map", "0",
+        "-c", "copy",
+        "-movflags", "+faststart",
+        temp_path
+    ]
+    try:
+        tracing.run(command, check=True)
+        os.replace(temp_path, path)
+    except Exception as e:
+        print(f"Warning: Could not apply fast-start to {path}: {e}")
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+    return path
+
+def copy_media(input_path, output_path):
+    """
+    Pass-through for operations with nothing to do: a plain file copy when the
+    container is unchanged (and already fast-start), otherwise a stream-copy
+    remux so the output always matches its extension.
+    """
+    same_ext = os.path.splitext(input_path)[1].lower() == os.path.splitext(output_path)[1].lower()
+    if same_ext and not output_path.lower().endswith(FASTSTART_EXTENSIONS):
+        shutil.copy(input_path, output_path)
+        return output_path
+    if same_ext and is_faststart(input_path):
+        shutil.copy(input_path, output_path)
+        return output_path
+
+    command = [
+        "ffmpeg", "-y", "-nostdin",
+        "-i", input_path,
+        "-map", "0:v:0?", "-map", "0:a:0?",
+        *codec_args("trim_video", output_path, stream_info(input_path)),
+        output_path
+    ]
+    tracing.run(command, check=True)
+    return output_path
+
+def _parse_duration(ffmpeg_stderr):
+    dur_match = re.search(r"Duration: (\d{2}):(\d{2}):(\d{2}\.\d{2})", ffmpeg_stderr)
+    if not dur_match:
+        return 0
+    h, m, s = map(float, dur_match.groups())
+    return h*3600 + m*60 + s
+
+def detect_silence(input_path, threshold="-30dB", min_silence_len=0.5):
+    """
+    Runs FFmpeg silencedetect once and returns (silences, duration), where
+    silences is a list of (start, end) tuples in seconds. Silence maps
+    precomputed at upload are read from the analysis sidecar.
+    """
+    cached = analysis.get(input_path, analysis.silence_key(threshold, min_silence_len))
+    if cached is not None:
+        silences, duration = cached
+        return [tuple(s) for s in silences], duration
 
-def remove_silence(input_path, output_path, threshold="-30dB", min_silence_len=0.5):
     command_detect = [
         "ffmpeg", "-i", input_path,
+        "-vn",
         "-af", f"silencedetect=noise={threshold}:d={min_silence_len}",
         "-f", "null", "-"
     ]
     
-    result = subprocess.run(command_detect, stderr=subprocess.PIPE, text=True)
-    output = result.stderr
+    result = tracing.run(command_detect, stderr=subprocess.PIPE, text=True)
+    return parse_silences(result.stderr)
+
+def parse_silences(output):
+    """
+    Parses silencedetect's log into (silences, duration).
+    """
+    duration = _parse_duration(output)
     
     silence_starts = [float(x) for x in re.findall(r"silence_start: ([\d\.]+)", output)]
     silence_ends = [float(x) for x in re.findall(r"silence_end: ([\d\.]+)", output)]
     
     if len(silence_starts) > len(silence_ends):
-        dur_cmd = ["ffmpeg", "-i", input_path, "-hide_banner"]
-        dur_res = subprocess.run(dur_cmd, stderr=subprocess.PIPE, text=True)
-        dur_match = re.search(r"Duration: (\d{2}):(\d{2}):(\d{2}\.\d{2})", dur_res.stderr)
-        if dur_match:
-            h, m, s = map(float, dur_match.groups())
-            duration = h*3600 + m*60 + s
+        if duration:
             silence_ends.append(duration)
         else:
             silence_starts = silence_starts[:len(silence_ends)]
-            
-    dur_cmd = ["ffmpeg", "-i", input_path, "-hide_banner"]
-    dur_res = subprocess.run(dur_cmd, stderr=subprocess.PIPE, text=True)
-    duration = 0
-    dur_match = re.search(r"Duration: (\d{2}):(\d{2}):(\d{2}\.\d{2})", dur_res.stderr)
-    if dur_match:
-        h, m, s = map(float, dur_match.groups())
-        duration = h*3600 + m*60 + s
+
+    return list(zip(silence_starts, silence_ends)), duration
+
+def remove_silence(input_path, output_path, threshold="-30dB", min_silence_len=0.5, silences=None, profile=None):
+    """
+    Cuts silent stretches. `silences` may be passed in precomputed (e.g. by the
+    segmented renderer) to skip detection.
+    """
+    if silences is None:
+        silences, duration = detect_silence(input_path, threshold, min_silence_len)
+    else:
+        duration = get_duration(input_path)
+
+    if not silences:
+        # Nothing to cut: a copy is identical and skips a full re-encode.
+        return copy_media(input_path, output_path)
     
     clips = []
     current_pos = 0.0
     
-    for start, end in zip(silence_starts, silence_ends):
+    for start, end in silences:
         if start > current_pos:
             clips.append((current_pos, start))
         current_pos = end
@@ -49,9 +167,7 @@ def remove_silence(input_path, output_path, threshold="-30dB", min_silence_len=0
         clips.append((current_pos, duration))
         
     if not clips:
-        import shutil
-        shutil.copy(input_path, output_path)
-        return output_path
+        return copy_media(input_path, output_path)
         
     filter_complex = ""
     for i, (start, end) in enumerate(clips):
@@ -68,69 +184,263 @@ def remove_silence(input_path, output_path, threshold="-30dB", min_silence_len=0
         "-i", input_path,
         "-filter_complex", filter_complex,
         "-map", "[outv]", "-map", "[outa]",
+        *codec_args("remove_silence", output_path, stream_info(input_path), profile),
         output_path
     ]
     
-    subprocess.run(command, check=True)
+    tracing.run(command, check=True)
     return output_path
 
-def adjust_speed(input_path, output_path, speed=1.5):
+def adjust_speed(input_path, output_path, speed=1.5, profile=None):
     speed = max(0.5, min(speed, 2.0))
+    info = stream_info(input_path)
+
+    if has_audio(info):
+        filter_args = [
+            "-filter_complex", f"[0:v]setpts=PTS/{speed}[v];[0:a]atempo={speed}[a]",
+            "-map", "[v]", "-map", "[a]",
+        ]
+    else:
+        filter_args = ["-filter:v", f"setpts=PTS/{speed}", "-map", "0:v:0"]
     
     command = [
         "ffmpeg", "-y", "-nostdin",
         "-i", input_path,
-        "-filter_complex", f"[0:v]setpts=PTS/{speed}[v];[0:a]atempo={speed}[a]",
-        "-map", "[v]", "-map", "[a]",
+        *filter_args,
+        *codec_args("adjust_speed", output_path, info, profile),
         output_path
     ]
     
-    subprocess.run(command, check=True)
+    tracing.run(command, check=True)
     return output_path
 
-def trim_video(input_path, output_path, start_trim=0, end_trim=0):
-    dur_cmd = ["ffmpeg", "-i", input_path, "-hide_banner"]
-    dur_res = subprocess.run(dur_cmd, stderr=subprocess.PIPE, text=True)
-    duration = 0
-    dur_match = re.search(r"Duration: (\d{2}):(\d{2}):(\d{2}\.\d{2})", dur_res.stderr)
-    if dur_match:
-        h, m, s = map(float, dur_match.groups())
-        duration = h*3600 + m*60 + s
+TRIM_MODE = os.environ.get("TRIM_MODE", "smart")
 
-    start_time = start_trim
-    
+# Codecs we can smart-cut, with the bitstream filter that puts parameter sets
+# in-band so re-encoded and copied pieces concat cleanly.
+SMART_CUT_CODECS = {
+    "h264": "h264_mp4toannexb",
+    "hevc": "hevc_mp4toannexb",
+}
+
+def write_concat_list(paths, list_path):
+    with open(list_path, "w", encoding="utf-8") as f:
+        for path in paths:
+            escaped = os.path.abspath(path).replace("\\", "/").replace("'", "'\\''")
+            f.write(f"file '{escaped}'\n")
+    return list_path
+
+def concat_files(paths, output_path, work_dir=None):
+    """
+    Joins files with identical stream layouts using the concat demuxer (no re-encode).
+    """
+    work_dir = work_dir or os.path.dirname(os.path.abspath(output_path))
+    list_path = write_concat_list(paths, os.path.join(work_dir, f"concat_{os.path.basename(output_path)}.txt"))
+
+    command = [
+        "ffmpeg", "-y", "-nostdin",
+        "-f", "concat", "-safe", "0",
+        "-i", list_path,
+        "-c", "copy",
+        *container_args(output_path),
+        output_path
+    ]
+    try:
+        tracing.run(command, check=True)
+    finally:
+        if os.path.exists(list_path):
+            os.remove(list_path)
+    return output_path
+
+# A spliced trim whose duration is further than this from the requested one
+# is treated as broken.
+SMART_CUT_DURATION_TOLERANCE = 0.5
+
+def _check_splice(output_path, joins, expected_duration):
+    """
+    Raises ValueError unless output_path probes to the expected duration and
+    decodes without errors for a second either side of every join.
+    """
+    duration = get_duration(output_path)
+    if abs(duration - expected_duration) > SMART_CUT_DURATION_TOLERANCE:
+        raise ValueError(f"spliced output is {duration:.3f}s, expected {expected_duration:.3f}s")
+    for join in joins:
+        result = tracing.run([
+            "ffmpeg", "-nostdin", "-v", "error", "-xerror",
+            "-ss", f"{max(0.0, join - 1):.6f}",
+            "-i", output_path,
+            "-t", "2",
+            "-map", "0:v:0",
+            "-f", "null", "-"
+        ], stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+        if result.returncode != 0 or result.stderr.strip():
+            raise ValueError(f"decode errors at the join at {join:.3f}s: {result.stderr.strip()[:200]}")
+
+def _smart_trim(input_path, output_path, cut_start, cut_end, duration, profile=None):
+    """
+    Frame-accurate trim that only re-encodes the partial GOPs at each cut:
+    [cut_start, first keyframe) and [last keyframe, cut_end) are encoded with
+    the source's profile, level and pixel format, the keyframe-aligned middle
+    is stream-copied, and audio is copied alongside. The joins are
+    decode-checked; any failure raises so the caller can re-encode instead.
+    """
+    info = stream_info(input_path)
+    video = info["video"]
+    if not video or video.get("codec_name") not in SMART_CUT_CODECS:
+        raise ValueError(f"unsupported video codec {video.get('codec_name') if video else None}")
+    bsf = SMART_CUT_CODECS[video["codec_name"]]
+    encode_args = splice_video_args(video, profile)
+
+    keyframes = get_keyframes(input_path)
+    if not keyframes:
+        raise ValueError("no keyframes found")
+
+    eps = 0.001
+    k1 = next((k for k in keyframes if k >= cut_start - eps), None)
+    if cut_end >= duration - eps:
+        # Cutting nothing off the end: copy straight through to EOF.
+        k2 = cut_end
+    else:
+        k2 = max((k for k in keyframes if k <= cut_end + eps), default=None)
+
+    work_dir = tempfile.mkdtemp(prefix="smartcut_", dir=os.path.dirname(os.path.abspath(output_path)))
+    pieces = []
+
+    def encode_piece(start, end):
+        path = os.path.join(work_dir, f"piece_{len(pieces)}.ts")
+        tracing.run([
+            "ffmpeg", "-y", "-nostdin",
+            "-ss", f"{start:.6f}",
+            "-i", input_path,
+            "-t", f"{end - start:.6f}",
+            "-map", "0:v:0", "-an",
+            *encode_args,
+            "-f", "mpegts",
+            path
+        ], check=True)
+        pieces.append(path)
+
+    def copy_piece(start, end):
+        path = os.path.join(work_dir, f"piece_{len(pieces)}.ts")
+        # Seeking just past the keyframe makes the demuxer land exactly on it.
+        tracing.run([
+            "ffmpeg", "-y", "-nostdin",
+            "-ss", f"{start + eps:.6f}",
+            "-i", input_path,
+            "-t", f"{end - start - eps:.6f}",
+            "-map", "0:v:0", "-an",
+            "-c:v", "copy", "-bsf:v", bsf,
+            "-f", "mpegts",
+            path
+        ], check=True)
+        pieces.append(path)
+
+    joins = []
+    try:
+        if k1 is None or k2 is None or k2 <= k1:
+            # The whole range sits inside one GOP; encoding it is already cheap.
+            encode_piece(cut_start, cut_end)
+        else:
+            if k1 - cut_start > eps:
+                encode_piece(cut_start, k1)
+                joins.append(k1 - cut_start)
+            copy_piece(k1, k2)
+            if cut_end - k2 > eps:
+                encode_piece(k2, cut_end)
+                joins.append(k2 - cut_start)
+
+        # Keep the source's timebase so copied timestamps aren't rounded.
+        timescale = []
+        time_base = video.get("time_base", "")
+        if output_path.lower().endswith(FASTSTART_EXTENSIONS) and time_base.startswith("1/"):
+            timescale = ["-video_track_timescale", time_base[2:]]
+
+        list_path = write_concat_list(pieces, os.path.join(work_dir, "pieces.txt"))
+        command = [
+            "ffmpeg", "-y", "-nostdin",
+            "-f", "concat", "-safe", "0", "-i", list_path,
+            "-ss", f"{cut_start:.6f}", "-t", f"{cut_end - cut_start:.6f}", "-i", input_path,
+            "-map", "0:v:0", "-map", "1:a:0?",
+            *codec_args("trim_video", output_path, info, profile),
+            *timescale,
+            output_path
+        ]
+        tracing.run(command, check=True)
+        _check_splice(output_path, joins, cut_end - cut_start)
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    tracing.annotate(smart_cut_pieces=len(pieces), smart_cut_copied=(k1, k2))
+    return output_path
+
+def _reencode_trim(input_path, output_path, cut_start, cut_end, profile=None):
+    """
+    Frame-accurate trim by re-encoding the video; audio is copied when the
+    container allows it.
+    """
+    info = stream_info(input_path)
+    audio = codec_args("trim_video", output_path, {"video": None, "audio": info["audio"]}, profile)
+    command = [
+        "ffmpeg", "-y", "-nostdin",
+        "-ss", f"{cut_start:.6f}",
+        "-i", input_path,
+        "-t", f"{cut_end - cut_start:.6f}",
+        "-map", "0:v:0", "-map", "0:a:0?",
+        *video_args(profile),
+        *audio,
+        output_path
+    ]
+    tracing.run(command, check=True)
+    return output_path
+
+def trim_video(input_path, output_path, start_trim=0, end_trim=0, mode=None, profile=None):
+    """
+    Removes start_trim seconds from the start and end_trim seconds from the end.
+    - "smart" (default): frame-accurate; only the partial GOPs at the cuts are
+      re-encoded, or the whole video when the source can't be matched.
+    - "copy": keyframe-snapped stream copy (fastest, may be off by up to one GOP).
+    """
+    mode = mode or TRIM_MODE
+    duration = get_duration(input_path)
     new_duration = duration - start_trim - end_trim
     
     if new_duration <= 0:
-        import shutil
-        shutil.copy(input_path, output_path)
-        return output_path
-        
+        return copy_media(input_path, output_path)
+
+    if mode == "smart":
+        try:
+            return _smart_trim(input_path, output_path, start_trim, duration - end_trim, duration, profile)
+        except Exception as e:
+            print(f"Smart-cut unavailable ({e}). Re-encoding the trim...")
+            return _reencode_trim(input_path, output_path, start_trim, duration - end_trim, profile)
+
     command = [
         "ffmpeg", "-y", "-nostdin",
-        "-ss", str(start_time),
+        "-ss", str(start_trim),
         "-i", input_path,
         "-t", str(new_duration),
-        "-c", "copy",
+        *codec_args("trim_video", output_path, stream_info(input_path), profile),
         output_path
     ]
     
-    subprocess.run(command, check=True)
+    tracing.run(command, check=True)
     return output_path
 
-def add_captions(input_path, output_path, target_language=None):
+def add_captions(input_path, output_path, target_language=None, srt_content=None, profile=None):
     """
-    Leverages Gemini API for high-speed transcription and translation.
+    Burns in captions transcribed (and translated) by Whisper or Gemini.
+    A precomputed `srt_content` skips transcription; an empty one still re-encodes
+    (used for caption-free chunks in segmented renders).
     """
-    srt_content = generate_srt_gemini(input_path, target_language)
+    if srt_content is None:
+        srt_content = transcribe_srt(analysis.audio_source(input_path), target_language)
     
     if srt_content.startswith("Error"):
         raise Exception(f"Caption Generation Failed: {srt_content}")
 
-    # Use a fixed, space-free filename for the temporary SRT
-    temp_srt_filename = f"temp_captions_{uuid.uuid4().hex[:8]}.srt"
-    # Place SRT in current working directory (project root) to avoid path escaping issues
-    temp_srt_path = temp_srt_filename
+    # Space-free filename for the temporary SRT, in the job's scratch space
+    # (or the project root outside a job) to avoid path escaping issues
+    temp_srt_path = scratch.temp_path("temp_captions_", ".srt")
     
     with open(temp_srt_path, "w", encoding="utf-8") as f:
         f.write(srt_content)
@@ -160,23 +470,26 @@ def add_captions(input_path, output_path, target_language=None):
     abs_srt_path = os.path.abspath(temp_srt_path).replace("\\", "/")
     abs_srt_path = abs_srt_path.replace(":", "\\:")
     
+    subtitle_filter = f"subtitles='{abs_srt_path}':force_style='{style}'" if srt_content.strip() else "null"
+    
     command = [
         "ffmpeg", "-y", "-nostdin",
         "-i", abs_input_path,
-        "-vf", f"subtitles='{abs_srt_path}':force_style='{style}'",
-        "-c:a", "copy",
+        "-vf", subtitle_filter,
+        *codec_args("add_captions", abs_output_path, stream_info(abs_input_path), profile),
         abs_output_path
     ]
     
-    # Run FFmpeg from the current directory where the SRT file is located
-    subprocess.run(command, check=True)
-    
-    # Clean up temporary SRT file
     try:
-        if os.path.exists(temp_srt_path):
-            os.remove(temp_srt_path)
-    except Exception as e:
-        print(f"Warning: Could not remove temp srt: {e}")
+        # Run FFmpeg from the current directory where the SRT file is located
+        tracing.run(command, check=True)
+    finally:
+        # Clean up temporary SRT file (also when FFmpeg fails)
+        try:
+            if os.path.exists(temp_srt_path):
+                os.remove(temp_srt_path)
+        except Exception as e:
+            print(f"Warning: Could not remove temp srt: {e}")
     
     return output_path
 
@@ -185,18 +498,16 @@ def get_speech_intervals_local(input_path):
     Uses FFmpeg silencedetect to find speech intervals.
     A professional local fallback when AI is unavailable.
     """
-    import subprocess
-    import re
-
     # detect silence
     command = [
         "ffmpeg", "-i", input_path,
+        "-vn",
         "-af", "silencedetect=noise=-35dB:d=0.2",
         "-f", "null", "-"
     ]
     
     # Run synchronously to capture stderr where silencedetect outputs its data
-    result = subprocess.run(command, capture_output=True, text=True, stderr=subprocess.STDOUT)
+    result = tracing.run(command, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True)
     output = result.stdout
 
     silence_starts = [float(m) for m in re.findall(r"silence_start: ([\d.]+)", output)]
@@ -230,7 +541,38 @@ def get_speech_intervals_local(input_path):
         
     return speech_intervals
 
-def remove_noise(input_path, output_path):
+def srt_to_intervals(srt_content):
+    """
+    Returns the (start, end) seconds of every cue in an SRT document.
+    """
+    timestamp_pattern = re.compile(r"(\d{2}:\d{2}:\d{2},\d{3}) --> (\d{2}:\d{2}:\d{2},\d{3})")
+    intervals = []
+    
+    def to_sec(s):
+        h, m, sm = s.split(":")
+        sec, ms = sm.split(",")
+        return int(h)*3600 + int(m)*60 + int(sec) + int(ms)/1000.0
+
+    for line in srt_content.splitlines():
+        match = timestamp_pattern.search(line)
+        if match:
+            start_str, end_str = match.groups()
+            intervals.append((to_sec(start_str), to_sec(end_str)))
+    return intervals
+
+def get_speech_intervals(input_path):
+    """
+    Speech intervals for the noise gate: transcript timing (Whisper or Gemini,
+    see services/transcribe.py), with local silence detection as the fallback.
+    """
+    audio_path = analysis.audio_source(input_path)
+    srt_content = transcribe_srt(audio_path)
+    if srt_content.startswith("Error"):
+        print("AI Gating Unavailable. Switching to Local-Mastery Silence Detection...")
+        return get_speech_intervals_local(audio_path)
+    return srt_to_intervals(srt_content)
+
+def remove_noise(input_path, output_path, intervals=None, profile=None):
     """
     Nuclear-Grade Speech Enhancement (MAX Aggressive):
     1. Stage 1: Plosive/Rumble Kill (Highpass 100Hz).
@@ -238,10 +580,11 @@ def remove_noise(input_path, output_path):
     3. Stage 3: Non-linear Means Smoothing (Aggressive).
     4. Stage 4: Surgical Audio Gate (Aggressive Threshold).
     5. Stage 5: Speech Normalization (Consistent Levels).
-    6. Stage 6: The Absolute Void Gate (AI-driven).
+    6. Stage 6: The Absolute Void Gate (AI-driven, or precomputed `intervals`).
     """
     print(f"Deploying NUCLEAR-GRADE accuracy engine for {os.path.basename(input_path)}...")
-    srt_content = generate_srt_gemini(input_path)
+    if intervals is None:
+        intervals = get_speech_intervals(input_path)
     
     # Nuclear Filter Chain for extreme noise environments
     # afftdn: nr=40 (very aggressive), nf=-20 (handles louder noise floor)
@@ -257,31 +600,12 @@ def remove_noise(input_path, output_path):
         "lowpass=f=10000"
     )
 
-    if srt_content.startswith("Error"):
-        print("AI Gating Unavailable. Switching to Local-Mastery Silence Detection...")
-        intervals = get_speech_intervals_local(input_path)
+    if not intervals:
+        af_filters = base_vocal_chain
     else:
-        import re
-        timestamp_pattern = re.compile(r"(\d{2}:\d{2}:\d{2},\d{3}) --> (\d{2}:\d{2}:\d{2},\d{3})")
-        intervals = []
-        
-        def to_sec(s):
-            h, m, sm = s.split(":")
-            sec, ms = sm.split(",")
-            return int(h)*3600 + int(m)*60 + int(sec) + int(ms)/1000.0
-
-        for line in srt_content.splitlines():
-            match = timestamp_pattern.search(line)
-            if match:
-                start_str, end_str = match.groups()
-                intervals.append((to_sec(start_str), to_sec(end_str)))
-        
-        if not intervals:
-            af_filters = base_vocal_chain
-        else:
-            # Stage 6: The Void Gate
-            conditions = "+".join([f"between(t,{s:.3f},{e:.3f})" for s, e in intervals])
-            af_filters = f"{base_vocal_chain},volume='if({conditions},1,0)':eval=frame"
+        # Stage 6: The Void Gate
+        conditions = "+".join([f"between(t,{s:.3f},{e:.3f})" for s, e in intervals])
+        af_filters = f"{base_vocal_chain},volume='if({conditions},1,0)':eval=frame"
 
     print(f"DEBUG: Final Audio Filter String: '{af_filters}'")
 
@@ -289,19 +613,21 @@ def remove_noise(input_path, output_path):
         "ffmpeg", "-y", "-nostdin",
         "-i", input_path,
         "-af", af_filters,
-        "-vcodec", "copy",
+        *codec_args("remove_noise", output_path, stream_info(input_path), profile),
         output_path
     ]
     
-    subprocess.run(command, check=True)
+    tracing.run(command, check=True)
     return output_path
 
-def remove_background(input_path, output_path):
+def remove_background(input_path, output_path, workers=None, profile=None):
     """
     Pro-Grade Background Removal:
     1. Uses Rembg (U2Net/ONNX) for surgical subject isolation.
     2. Replaces background with pure solid chroma green (#00FF00).
     3. Merges audio back for a professional final clip.
+
+    Frames are segmented in parallel on `workers` threads (FRAME_WORKERS by default).
     """
     from rembg import remove, new_session
     import cv2
@@ -320,20 +646,19 @@ def remove_background(input_path, output_path):
     height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
     fps = cap.get(cv2.CAP_PROP_FPS)
 
-    # Temporary path for video reconstruction
-    temp_silent_path = os.path.join(os.path.dirname(output_path), f"temp_rembg_{os.path.basename(output_path)}")
+    # Temporary path for video reconstruction (plain MP4 for HLS outputs)
+    temp_name = os.path.basename(output_path)
+    if temp_name.lower().endswith(".m3u8"):
+        temp_name = os.path.splitext(temp_name)[0] + ".mp4"
+    temp_silent_path = os.path.join(os.path.dirname(output_path), f"temp_rembg_{temp_name}")
     
     # Use cv2 + libx264 for high-quality intermediate
     fourcc = cv2.VideoWriter_fourcc(*'mp4v')
     out = cv2.VideoWriter(temp_silent_path, fourcc, fps, (width, height))
 
     print(f"Executing Pro-Grade AI Isolation for {os.path.basename(input_path)}...")
-    
-    while cap.isOpened():
-        ret, frame = cap.read()
-        if not ret:
-            break
 
+    def isolate(frame):
         # Convert BGR (cv2) to RGB (PIL/Rembg)
         img = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
         pil_img = Image.fromarray(img)
@@ -344,11 +669,20 @@ def remove_background(input_path, output_path):
         isolated_pil = remove(pil_img, bgcolor=(0, 255, 0, 255), session=session)
         
         # Convert back to BGR for VideoWriter
-        output_frame = cv2.cvtColor(np.array(isolated_pil), cv2.COLOR_RGBA2BGR)
-        out.write(output_frame)
+        return cv2.cvtColor(np.array(isolated_pil), cv2.COLOR_RGBA2BGR)
 
-    cap.release()
-    out.release()
+    # The onnxruntime session is shared; its run() is thread-safe.
+    # process_frames re-raises worker errors: release both handles either way.
+    try:
+        process_frames(cap, out, isolate, workers=workers)
+    except Exception:
+        out.release()
+        if os.path.exists(temp_silent_path):
+            os.remove(temp_silent_path)
+        raise
+    finally:
+        cap.release()
+        out.release()
 
     # Final FFmpeg pass: Restore audio and fix orientation/encoding
     try:
@@ -356,63 +690,100 @@ def remove_background(input_path, output_path):
             "ffmpeg", "-y", "-nostdin",
             "-i", temp_silent_path,
             "-i", input_path,
-            "-c:v", "libx264",
-            "-pix_fmt", "yuv420p",
             "-map", "0:v:0",
             "-map", "1:a:0?",
+            *codec_args("remove_background", output_path, stream_info(input_path), profile),
             "-shortest",
             output_path
         ]
-        subprocess.run(command_merge, check=True)
+        tracing.run(command_merge, check=True)
     except Exception as e:
         print(f"Merge Error: {e}")
-        os.replace(temp_silent_path, output_path)
+        # Without its audio; remuxed so an HLS output still gets its playlist
+        copy_media(temp_silent_path, output_path)
     finally:
         if os.path.exists(temp_silent_path):
             os.remove(temp_silent_path)
 
     return output_path
 
-def resize_to_vertical(input_path, output_path):
+def resize_to_vertical(input_path, output_path, profile=None):
     command = [
         "ffmpeg", "-y", "-nostdin",
         "-i", input_path,
         "-vf", "crop=ih*(9/16):ih",
-        "-c:a", "copy",
+        *codec_args("resize_to_vertical", output_path, stream_info(input_path), profile),
         output_path
     ]
     
-    subprocess.run(command, check=True)
+    tracing.run(command, check=True)
     return output_path
 
-def resize_to_horizontal(input_path, output_path):
+def resize_to_horizontal(input_path, output_path, profile=None):
     command = [
         "ffmpeg", "-y", "-nostdin",
         "-i", input_path,
         "-vf", "crop=iw:iw*(9/16)",
-        "-c:a", "copy",
+        *codec_args("resize_to_horizontal", output_path, stream_info(input_path), profile),
         output_path
     ]
     
-    subprocess.run(command, check=True)
+    tracing.run(command, check=True)
     return output_path
 
-def extract_audio(input_path, output_path):
+AUDIO_PASSTHROUGH = os.environ.get("AUDIO_PASSTHROUGH", "0") == "1"
+
+def extract_audio(input_path, output_path, passthrough=None, profile=None):
+    """
+    Saves the audio track. MP3 sources are stream-copied; with passthrough
+    (AUDIO_PASSTHROUGH=1) AAC/ALAC sources are copied into an .m4a instead of
+    being transcoded to MP3.
+    """
+    if passthrough is None:
+        passthrough = AUDIO_PASSTHROUGH
+
+    info = stream_info(input_path)
+    codec = info["audio"].get("codec_name") if info["audio"] else None
+
     base, _ = os.path.splitext(output_path)
-    audio_output = base + ".mp3"
+    audio_output = base + (".m4a" if passthrough and codec in ("aac", "alac") else ".mp3")
     
     command = [
         "ffmpeg", "-y", "-nostdin",
         "-i", input_path,
-        "-vn", 
-        "-acodec", "libmp3lame",
-        "-q:a", "2", 
+        "-map", "0:a:0",
+        *codec_args("extract_audio", audio_output, info, profile),
         audio_output
     ]
     
-    subprocess.run(command, check=True)
+    tracing.run(command, check=True)
     return audio_output
 
+PREVIEW_HEIGHT = int(os.environ.get("PREVIEW_HEIGHT", "360"))
+
+def make_proxy(input_path, output_path, height=None, max_seconds=None):
+    """
+    Low-resolution, short-GOP proxy used for preview renders. Keeps the source
+    timeline (unless max_seconds cuts it short) so analysis done on it is valid
+    for the full-quality render.
+    """
+    height = height or PREVIEW_HEIGHT
+    command = [
+        "ffmpeg", "-y", "-nostdin",
+        "-i", input_path,
+    ]
+    if max_seconds:
+        command += ["-t", str(max_seconds)]
+    command += [
+        "-map", "0:v:0", "-map", "0:a:0?",
+        "-vf", f"scale=-2:'min({height},ih)'",
+        *codec_args("make_proxy", output_path, stream_info(input_path), "preview"),
+        "-g", "15",
+        output_path
+    ]
+    tracing.run(command, check=True)
+    return output_path
+
 def summarize_video(input_path, output_path, user_prompt: str = ""):
     """
     Performs deep AI analysis using Gemini.
@@ -434,10 +805,10 @@ def generate_new_video(output_path, prompt, model: str = 'veo-3.1-generate-previ
     """
     return generate_video_veo(prompt, output_path, model=model)
 
-def remove_watermark(input_path, output_path, location="bottom_right", watermark_type="small_logo", custom_w=None, custom_h=None, strategy="heal"):
+def remove_watermark(input_path, output_path, location="bottom_right", watermark_type="small_logo", custom_w=None, custom_h=None, strategy="heal", workers=None, profile=None):
     """
     Advanced Watermark Removal:
-    - "heal": Uses AI inpainting (OpenCV) with feathered edges.
+    - "heal": Uses AI inpainting (OpenCV) with feathered edges, parallelised across `workers` threads.
     - "crop": Professional zero-blur edge removal (Best for corners).
     - "fast": Lightning-fast FFmpeg delogo.
     """
@@ -464,6 +835,7 @@ def remove_watermark(input_path, output_path, location="bottom_right", watermark
 
     if strategy == "fast":
         print(f"DEBUG: Using Lightning-Fast Strategy for {location}...")
+        cap.release()
         # Resolve dimensions for FFmpeg
         if custom_w and custom_w > 0:
             logo_w = int(w * (custom_w / 100))
@@ -502,14 +874,15 @@ def remove_watermark(input_path, output_path, location="bottom_right", watermark
             "ffmpeg", "-y", "-nostdin",
             "-i", os.path.abspath(input_path),
             "-vf", f"delogo=x={x}:y={y}:w={logo_w}:h={logo_h}",
-            "-c:v", "libx264", "-pix_fmt", "yuv420p", "-c:a", "copy",
+            *codec_args("remove_watermark", output_path, stream_info(input_path), profile),
             os.path.abspath(output_path)
         ]
-        subprocess.run(command, check=True)
+        tracing.run(command, check=True)
         return output_path
 
     if strategy == "crop" and not any(k in location for k in ["center", "middle", "full_width"]):
         print(f"DEBUG: Using Pro-Crop Strategy for zero-blur removal at {location}...")
+        cap.release()
         # Crop logic: Remove 8-10% of the edge where the logo sits
         crop_w, crop_h = w, h
         x_offset, y_offset = 0, 0
@@ -539,12 +912,10 @@ def remove_watermark(input_path, output_path, location="bottom_right", watermark
             "ffmpeg", "-y", "-nostdin",
             "-i", os.path.abspath(input_path),
             "-vf", f"crop={crop_w}:{crop_h}:{x_offset}:{y_offset},scale={w}:{h}:flags=bicubic",
-            "-c:v", "libx264",
-            "-pix_fmt", "yuv420p",
-            "-c:a", "copy",
+            *codec_args("remove_watermark", output_path, stream_info(input_path), profile),
             os.path.abspath(output_path)
         ]
-        subprocess.run(command, check=True)
+        tracing.run(command, check=True)
         return output_path
 
     # If we are here, we use HEAL (Standard for middle/banners)
@@ -594,7 +965,6 @@ def remove_watermark(input_path, output_path, location="bottom_right", watermark
 
     print(f"Executing AI HEAL (Feathered) for {int(cap.get(cv2.CAP_PROP_FRAME_COUNT))} frames...")
     
-    frame_count = 0
     total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
     
     # Pre-calculate common alpha values
@@ -602,23 +972,28 @@ def remove_watermark(input_path, output_path, location="bottom_right", watermark
     alpha = cv2.merge([alpha, alpha, alpha])
     inv_alpha = 1.0 - alpha
 
-    while cap.isOpened():
-        ret, frame = cap.read()
-        if not ret: break
-
-        if frame_count % 30 == 0:
-            print(f"DEBUG: Healing Progress: {frame_count}/{total_frames} frames ({(frame_count/total_frames)*100:.1f}%)")
-
+    def heal(frame):
         # Healing
         healed = cv2.inpaint(frame, mask, 3, cv2.INPAINT_TELEA)
         
         # Alpha blend (Optimized with pre-calc)
         final_frame = (healed.astype(float) * alpha) + (frame.astype(float) * inv_alpha)
-        out.write(final_frame.astype(np.uint8))
-        frame_count += 1
+        return final_frame.astype(np.uint8)
+
+    def report(frame_count):
+        if frame_count % 30 == 0 and total_frames > 0:
+            print(f"DEBUG: Healing Progress: {frame_count}/{total_frames} frames ({(frame_count/total_frames)*100:.1f}%)")
 
-    cap.release()
-    out.release()
+    try:
+        process_frames(cap, out, heal, workers=workers, on_progress=report)
+    except Exception:
+        out.release()
+        if os.path.exists(temp_processed_path):
+            os.remove(temp_processed_path)
+        raise
+    finally:
+        cap.release()
+        out.release()
 
     # Final pass to restore audio
     try:
@@ -626,17 +1001,16 @@ def remove_watermark(input_path, output_path, location="bottom_right", watermark
             "ffmpeg", "-y", "-nostdin",
             "-i", temp_processed_path,
             "-i", input_path,
-            "-c:v", "libx264",
-            "-pix_fmt", "yuv420p",
             "-map", "0:v:0",
             "-map", "1:a:0?",
+            *codec_args("remove_watermark", output_path, stream_info(input_path), profile),
             "-shortest",
             output_path
         ]
-        subprocess.run(command_merge, check=True)
+        tracing.run(command_merge, check=True)
     except Exception as e:
         print(f"Healing Merge Error: {e}")
-        os.replace(temp_processed_path, output_path)
+        copy_media(temp_processed_path, output_path)
     finally:
         if os.path.exists(temp_processed_path):
             os.remove(temp_processed_path)
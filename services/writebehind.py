@@ -0,0 +1,257 @@
+"""
+Write-behind buffer for MongoDB writes that don't need to land before the
+response: inserts (feedback) and usage counters.
+
+    writebehind.insert("feedback", {...})
+    writebehind.increment("users", {"email": email}, "jobs_run", 1)
+
+Writes are queued in memory and flushed by one background thread every
+WRITEBEHIND_INTERVAL seconds, or sooner once WRITEBEHIND_BATCH are waiting:
+inserts as one insert_many per collection, counter updates coalesced per
+document and sent as one bulk_write. While MongoDB is unreachable, batches
+are appended to WRITEBEHIND_SPILL_PATH (JSON lines) and replayed on the next
+successful flush. The server flushes on shutdown.
+
+Counters here are statistics: nothing decides anything from them, so reads
+don't account for increments still in the buffer. Counters that gate work
+(trials_left) are updated synchronously in services/accounts.py.
+"""
+import os
+import threading
+
+from bson import ObjectId, json_util
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError, PyMongoError
+
+from database import get_db
+from services import metrics
+
+WRITEBEHIND = os.environ.get("WRITEBEHIND", "1") == "1"
+WRITEBEHIND_INTERVAL = float(os.environ.get("WRITEBEHIND_INTERVAL", "2"))
+WRITEBEHIND_BATCH = int(os.environ.get("WRITEBEHIND_BATCH", "100"))
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+WRITEBEHIND_SPILL_PATH = os.environ.get("WRITEBEHIND_SPILL_PATH", os.path.join(BASE_DIR, "writebehind_spill.jsonl"))
+
+DUPLICATE_KEY = 11000
+
+FLUSHED = metrics.Counter("writebehind_flushed_total", "Buffered writes sent to MongoDB.", ("op",))
+SPILLED = metrics.Counter("writebehind_spilled_total", "Buffered writes appended to the spill file.", ("op",))
+DROPPED = metrics.Counter("writebehind_dropped_total", "Buffered writes MongoDB rejected.", ("op",))
+PENDING = metrics.Gauge("writebehind_pending", "Writes waiting in the write-behind buffer.")
+
+_lock = threading.Lock()
+_flush_lock = threading.Lock()
+_wake = threading.Event()
+_stop = threading.Event()
+_thread = None
+_inserts = []
+# (collection, filter as JSON, field) -> [filter, amount]
+_counters = {}
+
+
+def _counter_key(collection, filter, field):
+    return collection, json_util.dumps(filter, sort_keys=True), field
+
+
+def _queued():
+    return len(_inserts) + len(_counters)
+
+
+def insert(collection, document):
+    """
+    Queues an insert. The document gets its _id now, so a replay after a
+    partial failure can't insert it twice.
+    """
+    document = dict(document)
+    document.setdefault("_id", ObjectId())
+    if not WRITEBEHIND:
+        _spill(_write([{"op": "insert", "collection": collection, "doc": document}]))
+        return
+    with _lock:
+        _inserts.append({"op": "insert", "collection": collection, "doc": document})
+        size = _queued()
+    PENDING.set(size)
+    _after_queue(size)
+
+
+def increment(collection, filter, field, amount=1):
+    """
+    Queues {"$inc": {field: amount}} on the document matching filter;
+    increments of the same field are summed until the next flush.
+    """
+    if not WRITEBEHIND:
+        _spill(_write([{"op": "inc", "collection": collection, "filter": filter, "field": field, "amount": amount}]))
+        return
+    key = _counter_key(collection, filter, field)
+    with _lock:
+        entry = _counters.setdefault(key, [filter, 0])
+        entry[1] += amount
+        size = _queued()
+    PENDING.set(size)
+    _after_queue(size)
+
+
+def _after_queue(size):
+    start()
+    if size >= WRITEBEHIND_BATCH:
+        _wake.set()
+
+
+def _take():
+    global _inserts, _counters
+    with _lock:
+        records = _inserts
+        for key, (filter, amount) in _counters.items():
+            if amount:
+                records.append({"op": "inc", "collection": key[0], "filter": filter, "field": key[2], "amount": amount})
+        _inserts, _counters = [], {}
+    PENDING.set(0)
+    return records
+
+
+def _replay_path():
+    return f"{WRITEBEHIND_SPILL_PATH}.replay"
+
+
+def _read_spill():
+    """
+    Spilled records to retry. The spill file is moved aside first, so records
+    spilled again during this flush start a fresh file; a .replay file left
+    by a crash mid-flush is retried as is.
+    """
+    replay = _replay_path()
+    if not os.path.exists(replay):
+        try:
+            os.replace(WRITEBEHIND_SPILL_PATH, replay)
+        except FileNotFoundError:
+            return []
+    records = []
+    with open(replay, "r", encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                try:
+                    records.append(json_util.loads(line))
+                except ValueError:
+                    print(f"Write-behind: skipping unreadable spill line: {line[:200]!r}")
+    return records
+
+
+def _spill(records):
+    if not records:
+        return
+    with open(WRITEBEHIND_SPILL_PATH, "a", encoding="utf-8") as f:
+        for record in records:
+            f.write(json_util.dumps(record) + "\n")
+        f.flush()
+        os.fsync(f.fileno())
+    for record in records:
+        SPILLED.inc(op=record["op"])
+
+
+def _write(records):
+    """
+    Sends records to MongoDB. Returns the ones to retry later (MongoDB
+    unreachable); records MongoDB rejects outright are logged and dropped.
+    """
+    db = get_db()
+    if db is None:
+        return list(records)
+    retry = []
+
+    inserts = {}
+    counters = {}
+    for record in records:
+        group = inserts if record["op"] == "insert" else counters
+        group.setdefault(record["collection"], []).append(record)
+
+    for collection, batch in inserts.items():
+        try:
+            db[collection].insert_many([r["doc"] for r in batch], ordered=False)
+            FLUSHED.inc(len(batch), op="insert")
+        except BulkWriteError as e:
+            errors = e.details.get("writeErrors", [])
+            # Duplicate _id: already written by an earlier, partly failed flush
+            rejected = [err for err in errors if err.get("code") != DUPLICATE_KEY]
+            for err in rejected:
+                print(f"Write-behind: {collection} insert rejected: {err.get('errmsg')}")
+            DROPPED.inc(len(rejected), op="insert")
+            FLUSHED.inc(len(batch) - len(rejected), op="insert")
+        except PyMongoError as e:
+            print(f"Write-behind: {collection} insert failed ({e}); spilling {len(batch)}")
+            retry.extend(batch)
+
+    for collection, batch in counters.items():
+        operations = [UpdateOne(r["filter"], {"$inc": {r["field"]: r["amount"]}}) for r in batch]
+        try:
+            db[collection].bulk_write(operations, ordered=True)
+            FLUSHED.inc(len(batch), op="inc")
+        except BulkWriteError as e:
+            # Ordered: everything before the failed update was applied,
+            # everything after it wasn't attempted
+            index = e.details["writeErrors"][0]["index"]
+            print(f"Write-behind: {collection} update rejected: {e.details['writeErrors'][0].get('errmsg')}")
+            DROPPED.inc(op="inc")
+            FLUSHED.inc(index, op="inc")
+            retry.extend(batch[index + 1:])
+        except PyMongoError as e:
+            print(f"Write-behind: {collection} updates failed ({e}); spilling {len(batch)}")
+            retry.extend(batch)
+    return retry
+
+
+def flush():
+    """
+    Writes everything queued (and anything spilled earlier) now.
+    """
+    with _flush_lock:
+        taken = _take()
+        try:
+            records = _read_spill() + taken
+        except OSError as e:
+            print(f"Write-behind: could not read spill file: {e}")
+            records = taken
+        if not records:
+            return
+        try:
+            retry = _write(records)
+        except Exception as e:
+            print(f"Write-behind: flush failed ({e}); spilling {len(records)}")
+            retry = records
+        _spill(retry)
+        if os.path.exists(_replay_path()):
+            os.remove(_replay_path())
+
+
+def _run():
+    while not _stop.is_set():
+        _wake.wait(WRITEBEHIND_INTERVAL)
+        _wake.clear()
+        try:
+            flush()
+        except Exception as e:
+            print(f"Write-behind: {e}")
+
+
+def start():
+    """
+    Starts the flush thread (idempotent); it also retries spilled writes.
+    """
+    global _thread
+    if not WRITEBEHIND:
+        return
+    with _lock:
+        if _thread is None or not _thread.is_alive():
+            _stop.clear()
+            _thread = threading.Thread(target=_run, name="writebehind", daemon=True)
+            _thread.start()
+
+
+def stop():
+    """
+    Stops the flush thread and writes (or spills) whatever is left.
+    """
+    _stop.set()
+    _wake.set()
+    if _thread is not None:
+        _thread.join(WRITEBEHIND_INTERVAL + 30)
+    flush()
@@ -10,7 +10,7 @@ document.addEventListener("DOMContentLoaded", () => {
 
     // Check if user is already logged in
     const userEmail = localStorage.getItem("promptx_user_email");
-    if (userEmail) {
+    if (userEmail && localStorage.getItem("promptx_session")) {
         window.location.href = "/app";
     }
 
@@ -53,6 +53,7 @@ document.addEventListener("DOMContentLoaded", () => {
                 loginError.innerText = data.detail || "Error signing in";
             } else {
                 localStorage.setItem("promptx_user_email", data.email);
+                localStorage.setItem("promptx_session", data.token);
                 localStorage.setItem("promptX_usage_count", 5 - data.trials_left); // Translate trials left to usage count or handle it from DB directly.
                 window.location.href = "/app";
             }
@@ -86,6 +87,7 @@ document.addEventListener("DOMContentLoaded", () => {
                 signupError.innerText = data.detail || "Error signing up";
             } else {
                 localStorage.setItem("promptx_user_email", data.email);
+                localStorage.setItem("promptx_session", data.token);
                 localStorage.setItem("promptX_usage_count", 0); // 0 used means 5 remaining
                 window.location.href = "/app";
             }
@@ -1,10 +1,22 @@
 document.addEventListener("DOMContentLoaded", () => {
   // ========== AUTHENTICATION CHECK ==========
   const userEmail = localStorage.getItem("promptx_user_email");
-  if (!userEmail) {
+  // Signed session token from sign-in; identifies the user to the API
+  const sessionToken = localStorage.getItem("promptx_session");
+  if (!userEmail || !sessionToken) {
     window.location.href = "/";
     return;
   }
+  const authHeaders = { "Authorization": `Bearer ${sessionToken}` };
+
+  // Session missing or expired: sign in again
+  function sessionExpired(response) {
+    if (response.status !== 401) return false;
+    localStorage.removeItem("promptx_user_email");
+    localStorage.removeItem("promptx_session");
+    window.location.href = "/";
+    return true;
+  }
 
   // ========== DOM ELEMENTS ==========
   const processBtn = document.getElementById("processBtn");
@@ -21,6 +33,7 @@ document.addEventListener("DOMContentLoaded", () => {
     logoutBtn.addEventListener("click", (e) => {
       e.preventDefault();
       localStorage.removeItem("promptx_user_email");
+      localStorage.removeItem("promptx_session");
       localStorage.removeItem("promptX_usage_count");
       window.location.href = "/";
     });
@@ -118,6 +131,34 @@ document.addEventListener("DOMContentLoaded", () => {
     voiceBtn.style.display = "none";
   }
 
+  // ========== PROGRESSIVE PLAYBACK ==========
+  // Large uploads are rendered as HLS so playback can start while later
+  // segments are still being written.
+  const HLS_MIN_UPLOAD_BYTES = 50 * 1024 * 1024;
+
+  function attachStream(videoEl, url) {
+    if (!videoEl || !url.endsWith(".m3u8")) return;
+    if (videoEl.canPlayType("application/vnd.apple.mpegurl")) {
+      videoEl.src = url;
+      return;
+    }
+    const startHls = () => {
+      const hls = new window.Hls();
+      hls.loadSource(url);
+      hls.attachMedia(videoEl);
+    };
+    if (window.Hls) {
+      startHls();
+      return;
+    }
+    const script = document.createElement("script");
+    script.src = "https://cdn.jsdelivr.net/npm/hls.js@1";
+    script.onload = () => {
+      if (window.Hls && window.Hls.isSupported()) startHls();
+    };
+    document.head.appendChild(script);
+  }
+
   // ========== VIDEO PROCESSING ==========
   if (processBtn) {
     processBtn.addEventListener("click", async () => {
@@ -173,10 +214,25 @@ document.addEventListener("DOMContentLoaded", () => {
         try {
           const response = await fetch("/process-video/", {
             method: "POST",
+            headers: authHeaders,
             body: formData,
           });
-
-          const data = await response.json();
+          if (sessionExpired(response)) return;
+
+          let data = await response.json();
+
+          // Still generating when the request gave up waiting: follow it
+          while (data.status_url && !data.error && !data.video_url) {
+            resultVideo.innerHTML = `<p style="color: #38bdf8;">🎬 Still generating (${data.status})...</p>`;
+            await new Promise((resolve) => setTimeout(resolve, 10000));
+            const statusResponse = await fetch(data.status_url);
+            const status = await statusResponse.json();
+            if (!statusResponse.ok) {
+              data = { error: status.detail || "Generation not found." };
+            } else {
+              data = Object.assign(status, { status_url: data.status_url });
+            }
+          }
 
           if (data.error) {
             resultVideo.innerHTML = `<p style="color: #ef4444;">❌ ${data.error}</p>`;
@@ -207,12 +263,17 @@ document.addEventListener("DOMContentLoaded", () => {
       formData.append("video", file);
       formData.append("prompt", prompt);
       formData.append("user_email", userEmail);
+      if (file.size >= HLS_MIN_UPLOAD_BYTES) {
+        formData.append("delivery", "hls");
+      }
 
       try {
         const response = await fetch("/process-video/", {
           method: "POST",
+          headers: authHeaders,
           body: formData,
         });
+        if (sessionExpired(response)) return;
 
         const data = await response.json();
 
@@ -225,13 +286,21 @@ document.addEventListener("DOMContentLoaded", () => {
               <div class="summary-content">${data.summary}</div>
             </div>
           `;
-        } else if (data.video_url && data.video_url.endsWith(".mp3")) {
+        } else if (data.video_url && (data.video_url.endsWith(".mp3") || data.video_url.endsWith(".m4a"))) {
+          const audioType = data.video_url.endsWith(".m4a") ? "audio/mp4" : "audio/mpeg";
           resultVideo.innerHTML = `
             <p style="color: #22c55e;">✅ Audio extracted successfully!</p>
             <audio controls>
-              <source src="${data.video_url}" type="audio/mpeg">
+              <source src="${data.video_url}" type="${audioType}">
             </audio>
           `;
+        } else if (data.video_url && data.video_url.endsWith(".m3u8")) {
+          resultVideo.innerHTML = `
+            <p style="color: #22c55e;">✅ ${data.streaming ? "Streaming your video while it finishes rendering..." : "Video processed successfully!"}</p>
+            <video controls></video>
+            ${createShareButtons(data.video_url)}
+          `;
+          attachStream(resultVideo.querySelector("video"), data.video_url);
         } else {
           resultVideo.innerHTML = `
             <p style="color: #22c55e;">✅ Video processed successfully!</p>
@@ -414,25 +483,53 @@ document.addEventListener("DOMContentLoaded", () => {
       chatSend.disabled = true;
       chatInput.disabled = true;
 
+      let reply = '';
+      let bubble = null;
       try {
         const response = await fetch('/api/chat', {
           method: 'POST',
-          headers: { 'Content-Type': 'application/json' },
+          headers: { 'Content-Type': 'application/json', 'Accept': 'text/event-stream' },
           body: JSON.stringify({ message: text })
         });
 
-        const data = await response.json();
-
-        // Remove typing indicator
-        chatMessages.removeChild(typingMsg);
-
-        if (data.reply) {
-          appendMessage(data.reply, 'bot');
+        if (!response.body || !(response.headers.get('Content-Type') || '').includes('text/event-stream')) {
+          const data = await response.json();
+          reply = data.reply || '';
         } else {
-          appendMessage('Sorry, I encountered an error answering that.', 'bot');
+          // Server-sent events: show the reply as it is written
+          const reader = response.body.getReader();
+          const decoder = new TextDecoder();
+          let buffer = '';
+          while (true) {
+            const { done, value } = await reader.read();
+            if (done) break;
+            buffer += decoder.decode(value, { stream: true });
+            const events = buffer.split('\n\n');
+            buffer = events.pop();
+            for (const block of events) {
+              const type = (block.match(/^event: (.*)$/m) || [])[1];
+              const data = (block.match(/^data: (.*)$/m) || [])[1];
+              if (type !== 'delta' || !data) continue;
+              reply += JSON.parse(data).text;
+              if (!bubble) {
+                chatMessages.removeChild(typingMsg);
+                bubble = appendMessage('', 'bot').querySelector('.bubble');
+              }
+              bubble.innerHTML = reply.replace(/\n/g, '<br>');
+              chatMessages.scrollTop = chatMessages.scrollHeight;
+            }
+          }
+        }
+
+        if (!bubble) {
+          // Remove typing indicator
+          chatMessages.removeChild(typingMsg);
+          appendMessage(reply || 'Sorry, I encountered an error answering that.', 'bot');
         }
       } catch (err) {
-        chatMessages.removeChild(typingMsg);
+        if (!bubble) {
+          chatMessages.removeChild(typingMsg);
+        }
         appendMessage('Error: Connection failed.', 'bot');
       } finally {
         chatSend.disabled = false;
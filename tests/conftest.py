@@ -0,0 +1,7 @@
+import os
+import sys
+
+# Tests import the app's modules the way main.py does, with the local AI
+# stand-in instead of Gemini (see services/ai_local.py).
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("AI_BACKEND", "local")
@@ -0,0 +1,84 @@
+import os
+
+import pytest
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.testclient import TestClient
+
+from services.delivery import _parse_range, media_response, resolve_media_path
+
+DATA = bytes(range(256)) * 4
+
+
+@pytest.mark.parametrize("header, expected", [
+    ("bytes=0-99", (0, 99)),
+    ("bytes=100-", (100, 1023)),
+    ("bytes=-24", (1000, 1023)),
+    ("bytes=-5000", (0, 1023)),
+    ("bytes=1000-5000", (1000, 1023)),
+    (None, None),
+    ("items=0-10", None),
+    ("bytes=0-1,5-9", None),
+    ("bytes=abc-", None),
+    ("bytes=-0", None),
+])
+def test_parse_range(header, expected):
+    assert _parse_range(header, len(DATA)) == expected
+
+
+@pytest.mark.parametrize("header", ["bytes=1024-", "bytes=50-10"])
+def test_parse_range_unsatisfiable(header):
+    with pytest.raises(HTTPException) as excinfo:
+        _parse_range(header, len(DATA))
+    assert excinfo.value.status_code == 416
+    assert excinfo.value.headers["Content-Range"] == "bytes */1024"
+
+
+@pytest.fixture
+def client(tmp_path):
+    (tmp_path / "clip.mp4").write_bytes(DATA)
+    app = FastAPI()
+
+    @app.api_route("/media/{name}", methods=["GET", "HEAD"])
+    def serve(request: Request, name: str):
+        path = resolve_media_path([str(tmp_path)], name)
+        if path is None:
+            raise HTTPException(status_code=404)
+        return media_response(request, path)
+
+    return TestClient(app)
+
+
+def test_full_and_ranged_responses(client):
+    full = client.get("/media/clip.mp4")
+    assert full.status_code == 200
+    assert full.content == DATA
+    assert full.headers["accept-ranges"] == "bytes"
+
+    part = client.get("/media/clip.mp4", headers={"Range": "bytes=10-19"})
+    assert part.status_code == 206
+    assert part.content == DATA[10:20]
+    assert part.headers["content-range"] == "bytes 10-19/1024"
+    assert part.headers["content-length"] == "10"
+
+
+def test_if_range_and_if_none_match(client):
+    etag = client.head("/media/clip.mp4").headers["etag"]
+    assert client.get("/media/clip.mp4", headers={"Range": "bytes=0-9", "If-Range": etag}).status_code == 206
+    stale = client.get("/media/clip.mp4", headers={"Range": "bytes=0-9", "If-Range": '"old"'})
+    assert stale.status_code == 200
+    assert stale.content == DATA
+    assert client.get("/media/clip.mp4", headers={"If-None-Match": etag}).status_code == 304
+
+
+def test_unsatisfiable_range(client):
+    response = client.get("/media/clip.mp4", headers={"Range": "bytes=2000-"})
+    assert response.status_code == 416
+    assert response.headers["content-range"] == "bytes */1024"
+
+
+def test_resolve_refuses_paths_outside_roots(tmp_path):
+    root = tmp_path / "outputs"
+    root.mkdir()
+    (tmp_path / "secret.txt").write_text("x")
+    assert resolve_media_path([str(root)], os.path.join("..", "secret.txt")) is None
+    assert resolve_media_path([str(root)], "missing.mp4") is None
@@ -0,0 +1,38 @@
+import pytest
+
+from services.encoding import splice_video_args
+
+
+def option(args, name):
+    return args[args.index(name) + 1]
+
+
+def test_splice_matches_h264_source():
+    stream = {
+        "codec_name": "h264", "profile": "Main", "level": 31, "pix_fmt": "yuv420p",
+        "color_primaries": "bt709", "color_space": "unknown",
+    }
+    args = splice_video_args(stream, "standard")
+    assert option(args, "-c:v") == "libx264"
+    assert option(args, "-profile:v") == "main"
+    assert option(args, "-level:v") == "3.1"
+    assert option(args, "-pix_fmt") == "yuv420p"
+    assert option(args, "-color_primaries") == "bt709"
+    assert "-colorspace" not in args
+
+
+def test_splice_matches_hevc_level():
+    stream = {"codec_name": "hevc", "profile": "Main 10", "level": 93, "pix_fmt": "yuv420p10le"}
+    args = splice_video_args(stream)
+    assert option(args, "-profile:v") == "main10"
+    assert option(args, "-x265-params") == "level-idc=3.1"
+
+
+@pytest.mark.parametrize("stream", [
+    {"codec_name": "h264", "profile": "High 4:4:4 Intra", "level": 40, "pix_fmt": "yuv444p"},
+    {"codec_name": "h264", "profile": "High", "level": -99, "pix_fmt": "yuv420p"},
+    {"codec_name": "vp9", "profile": "Profile 0", "level": -99, "pix_fmt": "yuv420p"},
+])
+def test_splice_rejects_unmatched_source(stream):
+    with pytest.raises(ValueError):
+        splice_video_args(stream)
@@ -0,0 +1,70 @@
+from collections import OrderedDict
+from types import SimpleNamespace
+
+import pytest
+
+from services import faq
+
+
+@pytest.fixture(autouse=True)
+def empty_cache(monkeypatch):
+    monkeypatch.setattr(faq, "_cache", OrderedDict())
+
+
+@pytest.mark.parametrize("question, expected", [
+    ("How do I add captions?", "add captions"),
+    ("can I add Spanish subtitles to my video", "add captions"),
+    ("How can I remove the background?", "\"remove background\""),
+    ("how do i remove background noise", "background noise"),
+    ("How to make a video vertical for TikTok?", "make it vertical"),
+])
+def test_how_to_questions_match(question, expected):
+    assert expected in faq.match(question)
+
+
+@pytest.mark.parametrize("question", [
+    "How can I add background music?",
+    "Why are my captions out of sync?",
+    "captions",
+    "How do I add captions? My video is a long interview with several people talking at once",
+    "how much does the pro plan cost for captions",
+])
+def test_other_questions_go_to_the_model(question):
+    assert faq.match(question) is None
+
+
+def test_faq_switch(monkeypatch):
+    monkeypatch.setattr(faq, "CHAT_FAQ", False)
+    assert faq.match("How do I add captions?") is None
+
+
+def test_normalize_ignores_case_punctuation_and_filler():
+    assert faq.normalize("Hi! How do I export in 4K, please?") == faq.normalize("how export 4k")
+
+
+def test_answer_cache_hit_and_ttl(monkeypatch):
+    clock = [100.0]
+    monkeypatch.setattr(faq, "time", SimpleNamespace(monotonic=lambda: clock[0]))
+    faq.remember("What formats are supported?", "MP4 and MOV.")
+    assert faq.lookup("what formats are supported") == ("MP4 and MOV.", "cache")
+
+    clock[0] += faq.CHAT_CACHE_TTL + 1
+    assert faq.lookup("What formats are supported?") == (None, None)
+    assert len(faq._cache) == 0
+
+
+def test_answer_cache_evicts_least_recent(monkeypatch):
+    monkeypatch.setattr(faq, "CHAT_CACHE_SIZE", 2)
+    faq.remember("first question", "1")
+    faq.remember("second question", "2")
+    assert faq.cached("first question") == "1"
+    faq.remember("third question", "3")
+    assert faq.cached("second question") is None
+    assert faq.cached("first question") == "1"
+
+
+def test_faq_answers_before_cache():
+    faq.remember("How do I add captions?", "stale model answer")
+    answer, source = faq.lookup("How do I add captions?")
+    assert source == "faq"
+    assert answer != "stale model answer"
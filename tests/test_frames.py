@@ -0,0 +1,72 @@
+import random
+import time
+
+import pytest
+
+from services.frames import process_frames
+
+
+class FakeCapture:
+    def __init__(self, count, fail_at=None):
+        self.frames = list(range(count))
+        self.fail_at = fail_at
+
+    def read(self):
+        if not self.frames:
+            return False, None
+        frame = self.frames.pop(0)
+        if frame == self.fail_at:
+            raise IOError("decode failed")
+        return True, frame
+
+
+class FakeWriter:
+    def __init__(self):
+        self.written = []
+
+    def write(self, frame):
+        self.written.append(frame)
+
+
+def slow_double(frame):
+    # Later frames often finish first
+    time.sleep(random.uniform(0, 0.003))
+    return frame * 2
+
+
+def test_writes_in_source_order():
+    writer = FakeWriter()
+    written = process_frames(FakeCapture(200), writer, slow_double, workers=8, max_pending=4)
+    assert written == 200
+    assert writer.written == [i * 2 for i in range(200)]
+
+
+def test_reports_progress_per_frame():
+    progress = []
+    process_frames(FakeCapture(10), FakeWriter(), slow_double, workers=2, on_progress=progress.append)
+    assert progress == list(range(1, 11))
+
+
+def test_empty_input():
+    writer = FakeWriter()
+    assert process_frames(FakeCapture(0), writer, slow_double, workers=2) == 0
+    assert writer.written == []
+
+
+def test_frame_error_propagates():
+    def fail(frame):
+        if frame == 5:
+            raise ValueError("bad frame")
+        return frame
+
+    writer = FakeWriter()
+    with pytest.raises(ValueError):
+        process_frames(FakeCapture(50), writer, fail, workers=4, max_pending=2)
+    assert writer.written == list(range(5))
+
+
+def test_reader_error_propagates():
+    writer = FakeWriter()
+    with pytest.raises(IOError):
+        process_frames(FakeCapture(20, fail_at=7), writer, slow_double, workers=2)
+    assert writer.written == [i * 2 for i in range(7)]
@@ -0,0 +1,56 @@
+from functools import partial
+
+import pytest
+
+from services import planner
+from services.video import add_captions, adjust_speed, extract_audio, remove_background, remove_noise, remove_watermark, resize_to_vertical, trim_video
+
+STATE = planner.describe(duration=60, width=1920, height=1080)
+
+
+def names(operations):
+    return [planner._name(op) for op in operations]
+
+
+def test_speed_and_crop_move_ahead_of_background_removal():
+    operations = [remove_background, resize_to_vertical, partial(adjust_speed, speed=2.0)]
+    plan, report = planner.optimize(operations, STATE)
+    assert names(plan)[-1] == "remove_background"
+    assert report["requested"] == ["remove_background", "resize_to_vertical", "adjust_speed"]
+    assert report["estimated_cost"] < report["requested_cost"]
+    assert report["steps"][2]["input_seconds"] == 30.0
+    assert report["steps"][2]["input_size"] == [607, 1080]
+
+
+def test_only_commuting_pairs_move():
+    # Watermark positions are relative to the uncropped frame; captions
+    # depend on the timeline
+    for operations in ([remove_watermark, resize_to_vertical], [add_captions, partial(adjust_speed, speed=2.0)]):
+        plan, _ = planner.optimize(operations, STATE)
+        assert names(plan) == names(operations)
+
+
+def test_commuting_is_symmetric_and_covers_known_pairs():
+    assert planner._commutes(remove_noise, resize_to_vertical)
+    assert planner._commutes(resize_to_vertical, remove_noise)
+    assert not planner._commutes(trim_video, remove_background)
+
+
+def test_visual_steps_before_extract_audio_are_dropped():
+    plan, report = planner.optimize([remove_background, add_captions, remove_noise, extract_audio], STATE)
+    assert names(plan) == ["remove_noise", "extract_audio"]
+    assert report["dropped"] == ["remove_background", "add_captions"]
+
+
+def test_optimizer_switch(monkeypatch):
+    monkeypatch.setattr(planner, "PLAN_OPTIMIZER", False)
+    operations = [remove_background, partial(adjust_speed, speed=2.0)]
+    plan, report = planner.optimize(operations, STATE)
+    assert plan == operations
+    assert report["estimated_cost"] == report["requested_cost"]
+
+
+def test_estimate_follows_the_timeline():
+    _, steps = planner.estimate([partial(trim_video, start_trim=10, end_trim=20), extract_audio], STATE)
+    assert steps[1]["input_seconds"] == 30.0
+    assert planner.op_cost(partial(remove_watermark, strategy="blur"), STATE) == pytest.approx(60 * 1920 * 1080 / 1e6)
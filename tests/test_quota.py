@@ -0,0 +1,66 @@
+import json
+import time
+
+import pytest
+
+from services import quota
+
+
+@pytest.fixture(autouse=True)
+def store(tmp_path, monkeypatch):
+    monkeypatch.setattr(quota, "QUOTA_PATH", str(tmp_path / "quota.json"))
+    monkeypatch.setattr(quota, "QUOTA_DAILY_SECONDS", 30.0)
+    monkeypatch.setattr(quota, "QUOTA_USER_DAILY_SECONDS", 0.0)
+    monkeypatch.setattr(quota, "QUOTA_RESERVATION_TTL", 7200.0)
+
+
+def test_reserve_commit_release():
+    first, granted = quota.reserve(15)
+    assert granted == 15
+    second, _ = quota.reserve(8)
+    assert quota.usage() == {"used": 0, "reserved": 23, "limit": 30.0}
+
+    quota.commit(first, 8)
+    assert quota.usage() == {"used": 8, "reserved": 8, "limit": 30.0}
+    quota.release(second)
+    assert quota.usage() == {"used": 8, "reserved": 0, "limit": 30.0}
+
+
+def test_partial_grant_down_to_minimum():
+    quota.reserve(20)
+    _, granted = quota.reserve(15, minimum=8)
+    assert granted == 10
+    with pytest.raises(quota.QuotaExceeded):
+        quota.reserve(8)
+
+
+def test_per_user_budget(monkeypatch):
+    monkeypatch.setattr(quota, "QUOTA_USER_DAILY_SECONDS", 10.0)
+    reservation, granted = quota.reserve(15, user="a@b.c", minimum=8)
+    assert granted == 10
+    with pytest.raises(quota.QuotaExceeded, match="your"):
+        quota.reserve(8, user="a@b.c")
+    quota.reserve(8, user="d@e.f")
+
+    quota.commit(reservation, 8)
+    assert quota.usage("a@b.c") == {"used": 8, "reserved": 0, "limit": 10.0}
+
+
+def test_expired_reservations_are_dropped():
+    stale, _ = quota.reserve(25)
+    with open(quota.QUOTA_PATH, encoding="utf-8") as f:
+        state = json.load(f)
+    state["reservations"][stale]["at"] = time.time() - 7201
+    with open(quota.QUOTA_PATH, "w", encoding="utf-8") as f:
+        json.dump(state, f)
+
+    _, granted = quota.reserve(20)
+    assert granted == 20
+    assert quota.usage()["reserved"] == 20
+
+
+def test_new_day_resets_usage_and_reads_old_format():
+    with open(quota.QUOTA_PATH, "w", encoding="utf-8") as f:
+        json.dump({"date": "2000-01-01", "seconds_used": 30}, f)
+    assert quota.usage() == {"used": 0, "reserved": 0, "limit": 30.0}
+    quota.reserve(30)
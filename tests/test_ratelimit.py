@@ -0,0 +1,159 @@
+import threading
+import time
+from types import SimpleNamespace
+
+import pytest
+
+from services import ratelimit
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+        self.slept = []
+
+    def monotonic(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.slept.append(seconds)
+        self.now += seconds
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(ratelimit, "time", SimpleNamespace(monotonic=clock.monotonic, sleep=clock.sleep))
+    return clock
+
+
+@pytest.fixture(autouse=True)
+def fresh_state(monkeypatch):
+    monkeypatch.setattr(ratelimit, "_buckets", {})
+    monkeypatch.setattr(ratelimit, "_breakers", {})
+    monkeypatch.setattr(ratelimit, "_inflight", {})
+
+
+def test_token_bucket_burst_then_waits(clock):
+    bucket = ratelimit.TokenBucket(rate_per_minute=60, burst=2)
+    assert bucket.acquire() == 0.0
+    assert bucket.acquire() == 0.0
+    assert bucket.acquire() == pytest.approx(1.0)
+    assert clock.slept == [pytest.approx(1.0)]
+
+
+def test_token_bucket_fails_fast_past_max_wait(clock):
+    bucket = ratelimit.TokenBucket(rate_per_minute=6, burst=1)
+    bucket.acquire()
+    with pytest.raises(ratelimit.RateLimited) as excinfo:
+        bucket.acquire(max_wait=2)
+    assert excinfo.value.retry_after == pytest.approx(10.0)
+    # The refused token was given back
+    clock.now += 10
+    assert bucket.acquire(max_wait=0) == 0.0
+
+
+def test_breaker_opens_and_half_opens(clock, monkeypatch):
+    monkeypatch.setattr(ratelimit, "GEMINI_BREAKER_THRESHOLD", 2)
+    monkeypatch.setattr(ratelimit, "GEMINI_BREAKER_COOLDOWN", 30.0)
+    guard = ratelimit.CircuitBreaker("m")
+
+    guard.record_failure(Exception("400 INVALID_ARGUMENT"))
+    guard.record_failure(Exception("429 RESOURCE_EXHAUSTED"))
+    assert guard.allow()
+    guard.record_failure(Exception("503 UNAVAILABLE"))
+    assert not guard.allow()
+    assert guard.retry_in() == pytest.approx(30.0)
+
+    clock.now += 30
+    assert guard.allow()
+    # Only one trial call while half-open
+    assert not guard.allow()
+    guard.record_failure(Exception("429"))
+    assert not guard.allow()
+
+    clock.now += 30
+    assert guard.allow()
+    guard.record_success()
+    assert guard.allow() and guard.allow()
+
+
+def test_generate_falls_back_on_overload(clock, monkeypatch):
+    monkeypatch.setattr(ratelimit, "FALLBACK_MODELS", {"main": ["lite"]})
+    calls = []
+
+    def generate_content(model, **kwargs):
+        calls.append(model)
+        if model == "main":
+            raise Exception("429 RESOURCE_EXHAUSTED")
+        return f"answer from {model}"
+
+    client = SimpleNamespace(models=SimpleNamespace(generate_content=generate_content))
+    assert ratelimit.generate(client, "main", contents="hi") == "answer from lite"
+    assert calls == ["main", "lite"]
+
+
+def test_generate_fails_fast_while_circuit_open(clock, monkeypatch):
+    monkeypatch.setattr(ratelimit, "FALLBACK_MODELS", {})
+    ratelimit.breaker("main").open_until = clock.now + 10
+    with pytest.raises(ratelimit.CircuitOpen):
+        ratelimit.generate(SimpleNamespace(), "main")
+
+
+def test_single_flight_shares_one_call():
+    started = threading.Event()
+    release = threading.Event()
+    calls = []
+
+    def slow():
+        calls.append(1)
+        started.set()
+        release.wait(5)
+        return {"text": "done"}
+
+    results = []
+    coalesced = ratelimit.COALESCED._key({"kind": "shared"})
+    before = ratelimit.COALESCED._values.get(coalesced, 0)
+
+    def call():
+        results.append(ratelimit.single_flight("k", slow, kind="shared"))
+
+    leader = threading.Thread(target=call)
+    leader.start()
+    started.wait(5)
+    followers = [threading.Thread(target=call) for _ in range(3)]
+    for t in followers:
+        t.start()
+    deadline = time.monotonic() + 5
+    while ratelimit.COALESCED._values.get(coalesced, 0) - before < 3 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    release.set()
+    for t in [leader] + followers:
+        t.join(5)
+
+    assert calls == [1]
+    assert results == [{"text": "done"}] * 4
+    # A finished key runs again
+    release.set()
+    ratelimit.single_flight("k", slow)
+    assert calls == [1, 1]
+
+
+def test_single_flight_shares_errors():
+    def fail():
+        raise ValueError("boom")
+
+    with pytest.raises(ValueError):
+        ratelimit.single_flight("k", fail)
+
+
+def test_request_key_follows_media_content(tmp_path):
+    media = tmp_path / "a.mp4"
+    media.write_bytes(b"x" * 10)
+    key = ratelimit.request_key("srt", str(media), "prompt")
+    assert key == ratelimit.request_key("srt", str(media), "prompt")
+    assert key != ratelimit.request_key("srt", str(media), "other prompt")
+    media.write_bytes(b"y" * 10)
+    assert key != ratelimit.request_key("srt", str(media), "prompt")
+    with pytest.raises(OSError):
+        ratelimit.request_key("srt", str(tmp_path / "missing.mp4"))
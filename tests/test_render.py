@@ -0,0 +1,93 @@
+from functools import partial
+
+from services import render
+from services.render import _bind_chunk, _clip_intervals, _partition, _slice_srt, input_analyses, op_name
+from services.video import add_captions, adjust_speed, extract_audio, remove_background, remove_noise, remove_silence, resize_to_vertical, trim_video
+
+SRT = """1
+00:00:01,000 --> 00:00:04,000
+First
+
+2
+00:00:09,500 --> 00:00:12,250
+Second
+
+3
+00:00:20,000 --> 00:00:21,000
+Third
+"""
+
+
+def names(operations):
+    return [op_name(op) for op in operations]
+
+
+def test_partition_head_body_tail():
+    head, body, tail = _partition([trim_video, resize_to_vertical, add_captions, extract_audio])
+    assert names(head) == ["trim_video"]
+    assert names(body) == ["resize_to_vertical", "add_captions"]
+    assert names(tail) == ["extract_audio"]
+
+
+def test_partition_ends_body_at_context_op_after_retiming():
+    head, body, tail = _partition([adjust_speed, add_captions])
+    assert head == []
+    assert names(body) == ["adjust_speed"]
+    assert names(tail) == ["add_captions"]
+
+
+def test_partition_nothing_segmentable():
+    head, body, tail = _partition([trim_video, extract_audio])
+    assert names(head) == ["trim_video", "extract_audio"]
+    assert body == [] and tail == []
+
+
+def test_clip_intervals():
+    intervals = [(0.0, 2.0), (5.0, 12.0), (15.0, 16.0), (30.0, 31.0)]
+    assert _clip_intervals(intervals, 10.0, 20.0) == [(0.0, 2.0), (5.0, 6.0)]
+    assert _clip_intervals(intervals, 2.0, 5.0) == []
+
+
+def test_slice_srt_retimes_and_reindexes():
+    assert _slice_srt(SRT, 10.0, 25.0) == (
+        "1\n00:00:00,000 --> 00:00:02,250\nSecond\n\n"
+        "2\n00:00:10,000 --> 00:00:11,000\nThird\n"
+    )
+
+
+def test_slice_srt_without_cues():
+    assert _slice_srt(SRT, 4.0, 9.5) == ""
+
+
+def test_bind_chunk_binds_context_slices():
+    operations = [partial(remove_silence), partial(add_captions), partial(remove_background)]
+    context = {0: [(12.0, 14.0)], 1: SRT}
+    bound = _bind_chunk(operations, context, 10.0, 20.0, frame_workers=3)
+    assert bound[0].keywords["silences"] == [(2.0, 4.0)]
+    assert bound[1].keywords["srt_content"].startswith("1\n00:00:00,000 --> 00:00:02,250")
+    assert bound[2].keywords["workers"] == 3
+
+
+def test_bind_chunk_keeps_silence_free_chunks_reencoding():
+    bound = _bind_chunk([partial(remove_silence)], {0: [(50.0, 51.0)]}, 10.0, 20.0, frame_workers=1)
+    assert bound[0].keywords["silences"] == [(0.0, 0.0)]
+
+
+def test_bind_chunk_drops_all_silent_chunk():
+    assert _bind_chunk([partial(remove_silence)], {0: [(5.0, 25.0)]}, 10.0, 20.0, frame_workers=1) is None
+
+
+def test_input_analyses():
+    # Captions after a crop still transcribe the chain input; after a retiming
+    # or audio step they transcribe an intermediate
+    assert input_analyses([resize_to_vertical, add_captions]) == {"add_captions"}
+    assert input_analyses([trim_video, add_captions]) == set()
+    assert input_analyses([remove_noise, add_captions]) == {"remove_noise"}
+    assert input_analyses([add_captions, partial(adjust_speed, speed=2.0)]) == {"add_captions"}
+    assert input_analyses([partial(add_captions, srt_content="")]) == set()
+
+
+def test_input_analyses_without_dag(monkeypatch):
+    monkeypatch.setattr(render, "DAG_RENDER", False)
+    assert input_analyses([resize_to_vertical, add_captions]) == set()
+    assert input_analyses([add_captions, resize_to_vertical]) == {"add_captions"}
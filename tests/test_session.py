@@ -0,0 +1,61 @@
+import os
+import time
+from types import SimpleNamespace
+
+import pytest
+
+from services import session
+
+
+@pytest.fixture(autouse=True)
+def key(tmp_path, monkeypatch):
+    monkeypatch.delenv("SESSION_SECRET", raising=False)
+    monkeypatch.setattr(session, "SESSION_SECRET_PATH", str(tmp_path / "secret"))
+    monkeypatch.setattr(session, "_secret", None)
+
+
+def test_issue_and_verify():
+    token = session.issue("a@b.c")
+    assert session.verify(token) == "a@b.c"
+
+
+@pytest.mark.parametrize("token", [None, "", "abc", "a.b.c", "!!!.???"])
+def test_malformed_tokens(token):
+    assert session.verify(token) is None
+
+
+def test_forged_tokens():
+    payload, signature = session.issue("a@b.c").split(".")
+    other_payload, _ = session.issue("admin@b.c").split(".")
+    assert session.verify(f"{other_payload}.{signature}") is None
+    assert session.verify(f"{payload}.{signature[:-2]}AA") is None
+
+
+def test_expired_token(monkeypatch):
+    token = session.issue("a@b.c", ttl=60)
+    now = time.time()
+    monkeypatch.setattr(session, "time", SimpleNamespace(time=lambda: now + 61, sleep=time.sleep))
+    assert session.verify(token) is None
+
+
+def test_key_is_stored_for_other_workers(monkeypatch):
+    token = session.issue("a@b.c")
+    assert os.path.exists(session.SESSION_SECRET_PATH)
+    # A fresh process reads the same key back
+    monkeypatch.setattr(session, "_secret", None)
+    assert session.verify(token) == "a@b.c"
+
+
+def test_configured_secret(monkeypatch):
+    token = session.issue("a@b.c")
+    monkeypatch.setenv("SESSION_SECRET", "configured")
+    monkeypatch.setattr(session, "_secret", None)
+    assert session.verify(token) is None
+    assert session.verify(session.issue("a@b.c")) == "a@b.c"
+
+
+def test_from_header():
+    assert session.from_header("Bearer abc.def") == "abc.def"
+    assert session.from_header("bearer  abc.def ") == "abc.def"
+    assert session.from_header("Basic abc") is None
+    assert session.from_header(None) is None
@@ -0,0 +1,113 @@
+import json
+import time
+
+import pytest
+
+from services import ai_service, quota, veo_tracker
+
+
+class FakeVeo:
+    def __init__(self):
+        self.polls = {}
+        self.started = []
+
+    def start(self, prompt, model, video_uri=None, fallback=True):
+        name = f"operations/{len(self.started)}"
+        self.started.append(video_uri)
+        return name, model
+
+    def poll(self, operation_name):
+        return self.polls.get(operation_name, (False, None, None))
+
+    def download(self, video_uri, dest_path):
+        with open(dest_path, "wb") as f:
+            f.write(b"video")
+
+
+@pytest.fixture
+def veo(tmp_path, monkeypatch):
+    fake = FakeVeo()
+    monkeypatch.setattr(veo_tracker, "VEO_STATE_PATH", str(tmp_path / "veo.json"))
+    monkeypatch.setattr(quota, "QUOTA_PATH", str(tmp_path / "quota.json"))
+    monkeypatch.setattr(quota, "QUOTA_DAILY_SECONDS", 30.0)
+    monkeypatch.setattr(ai_service, "start_veo", fake.start)
+    monkeypatch.setattr(ai_service, "poll_veo", fake.poll)
+    monkeypatch.setattr(ai_service, "download_veo", fake.download)
+    monkeypatch.setattr(veo_tracker, "ensure_faststart", lambda path: path)
+    return fake
+
+
+def set_record(generation_id, **changes):
+    with open(veo_tracker.VEO_STATE_PATH, encoding="utf-8") as f:
+        records = json.load(f)
+    records[generation_id].update(changes)
+    with open(veo_tracker.VEO_STATE_PATH, "w", encoding="utf-8") as f:
+        json.dump(records, f)
+
+
+def test_generation_runs_to_done(veo, tmp_path):
+    output = str(tmp_path / "out.mp4")
+    generation_id = veo_tracker.submit("a beach", output, "veo", duration=8)
+    assert veo_tracker.get(generation_id)["status"] == "generating"
+    assert quota.usage()["reserved"] == 8
+    assert veo_tracker.job_for(output) == generation_id
+
+    assert veo_tracker.advance(generation_id)["status"] == "generating"
+    veo.polls["operations/0"] = (True, "uri-0", None)
+    assert veo_tracker.advance(generation_id)["status"] == "downloading"
+    assert veo_tracker.advance(generation_id)["status"] == "done"
+    assert open(output, "rb").read() == b"video"
+    assert quota.usage() == {"used": 8, "reserved": 0, "limit": 30.0}
+
+
+def test_extensions_up_to_target(veo, tmp_path):
+    generation_id = veo_tracker.submit("a beach", str(tmp_path / "out.mp4"), "veo", duration=15)
+    veo.polls["operations/0"] = (True, "uri-0", None)
+    record = veo_tracker.advance(generation_id)
+    assert record["status"] == "extending"
+    assert veo.started == [None, "uri-0"]
+
+    veo.polls["operations/1"] = (True, "uri-1", None)
+    record = veo_tracker.advance(generation_id)
+    assert record["status"] == "downloading"
+    assert record["current_duration"] == 15
+    assert record["video_uri"] == "uri-1"
+
+
+def test_lease_blocks_other_workers_until_it_expires(veo, tmp_path, monkeypatch):
+    generation_id = veo_tracker.submit("a beach", str(tmp_path / "out.mp4"), "veo")
+    first = veo_tracker._worker_id()
+
+    monkeypatch.setattr(veo_tracker, "_worker_id", lambda: "other:1")
+    assert veo_tracker.pending_ids() == []
+    record, claimed = veo_tracker._claim(generation_id)
+    assert not claimed and record["owner"] == first
+
+    set_record(generation_id, lease_until=time.time() - 1)
+    assert veo_tracker.pending_ids() == [generation_id]
+    record, claimed = veo_tracker._claim(generation_id)
+    assert claimed and record["owner"] == "other:1"
+
+    # The previous owner's late update is dropped
+    monkeypatch.setattr(veo_tracker, "_worker_id", lambda: first)
+    assert veo_tracker._update(generation_id, status="done") is None
+    assert veo_tracker.get(generation_id)["status"] == "generating"
+
+
+def test_failure_releases_quota_and_refunds_attached_trial(veo, tmp_path, monkeypatch):
+    refunds = []
+    monkeypatch.setattr(veo_tracker, "get_db", lambda: "db")
+    monkeypatch.setattr(veo_tracker.accounts, "refund_trial", lambda db, email: refunds.append(email))
+
+    generation_id = veo_tracker.submit("a beach", str(tmp_path / "out.mp4"), "veo")
+    assert veo_tracker.attach_trial(generation_id, "a@b.c")
+    veo.polls["operations/0"] = (True, None, "INVALID_ARGUMENT")
+    record = veo_tracker.advance(generation_id)
+
+    assert record["status"] == "error"
+    assert refunds == ["a@b.c"]
+    assert quota.usage()["reserved"] == 0
+    # Too late to hand over: the caller refunds
+    assert not veo_tracker.attach_trial(generation_id, "a@b.c")
+    with pytest.raises(Exception):
+        veo_tracker.complete(generation_id)
@@ -0,0 +1,104 @@
+import os
+
+import pytest
+from pymongo.errors import AutoReconnect, BulkWriteError
+
+from services import writebehind
+
+
+class FakeCollection:
+    def __init__(self):
+        self.docs = []
+        self.updates = []
+        self.fail = None
+
+    def insert_many(self, docs, ordered=True):
+        if self.fail:
+            raise self.fail
+        self.docs.extend(docs)
+
+    def bulk_write(self, operations, ordered=True):
+        if self.fail:
+            raise self.fail
+        self.updates.extend((op._filter, op._doc) for op in operations)
+
+
+class FakeDB(dict):
+    def __missing__(self, name):
+        self[name] = FakeCollection()
+        return self[name]
+
+
+@pytest.fixture
+def db(tmp_path, monkeypatch):
+    db = FakeDB()
+    monkeypatch.setattr(writebehind, "WRITEBEHIND", True)
+    monkeypatch.setattr(writebehind, "WRITEBEHIND_SPILL_PATH", str(tmp_path / "spill.jsonl"))
+    monkeypatch.setattr(writebehind, "get_db", lambda: db)
+    # Flushed by hand; no background thread
+    monkeypatch.setattr(writebehind, "start", lambda: None)
+    monkeypatch.setattr(writebehind, "_inserts", [])
+    monkeypatch.setattr(writebehind, "_counters", {})
+    return db
+
+
+def test_flush_batches_inserts_and_coalesces_counters(db):
+    writebehind.insert("feedback", {"text": "a"})
+    writebehind.insert("feedback", {"text": "b"})
+    for _ in range(3):
+        writebehind.increment("users", {"email": "a@b.c"}, "jobs_run")
+    writebehind.increment("users", {"email": "d@e.f"}, "jobs_run", 2)
+    writebehind.flush()
+
+    assert [d["text"] for d in db["feedback"].docs] == ["a", "b"]
+    assert all("_id" in d for d in db["feedback"].docs)
+    assert sorted(db["users"].updates, key=str) == [
+        ({"email": "a@b.c"}, {"$inc": {"jobs_run": 3}}),
+        ({"email": "d@e.f"}, {"$inc": {"jobs_run": 2}}),
+    ]
+    assert writebehind._queued() == 0
+
+
+def test_spills_while_unreachable_and_replays(db, monkeypatch):
+    monkeypatch.setattr(writebehind, "get_db", lambda: None)
+    writebehind.insert("feedback", {"text": "a"})
+    writebehind.increment("users", {"email": "a@b.c"}, "jobs_run")
+    writebehind.flush()
+    assert os.path.exists(writebehind.WRITEBEHIND_SPILL_PATH)
+
+    monkeypatch.setattr(writebehind, "get_db", lambda: db)
+    writebehind.insert("feedback", {"text": "b"})
+    writebehind.flush()
+
+    assert [d["text"] for d in db["feedback"].docs] == ["a", "b"]
+    assert db["users"].updates == [({"email": "a@b.c"}, {"$inc": {"jobs_run": 1}})]
+    assert not os.path.exists(writebehind.WRITEBEHIND_SPILL_PATH)
+    assert not os.path.exists(writebehind._replay_path())
+
+
+def test_failed_collection_is_spilled_alone(db):
+    db["feedback"].fail = AutoReconnect("down")
+    writebehind.insert("feedback", {"text": "a"})
+    writebehind.increment("users", {"email": "a@b.c"}, "jobs_run")
+    writebehind.flush()
+    assert db["users"].updates
+
+    db["feedback"].fail = None
+    writebehind.flush()
+    assert [d["text"] for d in db["feedback"].docs] == ["a"]
+    assert len(db["users"].updates) == 1
+
+
+def test_duplicate_inserts_are_not_retried(db):
+    writebehind.insert("feedback", {"text": "a"})
+    db["feedback"].fail = BulkWriteError({"writeErrors": [{"index": 0, "code": writebehind.DUPLICATE_KEY}]})
+    writebehind.flush()
+    assert not os.path.exists(writebehind.WRITEBEHIND_SPILL_PATH)
+
+
+def test_leftover_replay_file_is_retried(db):
+    writebehind._spill([{"op": "insert", "collection": "feedback", "doc": {"text": "crashed"}}])
+    os.replace(writebehind.WRITEBEHIND_SPILL_PATH, writebehind._replay_path())
+    writebehind.flush()
+    assert [d["text"] for d in db["feedback"].docs] == ["crashed"]
+    assert not os.path.exists(writebehind._replay_path())